@@ -7,13 +7,39 @@ from datetime import datetime
 from io import BytesIO
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 import plotly.express as px
+import plotly.io as pio
+import functools
 import math
+import os
+import uuid
+
+import cube as summary_cube
+import perf
+from charts import CHART_POINTS
+from backend import BackendError, create_backend, fetch_concurrently, identify
+from cache import CachedBackend, ResponseCache
+from export import EXPORT_FORMATS
+from grid import BLOCK_SIZE as GRID_BLOCK_SIZE, query_key, render_virtual_grid
+from index import SEARCH_MAX_MATCHES, parse_orderids
+from jobs import FINISHED as JOB_FINISHED
+from matching import DEFAULT_MATCHING
+from upload import format_bytes, format_throughput
 
 # ---------------------- Configuration ---------------------- #
 
 # Replace with your FastAPI backend URL
 API_BASE_URL = 'https://api.demopython.in/'  # Update this if your backend is hosted elsewhere
 
+# 'http' talks to the FastAPI backend above, 'local' runs the reconciliation in-process
+BACKEND_MODE = os.environ.get('BACKEND_MODE', 'http')
+
+# Seconds between progress polls while a processing job runs
+JOB_POLL_INTERVAL = 1.0
+
+# Request header an authenticating proxy in front of the app sets to the signed-in user,
+# e.g. X-Forwarded-Email; used when Streamlit's own authentication is not configured
+USER_HEADER = os.environ.get('USER_HEADER')
+
 # Set Streamlit page configuration
 st.set_page_config(
     page_title="Excel Comparison Tool",
@@ -77,6 +103,13 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ---------------------- Backend ---------------------- #
+@st.cache_resource
+def get_backend():
+    # Shared by every rerun and browser session so the local engine keeps its sessions
+    return create_backend(BACKEND_MODE, API_BASE_URL)
+
+
 # ---------------------- Initialize Session State ---------------------- #
 if 'session_id' not in st.session_state:
     st.session_state['session_id'] = None
@@ -84,55 +117,244 @@ if 'date_ranges' not in st.session_state:
     st.session_state['date_ranges'] = None
 if 'data_processed' not in st.session_state:
     st.session_state['data_processed'] = False
-# Initialize pagination states for API, Dashboard, Amount Differences, and Status Differences
-if 'api_pagination' not in st.session_state:
-    st.session_state['api_pagination'] = {'page': 1, 'page_size': 10}
-if 'dashboard_pagination' not in st.session_state:
-    st.session_state['dashboard_pagination'] = {'page': 1, 'page_size': 10}
-if 'amount_diff_pagination' not in st.session_state:
-    st.session_state['amount_diff_pagination'] = {'page': 1, 'page_size': 10}
-if 'status_diff_pagination' not in st.session_state:
-    st.session_state['status_diff_pagination'] = {'page': 1, 'page_size': 10}
+# Upload IDs of interrupted resumable uploads, keyed by field, file name and size
+if 'resumable_uploads' not in st.session_state:
+    st.session_state['resumable_uploads'] = {}
+# Initialize scroll states (block in view) for API, Dashboard, Amount Differences, and Status Differences
+TABLE_STATE_KEYS = ['api_pagination', 'dashboard_pagination', 'amount_diff_pagination', 'status_diff_pagination']
+for table_state_key in TABLE_STATE_KEYS:
+    if table_state_key not in st.session_state:
+        st.session_state[table_state_key] = {'block': 1}
+# What the last upload sent, and the send rate used to estimate the time compression and dedup saved
+if 'upload_transfer' not in st.session_state:
+    st.session_state['upload_transfer'] = None
+if 'upload_throughput' not in st.session_state:
+    st.session_state['upload_throughput'] = None
+# Background processing job being followed (last snapshot), if any
+if 'process_job' not in st.session_state:
+    st.session_state['process_job'] = None
+# Per-user response cache; cleared by Process Data and End Session
+if 'response_cache' not in st.session_state:
+    st.session_state['response_cache'] = ResponseCache()
+# Set while viewing a session someone shared: its results can be read but not changed
+if 'read_only' not in st.session_state:
+    st.session_state['read_only'] = False
+
+backend = CachedBackend(get_backend(), st.session_state['response_cache'])
+
+
+def client_identity():
+    # Who uploaded files and processing jobs belong to: the signed-in user, else this
+    # browser session (anonymous users cannot be told apart across browser tabs)
+    if st.user.get('is_logged_in'):
+        return st.user.get('email') or st.user.get('sub')
+    if USER_HEADER and st.context.headers.get(USER_HEADER):
+        return st.context.headers.get(USER_HEADER)
+    if 'client_id' not in st.session_state:
+        st.session_state['client_id'] = uuid.uuid4().hex
+    return st.session_state['client_id']
+
+
+# Set on every rerun, like the perf run below: the backend is shared by every browser session
+identify(client_identity())
+
+# ---------------------- Shared Session Links ---------------------- #
+# ?share=<token> attaches to a session another user processed, without uploading
+# or processing anything; the token stands in for the session ID from then on
+share_token = st.query_params.get('share')
+if share_token and st.session_state['session_id'] != share_token:
+    try:
+        shared = backend.open_share(share_token)
+        st.session_state['session_id'] = shared['session_id']
+        st.session_state['read_only'] = True
+        st.session_state['date_ranges'] = shared.get('date_ranges')
+        st.session_state['data_processed'] = True
+        st.session_state['process_job'] = None
+        for table_state_key in TABLE_STATE_KEYS:
+            st.session_state[table_state_key] = {'block': 1}
+    except BackendError as e:
+        st.query_params.clear()
+        st.session_state['session_notice'] = f"Could not open the shared session: {e.detail}"
+read_only = st.session_state['read_only']
+
+
+# ---------------------- Expired Session Recovery ---------------------- #
+# The backend ends idle sessions; instead of errors on every section, start over
+# from the upload step with a note saying why. Fragments call this after their own
+# requests, since a fragment rerun never reaches the end of the script.
+def recover_lost_session():
+    if not (backend.session_lost and st.session_state.get('session_id')):
+        return
+    shared = st.session_state.get('read_only')
+    st.session_state.clear()
+    if shared:
+        st.query_params.clear()
+        st.session_state['session_notice'] = "The shared session has ended; ask its owner for a new link."
+    else:
+        st.session_state['session_notice'] = ("Your session is no longer available on the server; "
+                                              "please upload the files again.")
+    # From inside a fragment too, the whole page starts over
+    st.rerun(scope='app')
+
+
+# ---------------------- Performance Recording ---------------------- #
+# While on, the spans of this rerun (backend calls, decoding, grids, charts) are
+# collected and shown in the sidebar Performance panel at the end of the page
+record_performance = st.sidebar.toggle("Record performance", value=perf.PERF_ENABLED, key='record_performance')
+perf_run = perf.Run(label=st.session_state['session_id']) if record_performance else None
+# Set on every rerun and cleared at the end of the page: the script thread is reused, so a run
+# left active would collect the spans of the next rerun, or of fragments rerunning on their own
+perf.activate(perf_run)
+
+
+def record_fragment(fragment):
+    # Inside a full rerun a fragment records into the page's run. Rerunning on its own
+    # (a grid scroll, a tab switch, a job poll) the top of the page does not run, so
+    # the fragment records into a run of its own, exported when it returns.
+    @functools.wraps(fragment)
+    def run_fragment(*args, **kwargs):
+        if perf.active() is not None or not st.session_state.get('record_performance'):
+            return fragment(*args, **kwargs)
+        fragment_run = perf.Run(label=f"{st.session_state.get('session_id')} {fragment.__name__}")
+        token = perf.activate(fragment_run)
+        try:
+            return fragment(*args, **kwargs)
+        finally:
+            perf.deactivate(token)
+            fragment_run.export()
+    return run_fragment
 
 # ---------------------- Sidebar ---------------------- #
-if st.session_state['session_id']:
-    st.sidebar.success(f"Session ID: {st.session_state['session_id']}")
+session_sidebar = st.sidebar.empty()
+
+
+def show_session_sidebar():
+    # Session ID and what the last upload actually sent; redrawn right after an upload
+    with session_sidebar.container():
+        if st.session_state['session_id']:
+            st.success(f"Session ID: {st.session_state['session_id']}")
+        transfer = st.session_state['upload_transfer']
+        if transfer and transfer['bytes_original']:
+            saved = transfer['bytes_original'] - transfer['bytes_sent']
+            lines = [f"Sent {format_bytes(transfer['bytes_sent'])} of {format_bytes(transfer['bytes_original'])} "
+                     f"({saved / transfer['bytes_original']:.0%} saved)"]
+            deduplicated = sum(1 for f in transfer['files'] if f['deduplicated'])
+            if deduplicated:
+                lines.append(f"{deduplicated} file(s) already on the server")
+            throughput = st.session_state['upload_throughput']
+            if throughput and saved > 0:
+                lines.append(f"About {saved / throughput:.1f}s of upload time saved")
+            st.caption(" · ".join(lines))
+
+
+show_session_sidebar()
 
 # ---------------------- Step 1: Upload Files ---------------------- #
 st.header("Upload Excel/CSV Files")
 
+# Set when the backend no longer had this browser's session (see the end of the script)
+if st.session_state.get('session_notice'):
+    st.warning(st.session_state.pop('session_notice'))
+
+if read_only:
+    st.info("You are viewing a shared reconciliation. It is read-only: uploading and processing are turned off, "
+            "and the results below are the ones its owner processed.")
+
 col1, col2 = st.columns(2)
 
+# Several files per side (e.g. one API export per day) are reconciled as one set
 with col1:
     st.subheader("Upload API Excel/CSV")
-    api_file = st.file_uploader("Upload API File", type=['csv', 'xls', 'xlsx', 'xlsb'], key='api_file')
+    api_files = st.file_uploader("Upload API File(s)", type=['csv', 'xls', 'xlsx', 'xlsb'], key='api_file',
+                                 accept_multiple_files=True)
 
 with col2:
     st.subheader("Upload Dashboard Excel/CSV")
-    dashboard_file = st.file_uploader("Upload Dashboard File", type=['csv', 'xls', 'xlsx', 'xlsb'],
-                                      key='dashboard_file')
+    dashboard_files = st.file_uploader("Upload Dashboard File(s)", type=['csv', 'xls', 'xlsx', 'xlsb'],
+                                       key='dashboard_file', accept_multiple_files=True)
+
+# Column types the backend parses both files with
+with st.expander("Column types"):
+    col_orderid, col_status, col_amount, col_date = st.columns(4)
+    with col_orderid:
+        orderid_type = st.selectbox("OrderID as", options=['string', 'category'], key='schema_orderid')
+    with col_status:
+        status_type = st.selectbox("Status as", options=['string', 'category'], key='schema_status')
+    with col_amount:
+        amount_decimals = st.number_input("Amount decimals (blank = floating point)", min_value=0, max_value=6,
+                                          value=None, step=1, key='schema_amount')
+    with col_date:
+        date_format = st.text_input("Date format (blank = detect)", placeholder='%Y-%m-%d', key='schema_date')
+schema = {
+    'OrderID': orderid_type,
+    'Status': status_type,
+    'Amount': 'float' if amount_decimals is None else f"fixed:{int(amount_decimals)}",
+    'Date': f"datetime:{date_format.strip()}" if date_format.strip() else 'datetime',
+}
+
+# Files larger than memory are spilled to disk by OrderID and processed in parts;
+# unchecked, the backend does so only when the upload would not fit
+out_of_core = st.checkbox("Process out of core (files larger than memory)", key='out_of_core')
 
 # Upload Files Button
-if st.button("Upload Files"):
-    if api_file and dashboard_file:
+if st.button("Upload Files", disabled=read_only):
+    if api_files and dashboard_files:
         with st.spinner('Uploading files...'):
+            # Files are streamed from the uploaded buffers in chunks instead of getvalue()
             files = {
-                'api_file': (api_file.name, api_file.getvalue()),
-                'dashboard_file': (dashboard_file.name, dashboard_file.getvalue())
+                'api_file': [(f.name, f) for f in api_files],
+                'dashboard_file': [(f.name, f) for f in dashboard_files],
+            }
+            progress_widgets = {
+                (field, name): st.progress(0.0, text=f"{name}: waiting")
+                for field, side_files in files.items() for name, _ in side_files
             }
+
+            def show_upload_progress(progress):
+                progress_widgets[(progress.field, progress.name)].progress(
+                    progress.fraction,
+                    text=f"{progress.name}: {progress.fraction:.0%} at {format_throughput(progress.throughput)}"
+                )
+
             try:
-                response = requests.post(f"{API_BASE_URL}/upload", files=files)
-                if response.status_code == 200:
-                    data = response.json()
-                    session_id = data['session_id']
-                    st.session_state['session_id'] = session_id
-                    st.success("Files uploaded successfully!")
-                else:
-                    st.error(f"File upload failed: {response.json().get('detail', '')}")
+                data = backend.upload(
+                    files,
+                    on_progress=show_upload_progress,
+                    upload_ids=st.session_state['resumable_uploads'],
+                    schema=schema,
+                    out_of_core=True if out_of_core else None,
+                )
+                session_id = data['session_id']
+                st.session_state['session_id'] = session_id
+                transfer = data.get('transfer')
+                if transfer and transfer['bytes_sent'] and transfer['send_seconds']:
+                    st.session_state['upload_throughput'] = transfer['bytes_sent'] / transfer['send_seconds']
+                st.session_state['upload_transfer'] = transfer
+                show_session_sidebar()
+                st.success("Files uploaded successfully!")
+                # Parse report, when the backend sends one
+                ingest_stats = dict(data.get('ingest') or {})
+                spilled = ingest_stats.pop('out_of_core', None)
+                for field, stats in ingest_stats.items():
+                    # The backend timed and counted the parse; it is only added to this rerun's spans
+                    perf.record(f"parse {field}", stats['seconds'], count=False, rows=stats['rows'])
+                    names = ', '.join(name for name, _ in files[field])
+                    peak = f", peak memory {stats['peak_memory_mb']:,} MB" if stats.get('peak_memory_mb') else ''
+                    dropped = stats.get('duplicates_dropped')
+                    repeats = f", {dropped:,} rows repeated across files dropped" if dropped else ''
+                    st.caption(
+                        f"{names}: {stats['rows']:,} rows from {stats['sheets']} sheet(s) "
+                        f"parsed in {stats['seconds']:.2f}s{peak}{repeats}"
+                    )
+                if spilled:
+                    st.caption(f"Out of core: spilled to {spilled['partitions']} partitions "
+                               f"({spilled['spill_mb']:,} MB on disk)")
+            except BackendError as e:
+                st.error(f"File upload failed: {e.detail}")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
     else:
-        st.warning("Please upload both files.")
+        st.warning("Please upload at least one API file and one Dashboard file.")
 
 # ---------------------- Step 2: Get Date Range ---------------------- #
 st.header("Get Date Range")
@@ -142,14 +364,11 @@ if st.button("Get Date Range"):
     if session_id:
         with st.spinner('Getting date ranges...'):
             try:
-                # Assuming the backend provides a /summary endpoint that includes date ranges
-                date_range_response = requests.get(f"{API_BASE_URL}/get_date_range", params={'session_id': session_id})
-                if date_range_response.status_code == 200:
-                    date_ranges = date_range_response.json()
-                    st.session_state['date_ranges'] = date_ranges
-                    st.success("Date ranges retrieved successfully!")
-                else:
-                    st.error(f"Failed to get date ranges: {date_range_response.json().get('detail', '')}")
+                date_ranges = backend.get_date_range(session_id)
+                st.session_state['date_ranges'] = date_ranges
+                st.success("Date ranges retrieved successfully!")
+            except BackendError as e:
+                st.error(f"Failed to get date ranges: {e.detail}")
             except Exception as e:
                 st.error(f"An error occurred: {e}")
     else:
@@ -172,6 +391,37 @@ if st.session_state['date_ranges']:
 # ---------------------- Step 3: Process Data ---------------------- #
 st.header("Process Data")
 
+# Tolerant matching: OrderID normalization, amount tolerance and a time window
+with st.expander("Matching rules"):
+    col_ids, col_amounts = st.columns(2)
+    with col_ids:
+        strip_leading_zeros = st.checkbox("Ignore leading zeros in OrderIDs", key='match_leading_zeros')
+        ignore_case = st.checkbox("Ignore case in OrderIDs", key='match_ignore_case')
+        ignore_characters = st.text_input("Characters to ignore in OrderIDs", placeholder='-_ /',
+                                          key='match_ignore_characters')
+        strip_prefixes = st.text_input("Prefixes to remove (comma separated)", placeholder='PAY-, TXN',
+                                       key='match_prefixes')
+        strip_suffixes = st.text_input("Suffixes to remove (comma separated)", key='match_suffixes')
+    with col_amounts:
+        amount_tolerance = st.number_input("Amount tolerance", min_value=0.0, value=0.0, step=0.01,
+                                           key='match_amount_tolerance')
+        amount_tolerance_mode = st.radio("Tolerance in", ['absolute', 'percent'], horizontal=True,
+                                         key='match_amount_tolerance_mode')
+        time_window_minutes = st.number_input("Match only within minutes of each other (blank = any time)",
+                                              min_value=0, value=None, step=1, key='match_time_window')
+matching = {
+    'strip_leading_zeros': strip_leading_zeros,
+    'ignore_case': ignore_case,
+    'ignore_characters': ignore_characters,
+    'strip_prefixes': [p.strip() for p in strip_prefixes.split(',') if p.strip()],
+    'strip_suffixes': [s.strip() for s in strip_suffixes.split(',') if s.strip()],
+    'amount_tolerance': amount_tolerance,
+    'amount_tolerance_mode': amount_tolerance_mode,
+    'time_window_seconds': None if time_window_minutes is None else time_window_minutes * 60,
+}
+# Only rules changed from their defaults are sent; none at all means exact matching
+matching = {rule: value for rule, value in matching.items() if value != DEFAULT_MATCHING[rule]}
+
 # Date Range Selector beside Process Button
 col1, col2, col3 = st.columns([1, 1, 1])
 
@@ -180,359 +430,299 @@ with col1:
 with col2:
     end_date = st.date_input("End Date", value=None, key='end_date')
 with col3:
-    if st.button("Process Data"):
+    if st.button("Process Data", disabled=read_only):
         session_id = st.session_state.get('session_id')
         if session_id:
-            with st.spinner('Processing data...'):
-                process_data = {
-                    'session_id': session_id,
-                    'start_date': start_date.strftime('%Y-%m-%d') if start_date else None,
-                    'end_date': end_date.strftime('%Y-%m-%d') if end_date else None
-                }
-                try:
-                    response = requests.post(f"{API_BASE_URL}/process", json=process_data)
-                    if response.status_code == 200:
-                        st.session_state['data_processed'] = True
-                        st.success("Data processed successfully!")
-                        # Reset pagination when data is processed
-                        st.session_state['api_pagination'] = {'page': 1, 'page_size': 10}
-                        st.session_state['dashboard_pagination'] = {'page': 1, 'page_size': 10}
-                        st.session_state['amount_diff_pagination'] = {'page': 1, 'page_size': 10}
-                        st.session_state['status_diff_pagination'] = {'page': 1, 'page_size': 10}
-                    else:
-                        st.error(f"Data processing failed: {response.json().get('detail', '')}")
-                except Exception as e:
-                    st.error(f"An error occurred: {e}")
+            # Runs as a background job; progress is polled below while the page stays usable
+            try:
+                st.session_state['process_job'] = backend.start_process(
+                    session_id,
+                    start_date=start_date.strftime('%Y-%m-%d') if start_date else None,
+                    end_date=end_date.strftime('%Y-%m-%d') if end_date else None,
+                    matching=matching or None,
+                )
+            except BackendError as e:
+                st.error(f"Data processing failed: {e.detail}")
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
         else:
             st.warning("Please upload files and get date ranges first.")
 
+
+def finish_process_job(job):
+    # Called once when the job reaches a final state
+    st.session_state['process_job'] = None
+    for stage in job['stages']:
+        if stage['seconds'] is not None:
+            perf.record(f"process.{stage['stage']}", stage['seconds'], count=False, rows=stage['rows'])
+    if job['state'] == 'succeeded':
+        st.session_state['data_processed'] = True
+        st.session_state['process_message'] = ('success', "Data processed successfully!")
+        # Reset scroll positions when data is processed
+        for table_state_key in TABLE_STATE_KEYS:
+            st.session_state[table_state_key] = {'block': 1}
+            st.session_state.pop(f"{table_state_key}_block", None)
+    elif job['state'] == 'failed':
+        st.session_state['process_message'] = ('error', f"Data processing failed: {job['error']}")
+    else:
+        st.session_state['process_message'] = ('warning', "Processing cancelled; the previous results are unchanged.")
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+@record_fragment
+def process_job_progress():
+    # Reruns on its own every JOB_POLL_INTERVAL seconds without rerunning the page
+    job = st.session_state['process_job']
+    if job['job_id'] is not None and job['state'] not in JOB_FINISHED:
+        try:
+            job = backend.job_status(job['job_id'])
+        except BackendError as e:
+            st.error(f"Could not get processing progress: {e.detail}")
+            return
+        st.session_state['process_job'] = job
+    if job['state'] in JOB_FINISHED:
+        finish_process_job(job)
+        st.rerun()
+
+    stages = job['stages']
+    done = sum(1 for stage in stages if stage['status'] == 'done')
+    running = next((stage['stage'] for stage in stages if stage['status'] == 'running'), None)
+    if job['state'] == 'queued' and job.get('queue_position') is not None:
+        text = f"Waiting for a worker: {job['queue_position']} job(s) ahead"
+    else:
+        text = f"Processing: {running or job['state']} ({job['elapsed'] or 0:.1f}s)"
+    st.progress(done / max(len(stages), 1), text=text)
+    st.dataframe(
+        pd.DataFrame([{
+            'Stage': stage['stage'],
+            'Status': stage['status'],
+            'Rows': stage['rows'],
+            'Seconds': stage['seconds'],
+        } for stage in stages]),
+        hide_index=True,
+    )
+    if st.button("Cancel Processing", key='cancel_process_job'):
+        try:
+            st.session_state['process_job'] = backend.cancel_job(job['job_id'])
+        except BackendError as e:
+            st.error(f"Cancelling failed: {e.detail}")
+
+
+if st.session_state['process_job'] is not None:
+    process_job_progress()
+
+process_message = st.session_state.pop('process_message', None)
+if process_message:
+    level, text = process_message
+    getattr(st, level)(text)
+
 # ---------------------- Display Summary, Data, and Visualizations ---------------------- #
 if st.session_state['data_processed']:
     session_id = st.session_state['session_id']
 
+    # ---------------------- Fetch Everything for This Rerun Concurrently ---------------------- #
+    # Result tables: endpoint -> scroll state key
+    paginated_tables = {
+        'get_dataframe_api': 'api_pagination',
+        'get_dataframe_dashboard': 'dashboard_pagination',
+        'get_amount_differences': 'amount_diff_pagination',
+        'get_status_differences': 'status_diff_pagination',
+    }
+    # Result tabs and the tables each shows; only the open tab is rendered (and its tables fetched)
+    RESULT_TABS = {
+        "Data": ['get_dataframe_api', 'get_dataframe_dashboard'],
+        "Differences": ['get_amount_differences', 'get_status_differences'],
+        "Visualizations": [],
+        "Download Reports": [],
+        "Search": [],
+    }
+
+
+    def table_calls(endpoints):
+        calls = {}
+        for endpoint in endpoints:
+            pagination_key = paginated_tables[endpoint]
+            # The browser-driven grid only needs the first block here, for columns and row count
+            block = st.session_state[pagination_key]['block'] if backend.page_url(session_id, endpoint) is None else 1
+            query = st.session_state[pagination_key].get('query', {})
+            calls[(endpoint, block, GRID_BLOCK_SIZE, query_key(query))] = (
+                backend.get_page, session_id, endpoint, block, GRID_BLOCK_SIZE,
+                query.get('sort'), query.get('filters'), query.get('columns'),
+            )
+        return calls
+
+
+    # Metrics, status tables and charts all come from the one summary cube
+    open_tab = st.session_state.get('results_tab') or next(iter(RESULT_TABS))
+    calls = {'cube': (backend.cube, session_id), **table_calls(RESULT_TABS.get(open_tab, []))}
+    # All requests are in flight at once; each section below waits only for its own result
+    pending = fetch_concurrently(calls)
+
     # ---------------------- Fetch and Display Summary ---------------------- #
     st.header("Summary")
 
     with st.spinner('Fetching summary...'):
         try:
-            # Fetch the summary from /summary endpoint
-            summary_response = requests.get(f"{API_BASE_URL}/summary", params={'session_id': session_id})
-            if summary_response.status_code == 200:
-                summary = summary_response.json()
-
-                # Fetch the status counts from /status_counts endpoint
-                status_counts_response = requests.get(f"{API_BASE_URL}/status_counts",
-                                                      params={'session_id': session_id})
-                if status_counts_response.status_code == 200:
-                    status_counts = status_counts_response.json()
-                    status_counts_api = status_counts.get('status_counts_api', {})
-                    status_counts_dashboard = status_counts.get('status_counts_dashboard', {})
+            # Summary and status counts are sums over the cube from /cube
+            cube = pending['cube'].result()
+            summary = summary_cube.summary(cube)
+            status_counts = summary_cube.status_counts(cube)
+            status_counts_api = status_counts.get('status_counts_api', {})
+            status_counts_dashboard = status_counts.get('status_counts_dashboard', {})
+
+            # Display Key Metrics
+            st.markdown("### Key Metrics")
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(label="Total Amount (API)", value=f"₹{summary.get('total_amount_api', 0):,.2f}")
+            with col2:
+                st.metric(label="Total Amount (Dashboard)",
+                          value=f"₹{summary.get('total_amount_dashboard', 0):,.2f}")
+            with col3:
+                amount_diff = summary.get('total_amount_difference', 0)
+                delta_color = "normal" if amount_diff >= 0 else "inverse"
+                st.metric(label="Amount Difference", value=f"₹{amount_diff:,.2f}", delta="",
+                          delta_color=delta_color)
+
+            col4, col5, col6 = st.columns(3)
+            with col4:
+                st.metric(label="Transactions (API)", value=f"{summary.get('num_transactions_api', 0):,}")
+            with col5:
+                st.metric(label="Transactions (Dashboard)",
+                          value=f"{summary.get('num_transactions_dashboard', 0):,}")
+            with col6:
+                transaction_diff = summary.get('num_transactions_api', 0) - summary.get(
+                    'num_transactions_dashboard', 0)
+                delta_color = "normal" if transaction_diff >= 0 else "inverse"
+                st.metric(label="Transaction Difference", value=f"{transaction_diff:,}", delta="",
+                          delta_color=delta_color)
+
+            col7, col8 = st.columns(2)
+            with col7:
+                st.metric(label="Common OrderIDs", value=f"{summary.get('num_common_orderids', 0):,}")
+            with col8:
+                st.metric(label="Uncommon OrderIDs", value=f"{summary.get('num_uncommon_orderids', 0):,}")
+
+            # Display Status Counts
+            st.markdown("### Status Counts")
+            col9, col10 = st.columns(2)
+            with col9:
+                st.markdown("**API Status Counts**")
+                if status_counts_api:
+                    status_counts_api_df = pd.DataFrame(list(status_counts_api.items()),
+                                                        columns=['Status', 'Count'])
+                    st.table(status_counts_api_df)
                 else:
-                    st.error(f"Failed to fetch status counts: {status_counts_response.json().get('detail', '')}")
-                    status_counts_api = {}
-                    status_counts_dashboard = {}
-
-                # Display Key Metrics
-                st.markdown("### Key Metrics")
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric(label="Total Amount (API)", value=f"₹{summary.get('total_amount_api', 0):,.2f}")
-                with col2:
-                    st.metric(label="Total Amount (Dashboard)",
-                              value=f"₹{summary.get('total_amount_dashboard', 0):,.2f}")
-                with col3:
-                    amount_diff = summary.get('total_amount_difference', 0)
-                    delta_color = "normal" if amount_diff >= 0 else "inverse"
-                    st.metric(label="Amount Difference", value=f"₹{amount_diff:,.2f}", delta="",
-                              delta_color=delta_color)
-
-                col4, col5, col6 = st.columns(3)
-                with col4:
-                    st.metric(label="Transactions (API)", value=f"{summary.get('num_transactions_api', 0):,}")
-                with col5:
-                    st.metric(label="Transactions (Dashboard)",
-                              value=f"{summary.get('num_transactions_dashboard', 0):,}")
-                with col6:
-                    transaction_diff = summary.get('num_transactions_api', 0) - summary.get(
-                        'num_transactions_dashboard', 0)
-                    delta_color = "normal" if transaction_diff >= 0 else "inverse"
-                    st.metric(label="Transaction Difference", value=f"{transaction_diff:,}", delta="",
-                              delta_color=delta_color)
-
-                col7, col8 = st.columns(2)
-                with col7:
-                    st.metric(label="Common OrderIDs", value=f"{summary.get('num_common_orderids', 0):,}")
-                with col8:
-                    st.metric(label="Uncommon OrderIDs", value=f"{summary.get('num_uncommon_orderids', 0):,}")
-
-                # Display Status Counts
-                st.markdown("### Status Counts")
-                col9, col10 = st.columns(2)
-                with col9:
-                    st.markdown("**API Status Counts**")
-                    if status_counts_api:
-                        status_counts_api_df = pd.DataFrame(list(status_counts_api.items()),
-                                                            columns=['Status', 'Count'])
-                        st.table(status_counts_api_df)
-                    else:
-                        st.write("No status counts available for API data.")
-                with col10:
-                    st.markdown("**Dashboard Status Counts**")
-                    if status_counts_dashboard:
-                        status_counts_dashboard_df = pd.DataFrame(list(status_counts_dashboard.items()),
-                                                                  columns=['Status', 'Count'])
-                        st.table(status_counts_dashboard_df)
-                    else:
-                        st.write("No status counts available for Dashboard data.")
+                    st.write("No status counts available for API data.")
+            with col10:
+                st.markdown("**Dashboard Status Counts**")
+                if status_counts_dashboard:
+                    status_counts_dashboard_df = pd.DataFrame(list(status_counts_dashboard.items()),
+                                                              columns=['Status', 'Count'])
+                    st.table(status_counts_dashboard_df)
+                else:
+                    st.write("No status counts available for Dashboard data.")
 
-                
-                # Visual Separator
-                st.markdown("---")
+            
+            # Visual Separator
+            st.markdown("---")
 
-                # Date Ranges (Already displayed in Step 2)
-            else:
-                st.error(f"Failed to fetch summary: {summary_response.json().get('detail', '')}")
+            # Date Ranges (Already displayed in Step 2)
+        except BackendError as e:
+            st.error(f"Failed to fetch summary: {e.detail}")
         except Exception as e:
             st.error(f"An error occurred while fetching summary: {e}")
 
-    # ---------------------- Fetch and Display Dataframes with Custom Pagination ---------------------- #
-    st.header("Processed Data Comparison")
-
 
-    def fetch_dataframe(session_id, endpoint, page, page_size):
+    def fetch_dataframe(session_id, endpoint, page, page_size, query=None):
+        # query: {'sort', 'filters', 'columns'} run by the backend on the full dataset
+        query = query or {}
         try:
-            response = requests.get(
-                f"{API_BASE_URL}/{endpoint}",
-                params={'session_id': session_id, 'page': page, 'page_size': page_size}
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                st.error(f"Failed to fetch data from {endpoint}: {response.json().get('detail', '')}")
-                return None
+            with perf.span(f"page {endpoint}") as span:
+                # Use the request already in flight when it matches, otherwise fetch now
+                future = pending.get((endpoint, page, page_size, query_key(query)))
+                if future is not None:
+                    data = future.result()
+                else:
+                    data = backend.get_page(session_id, endpoint, page, page_size, sort=query.get('sort'),
+                                            filters=query.get('filters'), columns=query.get('columns'))
+                span['rows'] = len(data['data'])
+            return data
+        except BackendError as e:
+            recover_lost_session()
+            st.error(f"Failed to fetch data from {endpoint}: {e.detail}")
+            return None
         except Exception as e:
             st.error(f"An error occurred while fetching data from {endpoint}: {e}")
             return None
 
 
-    def display_data_with_aggrid(session_id, endpoint, title, pagination_key):
-        st.subheader(title)
-
-        # Get current pagination state
-        current_page = st.session_state[pagination_key]['page']
-        page_size = st.session_state[pagination_key]['page_size']
-
-        # Fetch data for current page
-        data_response = fetch_dataframe(session_id, endpoint, current_page, page_size)
-        if data_response:
-            data = data_response['data']
-            total_records = data_response.get('total_records', 0)
-            total_pages = math.ceil(total_records / page_size) if page_size else 1
-            # Convert to DataFrame
-            df = pd.DataFrame(data)
-
-            if df.empty:
-                st.warning("No data available on this page.")
-            else:
-                # Configure AgGrid options
-                gb = GridOptionsBuilder.from_dataframe(df)
-                #gb.configure_side_bar()
-                gb.configure_default_column(resizable=True, filterable=True, sortable=True)
-                grid_options = gb.build()
-
-                # Display AgGrid
-                AgGrid(
-                    df,
-                    gridOptions=grid_options,
-                    height=500,  # Adjust height as needed
-                    width='100%',
-                    # fit_columns_on_grid_load=True,
-                    theme='balham',
-                   # enable_enterprise_modules=True,
-                   # update_mode=GridUpdateMode.NO_UPDATE,
-                   # allow_unsafe_jscode=True,
-                )
-
-                # Display pagination controls
-                col_prev, col_page, col_next = st.columns([1, 2, 1])
-                with col_prev:
-                    if st.button("Previous", key=f"{endpoint}_prev"):
-                        if current_page > 1:
-                            st.session_state[pagination_key]['page'] -= 1
-                with col_page:
-                    st.write(f"Page {current_page} of {total_pages}")
-                with col_next:
-                    if st.button("Next", key=f"{endpoint}_next"):
-                        if current_page < total_pages:
-                            st.session_state[pagination_key]['page'] += 1
-
-
-    # Display API Data
-    col1, col2 = st.columns(2)
-    with col1:
-        # Page Size Selector
-        api_page_size = st.selectbox(
-            "API Data - Rows per page",
-            options=[10, 20, 50, 100],
-            index=0,
-            key='api_page_size'
-        )
-        st.session_state['api_pagination']['page_size'] = api_page_size
-        display_data_with_aggrid(session_id, "get_dataframe_api", "API Data", 'api_pagination')
-    with col2:
-        # Page Size Selector
-        dashboard_page_size = st.selectbox(
-            "Dashboard Data - Rows per page",
-            options=[10, 20, 50, 100],
-            index=0,
-            key='dashboard_page_size'
-        )
-        st.session_state['dashboard_pagination']['page_size'] = dashboard_page_size
-        display_data_with_aggrid(session_id, "get_dataframe_dashboard", "Dashboard Data", 'dashboard_pagination')
-
-    # ---------------------- Amount Differences ---------------------- #
-    # ---------------------- Amount and Status Differences Side by Side ---------------------- #
-    st.header("Differences")
-
-    # Create two columns: one for Amount Differences and one for Status Differences
-    col1, col2 = st.columns(2)
-
-    with col1:
-        st.subheader("Amount Differences")
-
+    def prefetch_dataframe(session_id, endpoint, page, page_size, query=None):
+        # Fire and forget: the response lands in the cache for the next rerun
+        query = query or {}
+        key = (endpoint, page, page_size, query_key(query))
+        if key not in pending:
+            pending.update(fetch_concurrently({
+                key: (backend.get_page, session_id, endpoint, page, page_size,
+                      query.get('sort'), query.get('filters'), query.get('columns'))
+            }))
 
-        def display_amount_differences(session_id, pagination_key):
-            st.subheader("Amount Differences")
 
-            # Get current pagination state
-            current_page = st.session_state[pagination_key]['page']
-            page_size = st.session_state[pagination_key]['page_size']
+    def known_statuses():
+        # Status values seen on either side, offered by the status filters
+        try:
+            cube = pending['cube'].result()
+        except Exception:
+            return []
+        return sorted({status for status in cube['cells'].get('Status', []) if status is not None})
 
-            # Fetch data for current page
-            data_response = fetch_dataframe(session_id, "get_amount_differences", current_page, page_size)
-            if data_response:
-                data = data_response['data']
-                total_records = data_response.get('total_records', 0)
-                total_pages = math.ceil(total_records / page_size) if page_size else 1
-                # Convert to DataFrame
-                df = pd.DataFrame(data)
 
-                if df.empty:
-                    st.warning("No data available on this page.")
-                else:
-                    # Configure AgGrid options
-                    gb = GridOptionsBuilder.from_dataframe(df)
-                    gb.configure_default_column(resizable=True, filterable=True, sortable=True)
-                    grid_options = gb.build()
-
-                    # Display AgGrid
-                    AgGrid(
-                        df,
-                        gridOptions=grid_options,
-                        height=400,
-                        width='100%',
-                        theme='balham',
-                        enable_enterprise_modules=True,
-                        update_mode=GridUpdateMode.NO_UPDATE,
-                        allow_unsafe_jscode=True,
-                    )
-
-                    # Display pagination controls
-                    col_prev, col_page, col_next = st.columns([1, 2, 1])
-                    with col_prev:
-                        if st.button("Previous", key=f"{pagination_key}_prev"):
-                            if current_page > 1:
-                                st.session_state[pagination_key]['page'] -= 1
-                    with col_page:
-                        st.write(f"Page {current_page} of {total_pages}")
-                    with col_next:
-                        if st.button("Next", key=f"{pagination_key}_next"):
-                            if current_page < total_pages:
-                                st.session_state[pagination_key]['page'] += 1
-
-
-        # Page Size Selector for Amount Differences
-        amount_diff_page_size = st.selectbox(
-            "Amount Differences - Rows per page",
-            options=[10, 20, 50, 100],
-            index=0,
-            key='amount_diff_page_size'
+    # Its own fragment: scrolling or querying one table reruns only that table
+    @st.fragment
+    @record_fragment
+    def display_table(session_id, endpoint, title, pagination_key, height):
+        st.subheader(title)
+        render_virtual_grid(
+            session_id,
+            endpoint,
+            pagination_key,
+            fetch_page=lambda page, page_size, query: fetch_dataframe(
+                session_id, endpoint, page, page_size, query),
+            prefetch_page=lambda page, page_size, query: prefetch_dataframe(
+                session_id, endpoint, page, page_size, query),
+            page_url=backend.page_url(session_id, endpoint),
+            height=height,
+            status_options=known_statuses(),
         )
-        st.session_state['amount_diff_pagination']['page_size'] = amount_diff_page_size
-        display_amount_differences(session_id, 'amount_diff_pagination')
-
-    with col2:
-        st.subheader("Status Differences")
+        recover_lost_session()
 
 
-        def display_status_differences(session_id, pagination_key):
-            st.subheader("Status Differences")
+    def show_data():
+        col1, col2 = st.columns(2)
+        with col1:
+            display_table(session_id, "get_dataframe_api", "API Data", 'api_pagination', height=500)
+        with col2:
+            display_table(session_id, "get_dataframe_dashboard", "Dashboard Data", 'dashboard_pagination',
+                          height=500)
 
-            # Get current pagination state
-            current_page = st.session_state[pagination_key]['page']
-            page_size = st.session_state[pagination_key]['page_size']
 
-            # Fetch data for current page
-            data_response = fetch_dataframe(session_id, "get_status_differences", current_page, page_size)
-            if data_response:
-                data = data_response['data']
-                total_records = data_response.get('total_records', 0)
-                total_pages = math.ceil(total_records / page_size) if page_size else 1
-                # Convert to DataFrame
-                df = pd.DataFrame(data)
+    def show_differences():
+        # Amount Differences and Status Differences side by side
+        col1, col2 = st.columns(2)
+        with col1:
+            display_table(session_id, "get_amount_differences", "Amount Differences", 'amount_diff_pagination',
+                          height=400)
+        with col2:
+            display_table(session_id, "get_status_differences", "Status Differences", 'status_diff_pagination',
+                          height=400)
 
-                if df.empty:
-                    st.warning("No data available on this page.")
-                else:
-                    # Configure AgGrid options
-                    gb = GridOptionsBuilder.from_dataframe(df)
-                    gb.configure_default_column(resizable=True, filterable=True, sortable=True)
-                    grid_options = gb.build()
-
-                    # Display AgGrid
-                    AgGrid(
-                        df,
-                        gridOptions=grid_options,
-                        height=400,
-                        width='100%',
-                        theme='balham',
-                        enable_enterprise_modules=True,
-                        update_mode=GridUpdateMode.NO_UPDATE,
-                        allow_unsafe_jscode=True,
-                    )
-
-                    # Display pagination controls
-                    col_prev, col_page, col_next = st.columns([1, 2, 1])
-                    with col_prev:
-                        if st.button("Previous", key=f"{pagination_key}_prev"):
-                            if current_page > 1:
-                                st.session_state[pagination_key]['page'] -= 1
-                    with col_page:
-                        st.write(f"Page {current_page} of {total_pages}")
-                    with col_next:
-                        if st.button("Next", key=f"{pagination_key}_next"):
-                            if current_page < total_pages:
-                                st.session_state[pagination_key]['page'] += 1
-
-
-        # Page Size Selector for Status Differences
-        status_diff_page_size = st.selectbox(
-            "Status Differences - Rows per page",
-            options=[10, 20, 50, 100],
-            index=0,
-            key='status_diff_page_size'
-        )
-        st.session_state['status_diff_pagination']['page_size'] = status_diff_page_size
-        display_status_differences(session_id, 'status_diff_pagination')
-    # ---------------------- Fetch and Display Visualizations ---------------------- #
-    st.header("Visualizations")
 
-    # Fetch status counts
-    with st.spinner('Fetching status counts...'):
-        try:
-            status_counts_response = requests.get(f"{API_BASE_URL}/status_counts", params={'session_id': session_id})
-            if status_counts_response.status_code == 200:
-                status_counts = status_counts_response.json()
+    # ---------------------- Visualizations ---------------------- #
+    def show_visualizations():
+        # Fetch status counts
+        with st.spinner('Fetching status counts...'):
+            try:
+                status_counts = summary_cube.status_counts(pending['cube'].result())
                 status_counts_api = status_counts.get('status_counts_api', {})
                 status_counts_dashboard = status_counts.get('status_counts_dashboard', {})
 
@@ -553,7 +743,8 @@ if st.session_state['data_processed']:
                         title='API Status Distribution',
                         color_discrete_sequence=px.colors.sequential.RdBu
                     )
-                    st.plotly_chart(fig_api_pie, use_container_width=True)
+                    with perf.span('chart'):
+                        st.plotly_chart(fig_api_pie, use_container_width=True)
                 with col2:
                     fig_dashboard_pie = px.pie(
                         status_counts_dashboard_df,
@@ -562,19 +753,17 @@ if st.session_state['data_processed']:
                         title='Dashboard Status Distribution',
                         color_discrete_sequence=px.colors.sequential.RdBu
                     )
-                    st.plotly_chart(fig_dashboard_pie, use_container_width=True)
-            else:
-                st.error(f"Failed to fetch status counts: {status_counts_response.json().get('detail', '')}")
-        except Exception as e:
-            st.error(f"An error occurred while fetching status counts: {e}")
+                    with perf.span('chart'):
+                        st.plotly_chart(fig_dashboard_pie, use_container_width=True)
+            except BackendError as e:
+                st.error(f"Failed to fetch status counts: {e.detail}")
+            except Exception as e:
+                st.error(f"An error occurred while fetching status counts: {e}")
 
-    # Fetch total amount per status
-    with st.spinner('Fetching total amount per status...'):
-        try:
-            amount_per_status_response = requests.get(f"{API_BASE_URL}/total_amount_per_status",
-                                                      params={'session_id': session_id})
-            if amount_per_status_response.status_code == 200:
-                amount_per_status = amount_per_status_response.json()
+        # Fetch total amount per status
+        with st.spinner('Fetching total amount per status...'):
+            try:
+                amount_per_status = summary_cube.amount_per_status(pending['cube'].result())
                 amount_per_status_api = amount_per_status.get('total_amount_per_status_api', [])
                 amount_per_status_dashboard = amount_per_status.get('total_amount_per_status_dashboard', [])
 
@@ -595,7 +784,8 @@ if st.session_state['data_processed']:
                         color='Amount',
                         color_continuous_scale=px.colors.sequential.RdBu
                     )
-                    st.plotly_chart(fig_api_bar, use_container_width=True)
+                    with perf.span('chart'):
+                        st.plotly_chart(fig_api_bar, use_container_width=True)
                 with col2:
                     fig_dashboard_bar = px.bar(
                         amount_per_status_dashboard_df,
@@ -605,94 +795,209 @@ if st.session_state['data_processed']:
                         color='Amount',
                         color_continuous_scale=px.colors.sequential.RdBu
                     )
-                    st.plotly_chart(fig_dashboard_bar, use_container_width=True)
-            else:
-                st.error(
-                    f"Failed to fetch total amount per status: {amount_per_status_response.json().get('detail', '')}")
-        except Exception as e:
-            st.error(f"An error occurred while fetching total amount per status: {e}")
+                    with perf.span('chart'):
+                        st.plotly_chart(fig_dashboard_bar, use_container_width=True)
+            except BackendError as e:
+                st.error(f"Failed to fetch total amount per status: {e.detail}")
+            except Exception as e:
+                st.error(f"An error occurred while fetching total amount per status: {e}")
+
+        # Time series are aggregated and downsampled by the backend; only the chosen one is fetched
+        st.subheader("Over Time")
+        time_series = {
+            "Daily amount difference": 'daily_amounts',
+            "Mismatch rate": 'mismatch_rate',
+            "Transaction amounts": 'transaction_amounts',
+        }
+        chart_label = st.radio("View", list(time_series), horizontal=True, key='time_series_chart')
+        with st.spinner('Fetching chart...'):
+            try:
+                figure = backend.chart(session_id, time_series[chart_label], points=CHART_POINTS)
+                with perf.span('chart', bytes=len(figure)):
+                    st.plotly_chart(pio.from_json(figure), use_container_width=True)
+            except BackendError as e:
+                st.error(f"Failed to fetch chart: {e.detail}")
+            except Exception as e:
+                st.error(f"An error occurred while fetching chart: {e}")
 
     # ---------------------- Download Reports ---------------------- #
-    st.header("Download Reports")
-
-    st.write("Download the difference reports below:")
-
-    amount_diff_url = f"{API_BASE_URL}/download/amount_differences?session_id={session_id}"
-    status_diff_url = f"{API_BASE_URL}/download/status_differences?session_id={session_id}"
-    uncommon_orderids_url = f"{API_BASE_URL}/download/uncommon_orderids?session_id={session_id}"
-
-    st.markdown(f"[Download Amount Differences CSV]({amount_diff_url})")
-    st.markdown(f"[Download Status Differences CSV]({status_diff_url})")
-    st.markdown(f"[Download Uncommon OrderIDs CSV]({uncommon_orderids_url})")
+    def show_downloads():
+        st.write("Download the difference reports below:")
+
+        export_formats = {"CSV": 'csv', "CSV (gzip)": 'csv.gz', "Excel": 'xlsx'}
+        export_label = st.radio("Report format", list(export_formats), horizontal=True, key='export_format')
+        export_format = export_formats[export_label]
+        extension, mime = EXPORT_FORMATS[export_format]
+
+        reports = [
+            ('amount_differences', "Download Amount Differences"),
+            ('status_differences', "Download Status Differences"),
+            ('uncommon_orderids', "Download Uncommon OrderIDs"),
+        ]
+        streamed = True
+        for report, label in reports:
+            label = f"{label} {export_label}"
+            report_url = backend.download_link(session_id, report, export_format)
+            if report_url:
+                st.markdown(f"[{label}]({report_url})")
+            else:
+                # Local backend: there is no server to link to, and Streamlit serves a
+                # download from bytes it holds. The report is built when the button is
+                # clicked, whole, in this process; it does not stream.
+                streamed = False
+                st.download_button(
+                    label,
+                    data=lambda report=report: backend.download_data(session_id, report, export_format),
+                    file_name=f"{report}.{extension}", mime=mime, key=f"download_{report}",
+                )
+        if not streamed:
+            st.caption("Reports are built in memory when clicked. Run with the HTTP backend to stream large reports.")
 
     # ---------------------- Search Functionality ---------------------- #
-    st.header("Search for OrderID")
-
-    orderid_to_search = st.text_input("Enter OrderID to search")
+    def show_search_matches(matches_df, empty_message, key):
+        if not matches_df.empty:
+            with perf.span('grid options', rows=len(matches_df)):
+                gb = GridOptionsBuilder.from_dataframe(matches_df)
+                gb.configure_pagination(paginationAutoPageSize=True)
+                gb.configure_side_bar()
+                gb.configure_default_column(resizable=True, min_width=100, wrapText=True, autoHeight=True)
+                grid_options = gb.build()
+            AgGrid(
+                matches_df,
+                gridOptions=grid_options,
+                height=250,  # Increased height
+                # fit_columns_on_grid_load=True,
+                theme='balham',  # Use 'balham' to match dark theme
+                key=key,
+            )
+        else:
+            st.write(empty_message)
+
+
+    def show_search():
+        search_modes = {
+            "Single OrderID": 'exact',
+            "OrderID prefix": 'prefix',
+            "OrderID range": 'range',
+            "List of OrderIDs": 'batch',
+        }
+        search_mode = search_modes[st.radio("Search by", list(search_modes), horizontal=True, key='search_mode')]
+
+        orderids_to_search = []
+        orderid_end = None
+        if search_mode == 'batch':
+            pasted_orderids = st.text_area("Paste OrderIDs (one per line, or separated by commas)")
+            orderids_file = st.file_uploader("Or upload a file of OrderIDs", type=['txt', 'csv'], key='orderids_file')
+            orderids_to_search = parse_orderids(pasted_orderids)
+            if orderids_file is not None:
+                orderids_to_search = list(dict.fromkeys(
+                    orderids_to_search + parse_orderids(orderids_file.getvalue().decode('utf-8', errors='replace'))
+                ))
+            if orderids_to_search:
+                st.caption(f"{len(orderids_to_search)} distinct OrderID(s) to search")
+            orderid_to_search = None
+        elif search_mode == 'range':
+            range_from, range_to = st.columns(2)
+            orderid_to_search = range_from.text_input("From OrderID")
+            orderid_end = range_to.text_input("To OrderID")
+        else:
+            orderid_to_search = st.text_input("Enter OrderID to search" if search_mode == 'exact'
+                                              else "Enter the start of the OrderIDs to search")
 
-    if st.button("Search") and orderid_to_search:
-        with st.spinner("Searching..."):
-            try:
-                search_response = requests.get(
-                    f"{API_BASE_URL}/search",
-                    params={'session_id': session_id, 'orderid': orderid_to_search}
-                )
-                if search_response.status_code == 200:
-                    search_results = search_response.json()
-                    st.subheader("API File Matches")
-                    if search_results.get('api_matches'):
-                        api_matches_df = pd.DataFrame(search_results['api_matches'])
-                        gb = GridOptionsBuilder.from_dataframe(api_matches_df)
-                        gb.configure_pagination(paginationAutoPageSize=True)
-                        gb.configure_side_bar()
-                        gb.configure_default_column(resizable=True, min_width=100, wrapText=True, autoHeight=True)
-                        grid_options = gb.build()
-                        AgGrid(
-                            api_matches_df,
-                            gridOptions=grid_options,
-                            height=250,  # Increased height
-                            # fit_columns_on_grid_load=True,
-                            theme='balham'  # Use 'balham' to match dark theme
-                        )
+        if st.button("Search") and (orderid_to_search or orderid_end or orderids_to_search):
+            with st.spinner("Searching..."):
+                try:
+                    if search_mode == 'batch':
+                        search_results = backend.search_batch(session_id, orderids_to_search)
                     else:
-                        st.write("No matches found in API File.")
+                        search_results = backend.search(session_id, orderid_to_search, match=search_mode,
+                                                        orderid_end=orderid_end)
+                    if search_mode in ('prefix', 'range'):
+                        st.caption(f"Showing up to {SEARCH_MAX_MATCHES:,} matches per file.")
+                    st.subheader("API File Matches")
+                    show_search_matches(pd.DataFrame(search_results.get('api_matches', [])),
+                                        "No matches found in API File.", key='search_api_matches')
 
                     st.subheader("Dashboard File Matches")
-                    if search_results.get('dashboard_matches'):
-                        dashboard_matches_df = pd.DataFrame(search_results['dashboard_matches'])
-                        gb = GridOptionsBuilder.from_dataframe(dashboard_matches_df)
-                        gb.configure_pagination(paginationAutoPageSize=True)
-                        gb.configure_side_bar()
-                        gb.configure_default_column(resizable=True, min_width=100, wrapText=True, autoHeight=True)
-                        grid_options = gb.build()
-                        AgGrid(
-                            dashboard_matches_df,
-                            gridOptions=grid_options,
-                            height=250,  # Increased height
-                            # fit_columns_on_grid_load=True,
-                            theme='balham'  # Use 'balham' to match dark theme
-                        )
-                    else:
-                        st.write("No matches found in Dashboard File.")
-                else:
-                    st.error(f"Search failed: {search_response.json().get('detail', '')}")
-            except Exception as e:
-                st.error(f"An error occurred during search: {e}")
+                    show_search_matches(pd.DataFrame(search_results.get('dashboard_matches', [])),
+                                        "No matches found in Dashboard File.", key='search_dashboard_matches')
+
+                    not_found = search_results.get('not_found')
+                    if not_found:
+                        st.subheader("Not Found in Either File")
+                        st.write(f"{len(not_found)} of {len(orderids_to_search)} OrderID(s) matched no rows.")
+                        st.download_button("Download OrderIDs Not Found", data='\n'.join(['OrderID', *not_found]),
+                                           file_name='orderids_not_found.csv', mime='text/csv')
+                except BackendError as e:
+                    st.error(f"Search failed: {e.detail}")
+                except Exception as e:
+                    st.error(f"An error occurred during search: {e}")
+
+    # ---------------------- Results ---------------------- #
+    RESULT_SECTIONS = {
+        "Data": show_data,
+        "Differences": show_differences,
+        "Visualizations": show_visualizations,
+        "Download Reports": show_downloads,
+        "Search": show_search,
+    }
+
+
+    @st.fragment
+    @record_fragment
+    def show_results():
+        # Switching tabs reruns only this fragment, and only the open tab is computed
+        tabs = st.tabs(list(RESULT_TABS), key='results_tab', on_change='rerun')
+        for tab, (label, endpoints) in zip(tabs, RESULT_TABS.items()):
+            if not tab.open:
+                continue
+            # Start this tab's tables together when the rerun did not already (a tab switch)
+            pending.update(fetch_concurrently({
+                key: call for key, call in table_calls(endpoints).items() if key not in pending
+            }))
+            with tab:
+                RESULT_SECTIONS[label]()
+        # The sections report their own errors; a lost session replaces them with a fresh start
+        recover_lost_session()
+
+
+    st.header("Results")
+    show_results()
+
+    # ---------------------- Share ---------------------- #
+    if not read_only:
+        st.header("Share")
+        st.write("Others can open these results read-only with this link, without uploading or processing again.")
+        if st.button("Create Read-only Link"):
+            try:
+                token = backend.share_session(session_id)['share_token']
+                app_url = (st.context.url or '').split('?')[0]
+                st.session_state['share_link'] = f"{app_url}?share={token}"
+            except BackendError as e:
+                st.error(f"Could not share the session: {e.detail}")
+        if st.session_state.get('share_link'):
+            st.code(st.session_state['share_link'], language=None)
+            st.caption("The link works until the session is ended or expires.")
 
     # ---------------------- End Session ---------------------- #
     st.header("End Session")
 
-    if st.button("End Session"):
+    if read_only:
+        # Viewers leave; only the owner can end the session for everyone
+        if st.button("Leave Shared Session"):
+            st.query_params.clear()
+            st.session_state.clear()
+            st.rerun()
+    elif st.button("End Session"):
         if session_id:
             with st.spinner("Ending session..."):
                 try:
-                    delete_response = requests.delete(f"{API_BASE_URL}/session/{session_id}")
-                    if delete_response.status_code == 200:
-                        st.success("Session ended successfully.")
-                        st.session_state.clear()
-                        # Removed st.experimental_rerun()
-                    else:
-                        st.error(f"Failed to end session: {delete_response.json().get('detail', '')}")
+                    backend.end_session(session_id)
+                    st.success("Session ended successfully.")
+                    st.session_state.clear()
+                    # Removed st.experimental_rerun()
+                except BackendError as e:
+                    st.error(f"Failed to end session: {e.detail}")
                 except Exception as e:
                     st.error(f"An error occurred while ending session: {e}")
         else:
@@ -701,3 +1006,28 @@ if st.session_state['data_processed']:
     # ---------------------- Footer ---------------------- #
     st.markdown("---")
     st.markdown("Developed with ❤️ using Streamlit and FastAPI")
+
+# ---------------------- Sidebar: Backend Latency ---------------------- #
+# Rendered last so it includes the calls made during this rerun
+latency_rows = backend.latency_metrics()
+if latency_rows:
+    with st.sidebar.expander("Backend Latency"):
+        st.dataframe(pd.DataFrame(latency_rows), hide_index=True)
+
+# ---------------------- Sidebar: Performance ---------------------- #
+# Also rendered last; spans still running (e.g. prefetches) land in the next export only if they finish first
+if perf_run is not None:
+    with st.sidebar.expander("Performance", expanded=True):
+        perf_rows = perf_run.summary()
+        st.caption(f"This rerun: {perf_run.elapsed() * 1000:,.0f} ms, {len(perf_run.spans):,} spans")
+        if perf_rows:
+            st.dataframe(pd.DataFrame(perf_rows), hide_index=True)
+        st.download_button("Download spans (JSONL)", data=perf_run.jsonl(), file_name='spans.jsonl',
+                           mime='application/x-ndjson', key='perf_jsonl')
+        st.download_button("Download metrics (Prometheus)", data=perf.METRICS.prometheus(),
+                           file_name='metrics.prom', mime='text/plain', key='perf_prometheus')
+    perf_run.export()
+perf.activate(None)
+
+# ---------------------- Expired Session Recovery ---------------------- #
+recover_lost_session()
@@ -0,0 +1,503 @@
+# backend.py
+
+import contextvars
+import json
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import cube as summary_cube
+import perf
+from engine import EngineError, ReconciliationEngine
+from transport import ACCEPT_TABLES, CLIENT_ID_HEADER, TOTAL_RECORDS_HEADER, decode_frame, decode_search, is_arrow
+from upload import UploadStalled, file_entries, upload_files
+
+# ---------------------- HTTP Client Configuration ---------------------- #
+
+# (connect, read) timeouts in seconds; endpoints that do heavy work get longer reads
+DEFAULT_TIMEOUT = (5, 30)
+ENDPOINT_TIMEOUTS = {
+    'upload': (5, 600),
+    'process': (5, 600),
+    'download': (5, 300),
+}
+
+# Connections kept alive per host; sized for the requests one rerun makes
+POOL_SIZE = 16
+
+# Bounded retries with exponential backoff for idempotent calls and transient errors
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (502, 503, 504)
+
+# How many recent latencies are kept per endpoint
+LATENCY_WINDOW = 200
+
+# Threads used to send the independent requests of one rerun at the same time
+FETCH_WORKERS = POOL_SIZE
+
+try:
+    import brotli  # noqa: F401  urllib3 decodes br responses when it is installed
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# Bytes read per chunk from a streamed download
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Downloads larger than this are spooled to disk instead of memory
+DOWNLOAD_SPOOL_BYTES = 16 * 1024 * 1024
+
+# ---------------------- Backend Interface ---------------------- #
+# Both backends expose the same methods and return the same JSON-shaped
+# dicts the FastAPI backend sends, so app.py does not care which one it uses.
+# Table data (page 'data', search matches) always comes back as DataFrames.
+
+
+class BackendError(Exception):
+    # A request the backend rejected; detail is the message shown to the user
+
+    def __init__(self, detail, status_code=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def _error_detail(response):
+    try:
+        return response.json().get('detail', '')
+    except ValueError:
+        return response.text
+
+
+# ---------------------- Latency Metrics ---------------------- #
+class LatencyStats:
+    # Rolling per-endpoint latencies for the sidebar
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok=True):
+        with self._lock:
+            self._samples[endpoint].append(seconds)
+            self._counts[endpoint] += 1
+            if not ok:
+                self._errors[endpoint] += 1
+
+    def snapshot(self):
+        rows = []
+        with self._lock:
+            for endpoint, samples in sorted(self._samples.items()):
+                ordered = sorted(samples)
+                rows.append({
+                    'Endpoint': endpoint,
+                    'Calls': self._counts[endpoint],
+                    'Errors': self._errors[endpoint],
+                    'p50 (ms)': round(ordered[len(ordered) // 2] * 1000, 1),
+                    'p95 (ms)': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 1),
+                    'Max (ms)': round(ordered[-1] * 1000, 1),
+                })
+        return rows
+
+
+# ---------------------- Client Identity ---------------------- #
+# The user the current thread makes requests for. The backend is shared by every
+# browser session, so the app sets it on each rerun, the way it activates its perf
+# run; fetch_concurrently's copied context carries it to the worker threads.
+_client_id = contextvars.ContextVar('client_id', default=None)
+
+
+def identify(client_id):
+    return _client_id.set(client_id)
+
+
+def current_client():
+    return _client_id.get()
+
+
+class IdentifiedSession(requests.Session):
+    # Sends the current client's identity with every request, including the ones
+    # upload.py makes with this session
+    def request(self, method, url, **kwargs):
+        client_id = _client_id.get()
+        if client_id:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), CLIENT_ID_HEADER: client_id}
+        return super().request(method, url, **kwargs)
+
+
+def create_http_session():
+    # One pooled keep-alive session with bounded retries, shared by every call
+    session = IdentifiedSession()
+    retry = Retry(
+        total=RETRY_TOTAL,
+        connect=RETRY_TOTAL,
+        read=RETRY_TOTAL,
+        status=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        # POST /process and /upload are not safe to replay, and a PUT's streamed body
+        # cannot be: resumable chunks resume from the acknowledged offset instead
+        allowed_methods=frozenset(['GET', 'HEAD', 'DELETE']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+    return session
+
+
+def spool_chunks(chunks):
+    # Collects a streamed export into a file (on disk past DOWNLOAD_SPOOL_BYTES) rather
+    # than a list of chunks; whoever reads it back whole still holds all of it
+    spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_BYTES)
+    with perf.span('download') as span:
+        for chunk in chunks:
+            spool.write(chunk)
+        span['bytes'] = spool.tell()
+    spool.seek(0)
+    return spool
+
+
+# ---------------------- HTTP Backend ---------------------- #
+class HttpBackend:
+    # Talks to the remote FastAPI backend over one pooled session
+
+    is_local = False
+
+    def __init__(self, base_url, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.session = session or create_http_session()
+        self.latency = LatencyStats()
+
+    def _request(self, method, path, **kwargs):
+        endpoint = path.split('/')[0]
+        kwargs.setdefault('timeout', ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT))
+        started = time.perf_counter()
+        with perf.span(f"http {endpoint}", method=method) as span:
+            try:
+                response = self.session.request(method, f"{self.base_url}/{path}", **kwargs)
+            except requests.RequestException:
+                self.latency.record(endpoint, time.perf_counter() - started, ok=False)
+                raise
+            span['status'] = response.status_code
+            # A streamed body is counted as it is read (spool_chunks)
+            if not kwargs.get('stream'):
+                span['bytes'] = len(response.content)
+        self.latency.record(endpoint, time.perf_counter() - started, ok=response.status_code == 200)
+        if response.status_code != 200:
+            raise BackendError(_error_detail(response), response.status_code)
+        return response
+
+    def _json(self, method, path, **kwargs):
+        response = self._request(method, path, **kwargs)
+        with perf.span('decode json', bytes=len(response.content)):
+            return response.json()
+
+    def upload(self, files, on_progress=None, upload_ids=None, schema=None, out_of_core=None):
+        # files: {'api_file': (name, file_obj), 'dashboard_file': (name, file_obj)}; either
+        # value may be a list of (name, file_obj) to reconcile several files as one side
+        # schema: optional {column: type} the backend parses the files with
+        # out_of_core: True/False to force spilling to disk or not; None lets the backend decide
+        # Returns the backend's response plus 'transfer': bytes sent versus file sizes
+        started = time.perf_counter()
+        upload_span = perf.span('upload')
+        params = {}
+        if schema:
+            params['schema'] = json.dumps(schema)
+        if out_of_core is not None:
+            params['out_of_core'] = 'true' if out_of_core else 'false'
+        try:
+            with upload_span as span:
+                response, transfer = upload_files(self.base_url, files, on_progress=on_progress,
+                                                  upload_ids=upload_ids, timeout=ENDPOINT_TIMEOUTS['upload'],
+                                                  http=self.session, params=params or None)
+                span['bytes'] = transfer['bytes_sent']
+        except requests.HTTPError as e:
+            self.latency.record('upload', time.perf_counter() - started, ok=False)
+            raise BackendError(_error_detail(e.response), e.response.status_code) from e
+        except UploadStalled as e:
+            self.latency.record('upload', time.perf_counter() - started, ok=False)
+            raise BackendError(str(e), 502) from e
+        self.latency.record('upload', time.perf_counter() - started, ok=response.status_code == 200)
+        if response.status_code != 200:
+            raise BackendError(_error_detail(response), response.status_code)
+        return {**response.json(), 'transfer': transfer}
+
+    def get_date_range(self, session_id):
+        return self._json('GET', 'get_date_range', params={'session_id': session_id})
+
+    def _process_body(self, session_id, start_date, end_date, matching):
+        body = {'session_id': session_id, 'start_date': start_date, 'end_date': end_date}
+        # Only sent when used, so backends without tolerant matching keep working for exact runs
+        if matching:
+            body['matching'] = matching
+        return body
+
+    def process(self, session_id, start_date=None, end_date=None, matching=None):
+        return self._json('POST', 'process', json=self._process_body(session_id, start_date, end_date, matching))
+
+    def start_process(self, session_id, start_date=None, end_date=None, matching=None):
+        # Submits /process as a background job. Backends without the job API get the
+        # blocking call instead, reported as a job that has already finished.
+        try:
+            return self._json('POST', 'jobs/process',
+                              json=self._process_body(session_id, start_date, end_date, matching))
+        except BackendError as e:
+            if e.status_code not in (404, 405):
+                raise
+        result = self.process(session_id, start_date=start_date, end_date=end_date, matching=matching)
+        return {
+            'job_id': None,
+            'session_id': session_id,
+            'params': {'start_date': start_date, 'end_date': end_date, 'matching': matching},
+            'state': 'succeeded',
+            'stages': [],
+            'result': result,
+            'error': None,
+            'elapsed': None,
+        }
+
+    def job_status(self, job_id):
+        return self._json('GET', f"jobs/{job_id}")
+
+    def cancel_job(self, job_id):
+        return self._json('DELETE', f"jobs/{job_id}")
+
+    def cube(self, session_id):
+        # Backends without /cube: rebuilt from the three older endpoints (no per-day cells)
+        try:
+            return self._json('GET', 'cube', params={'session_id': session_id})
+        except BackendError as e:
+            if e.status_code not in (404, 405) or e.detail != 'Not Found':
+                raise
+        return summary_cube.from_legacy(self.summary(session_id), self.status_counts(session_id),
+                                        self.total_amount_per_status(session_id))
+
+    def chart(self, session_id, name, start_date=None, end_date=None, points=None):
+        # Figure JSON as text; the app hands it to Plotly without decoding it here
+        params = {'session_id': session_id}
+        for key, value in (('start_date', start_date), ('end_date', end_date), ('points', points)):
+            if value is not None:
+                params[key] = value
+        return self._request('GET', f"charts/{name}", params=params).text
+
+    def summary(self, session_id):
+        return self._json('GET', 'summary', params={'session_id': session_id})
+
+    def status_counts(self, session_id):
+        return self._json('GET', 'status_counts', params={'session_id': session_id})
+
+    def total_amount_per_status(self, session_id):
+        return self._json('GET', 'total_amount_per_status', params={'session_id': session_id})
+
+    def get_page(self, session_id, endpoint, page, page_size, sort=None, filters=None, columns=None):
+        params = {'session_id': session_id, 'page': page, 'page_size': page_size}
+        # Only sent when used, so backends without pushdown keep working for plain paging
+        if sort:
+            params['sort'] = json.dumps(sort)
+        if filters:
+            params['filters'] = json.dumps(filters)
+        if columns:
+            params['columns'] = ','.join(columns)
+        response = self._request('GET', endpoint, params=params, headers={'Accept': ACCEPT_TABLES})
+        with perf.span('decode page', bytes=len(response.content)) as span:
+            if is_arrow(response):
+                span['format'] = 'arrow'
+                body = {
+                    'data': decode_frame(response.content),
+                    'total_records': int(response.headers.get(TOTAL_RECORDS_HEADER, 0)),
+                    'page': page,
+                    'page_size': page_size,
+                }
+            else:
+                # JSON fallback for backends that do not offer Arrow
+                span['format'] = 'json'
+                body = response.json()
+                body['data'] = pd.DataFrame(body.get('data', []))
+            span['rows'] = len(body['data'])
+        return body
+
+    def search(self, session_id, orderid, match='exact', orderid_end=None):
+        params = {'session_id': session_id, 'orderid': orderid}
+        # Only sent when used, so backends without prefix/range search keep working for exact lookups
+        if match != 'exact':
+            params['match'] = match
+        if orderid_end is not None:
+            params['orderid_end'] = orderid_end
+        response = self._request('GET', 'search', params=params, headers={'Accept': ACCEPT_TABLES})
+        with perf.span('decode search', bytes=len(response.content)):
+            if is_arrow(response):
+                return decode_search(response.content)
+            body = response.json()
+            return {side: pd.DataFrame(body.get(side, [])) for side in ('api_matches', 'dashboard_matches')}
+
+    def search_batch(self, session_id, orderids):
+        # All matches for a list of OrderIDs in one request, plus those found on neither side
+        response = self._request('POST', 'search/batch', json={'session_id': session_id, 'orderids': list(orderids)},
+                                 headers={'Accept': ACCEPT_TABLES})
+        with perf.span('decode search', bytes=len(response.content)):
+            if is_arrow(response):
+                return decode_search(response.content)
+            body = response.json()
+        results = {side: pd.DataFrame(body.get(side, [])) for side in ('api_matches', 'dashboard_matches')}
+        results['not_found'] = body.get('not_found', [])
+        return results
+
+    def page_url(self, session_id, endpoint):
+        # The virtual scrolling grid fetches row blocks from here in the browser
+        return f"{self.base_url}/{endpoint}"
+
+    def download_link(self, session_id, report, fmt='csv'):
+        # The browser downloads straight from the backend, which streams the file
+        link = f"{self.base_url}/download/{report}?session_id={session_id}"
+        return link if fmt == 'csv' else f"{link}&format={fmt}"
+
+    def download_data(self, session_id, report, fmt='csv'):
+        return self.download_file(session_id, report, fmt).read()
+
+    def download_file(self, session_id, report, fmt='csv'):
+        # The streamed report copied chunk by chunk into a temporary file, read from the start
+        response = self._request('GET', f"download/{report}", params={'session_id': session_id, 'format': fmt},
+                                 stream=True)
+        return spool_chunks(response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE))
+
+    def end_session(self, session_id):
+        return self._json('DELETE', f"session/{session_id}")
+
+    def results_version(self, session_id):
+        return self._json('GET', f"session/{session_id}/version")
+
+    def share_session(self, session_id):
+        return self._json('POST', f"session/{session_id}/share")
+
+    def open_share(self, token):
+        return self._json('GET', f"share/{token}")
+
+    def latency_metrics(self):
+        return self.latency.snapshot()
+
+
+# ---------------------- Local Backend ---------------------- #
+class LocalBackend:
+    # Runs the reconciliation in-process; no data leaves the machine
+
+    is_local = True
+
+    def __init__(self, engine=None):
+        self.engine = engine or ReconciliationEngine()
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            with perf.span(f"local {method.__name__}"):
+                return method(*args, **kwargs)
+        except EngineError as e:
+            raise BackendError(e.detail, e.status_code) from e
+
+    def upload(self, files, on_progress=None, upload_ids=None, schema=None, out_of_core=None):
+        sides = {field: [(filename, file_obj) for _, filename, file_obj in file_entries({field: value})]
+                 for field, value in files.items()}
+        return self._call(self.engine.upload_files, sides.get('api_file'), sides.get('dashboard_file'),
+                          schema=schema, out_of_core=out_of_core, owner=current_client())
+
+    def get_date_range(self, session_id):
+        return self._call(self.engine.get_date_range, session_id)
+
+    def process(self, session_id, start_date=None, end_date=None, matching=None):
+        return self._call(self.engine.process, session_id, start_date, end_date, matching=matching)
+
+    def start_process(self, session_id, start_date=None, end_date=None, matching=None):
+        return self._call(self.engine.start_process, session_id, start_date, end_date, matching=matching)
+
+    def job_status(self, job_id):
+        return self._call(self.engine.job, job_id)
+
+    def cancel_job(self, job_id):
+        return self._call(self.engine.cancel_job, job_id)
+
+    def cube(self, session_id):
+        return self._call(self.engine.cube, session_id)
+
+    def chart(self, session_id, name, start_date=None, end_date=None, points=None):
+        return self._call(self.engine.chart, session_id, name, start_date=start_date, end_date=end_date,
+                          points=points)
+
+    def summary(self, session_id):
+        return self._call(self.engine.summary, session_id)
+
+    def status_counts(self, session_id):
+        return self._call(self.engine.status_counts, session_id)
+
+    def total_amount_per_status(self, session_id):
+        return self._call(self.engine.total_amount_per_status, session_id)
+
+    def get_page(self, session_id, endpoint, page, page_size, sort=None, filters=None, columns=None):
+        return self._call(self.engine.get_page, session_id, endpoint, page, page_size,
+                          sort=sort, filters=filters, columns=columns)
+
+    def search(self, session_id, orderid, match='exact', orderid_end=None):
+        return self._call(self.engine.search, session_id, orderid, match=match, orderid_end=orderid_end)
+
+    def search_batch(self, session_id, orderids):
+        return self._call(self.engine.search_batch, session_id, orderids)
+
+    def page_url(self, session_id, endpoint):
+        # Nothing the browser can reach; the grid pages through blocks fetched server-side
+        return None
+
+    def download_link(self, session_id, report, fmt='csv'):
+        # No URL to link to; the app offers the data through a download button
+        return None
+
+    def download_data(self, session_id, report, fmt='csv'):
+        return self.download_file(session_id, report, fmt).read()
+
+    def download_file(self, session_id, report, fmt='csv'):
+        # Generated in chunks, but whoever serves it from here reads it whole
+        return spool_chunks(self._call(self.engine.export, session_id, report, fmt))
+
+    def end_session(self, session_id):
+        return self._call(self.engine.end_session, session_id)
+
+    def results_version(self, session_id):
+        return self._call(self.engine.results_version, session_id)
+
+    def share_session(self, session_id):
+        return self._call(self.engine.share_session, session_id)
+
+    def open_share(self, token):
+        return self._call(self.engine.open_share, token)
+
+    def latency_metrics(self):
+        # Nothing crosses the network, so there is nothing to report
+        return []
+
+
+# ---------------------- Concurrent Fan-out ---------------------- #
+_fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='backend-fetch')
+
+
+def fetch_concurrently(calls):
+    # calls: {key: (function, *args)}; returns {key: Future} right away.
+    # Results (or the BackendError a call raised) come from future.result().
+    # Each call runs in a copy of the caller's context, so its spans join the caller's perf run
+    return {key: _fetch_executor.submit(contextvars.copy_context().run, function, *args)
+            for key, (function, *args) in calls.items()}
+
+
+def create_backend(mode, base_url):
+    if mode == 'local':
+        return LocalBackend()
+    if mode == 'http':
+        return HttpBackend(base_url)
+    raise ValueError(f"Unknown backend mode: {mode}")
@@ -0,0 +1,499 @@
+# benchmark.py
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import cube as summary_cube
+from backend import LocalBackend
+from engine import ReconciliationEngine
+from ingest import PeakMemory
+from store import SessionStore
+
+# ---------------------- Benchmark ---------------------- #
+# Generates synthetic API and Dashboard files and times the whole flow the app
+# drives (upload, date range, process, summary, paging, search, download)
+# against the in-process backend:
+#   python benchmark.py --rows 100000 --format csv xlsx
+#   python benchmark.py --rows 1000000 --save-baseline
+#   python benchmark.py --rows 1000000 --compare      (exits 1 on a regression)
+# Generated files are kept and reused, keyed by everything that shapes them.
+
+# ---------------------- Configuration ---------------------- #
+
+# Dataset sizes the suite is meant for (rows per side); --rows takes any of these or others
+BENCHMARK_SIZES = (10_000, 100_000, 1_000_000, 10_000_000, 50_000_000)
+
+# File formats the generator writes. xlsb is read by the app but nothing in Python
+# can write it, so it cannot be generated here.
+BENCHMARK_FORMATS = ('csv', 'xlsx', 'xlsm', 'xls')
+
+# Where generated files and stores of benchmark sessions go
+BENCHMARK_DIR = os.environ.get('BENCHMARK_DIR', os.path.join(tempfile.gettempdir(), 'excelcompare_benchmark'))
+
+# Saved baselines, one per format and size
+BENCHMARK_BASELINE = os.environ.get(
+    'BENCHMARK_BASELINE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+)
+
+# Dataset shape
+SEED = 42
+MISMATCH_RATE = 0.05           # Share of orders that differ; split evenly between missing, amount and status
+STATUS_WEIGHTS = {'SUCCESS': 0.8, 'FAILED': 0.12, 'PENDING': 0.08}
+AMOUNT_NOISE = 0.10            # Relative spread of a changed amount
+DATE_SPREAD_DAYS = 90
+START_DATE = '2024-01-01'
+
+# Rows generated (and written) at a time, so 50M rows never sit in memory at once
+GENERATE_CHUNK_ROWS = 1_000_000
+
+# Rows per sheet; larger datasets are written across several sheets
+XLSX_SHEET_ROWS = 1_048_575
+XLS_SHEET_ROWS = 65_535
+
+# Calls made by the repeated stages
+SUMMARY_CALLS = 5
+PAGE_SIZE = 200
+PAGES_PER_ENDPOINT = 20
+SEARCH_CALLS = 50
+BATCH_SEARCH_IDS = 1000
+
+# A stage regresses when it is this much slower (p50 latency) or larger (peak RSS) than its baseline
+LATENCY_THRESHOLD = 0.20
+MEMORY_THRESHOLD = 0.25
+
+# Differences below these are noise, never a regression
+LATENCY_FLOOR_MS = 5
+MEMORY_FLOOR_MB = 32
+
+API_HEADERS = ('Order ID', 'Amount', 'Status', 'Date')
+DASHBOARD_HEADERS = ('OrderID', 'amount', 'status', 'Transaction Date')
+
+REPORTS = ('amount_differences', 'status_differences', 'uncommon_orderids')
+
+
+# ---------------------- Synthetic Data ---------------------- #
+def dataset_spec(rows, mismatch_rate=MISMATCH_RATE, status_weights=None, amount_noise=AMOUNT_NOISE,
+                 date_spread_days=DATE_SPREAD_DAYS, start_date=START_DATE, seed=SEED):
+    return {
+        'rows': int(rows),
+        'mismatch_rate': mismatch_rate,
+        'status_weights': dict(status_weights or STATUS_WEIGHTS),
+        'amount_noise': amount_noise,
+        'date_spread_days': date_spread_days,
+        'start_date': start_date,
+        'seed': seed,
+    }
+
+
+def _orderids(prefix, numbers):
+    return prefix + pd.Series(numbers).astype(str).str.zfill(10)
+
+
+def generate_chunks(spec):
+    # Yields (api, dashboard) frames of GENERATE_CHUNK_ROWS orders. Each chunk has its
+    # own seeded generator, so the data does not depend on the chunk size it is read with.
+    statuses = list(spec['status_weights'])
+    weights = np.array([spec['status_weights'][s] for s in statuses], dtype=float)
+    weights /= weights.sum()
+    start = np.datetime64(spec['start_date'], 'D')
+    share = spec['mismatch_rate'] / 3
+
+    for chunk, offset in enumerate(range(0, spec['rows'], GENERATE_CHUNK_ROWS)):
+        n = min(GENERATE_CHUNK_ROWS, spec['rows'] - offset)
+        rng = np.random.default_rng([spec['seed'], chunk])
+        numbers = np.arange(offset, offset + n)
+        amounts = np.round(rng.lognormal(mean=4.0, sigma=1.0, size=n), 2)
+        status_codes = rng.choice(len(statuses), size=n, p=weights)
+        dates = start + rng.integers(0, max(spec['date_spread_days'], 1), size=n).astype('timedelta64[D]')
+        api = pd.DataFrame({
+            'OrderID': _orderids('ORD', numbers),
+            'Amount': amounts,
+            'Status': np.array(statuses, dtype=object)[status_codes],
+            'Date': pd.to_datetime(dates),
+        })
+
+        # Mismatches: the order is missing from the dashboard (which has one of its own
+        # instead), its amount changed, or its status changed
+        kind = rng.random(n)
+        missing = kind < share
+        changed_amount = (kind >= share) & (kind < 2 * share)
+        changed_status = (kind >= 2 * share) & (kind < 3 * share)
+        dashboard = api.copy()
+        dashboard.loc[missing, 'OrderID'] = _orderids('DSH', numbers[missing]).to_numpy()
+        delta = np.abs(amounts * rng.normal(0, spec['amount_noise'], size=n))
+        delta = np.maximum(delta, 0.01) * rng.choice([-1, 1], size=n)
+        dashboard.loc[changed_amount, 'Amount'] = np.round(amounts + delta, 2)[changed_amount]
+        shifted = np.array(statuses, dtype=object)[(status_codes + 1) % len(statuses)]
+        dashboard.loc[changed_status, 'Status'] = shifted[changed_status]
+        dashboard = dashboard.iloc[rng.permutation(n)].reset_index(drop=True)
+        yield api, dashboard
+
+
+class _CsvWriter:
+    def __init__(self, path, headers):
+        self.path = path
+        self.headers = list(headers)
+        self.first = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode='w' if self.first else 'a', header=self.headers if self.first else False,
+                  index=False, date_format='%Y-%m-%d')
+        self.first = False
+
+    def close(self):
+        pass
+
+
+class _XlsxWriter:
+    # openpyxl in write-only mode streams rows to the file instead of building cells
+
+    def __init__(self, path, headers):
+        from openpyxl import Workbook
+        self.path = path
+        self.headers = list(headers)
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def write(self, df):
+        for row in zip(df['OrderID'], df['Amount'].tolist(), df['Status'], df['Date'].dt.to_pydatetime()):
+            if self.sheet is None or self.sheet_rows >= XLSX_SHEET_ROWS:
+                self.sheet = self.workbook.create_sheet(f"Sheet{len(self.workbook.worksheets) + 1}")
+                self.sheet.append(self.headers)
+                self.sheet_rows = 0
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class _XlsWriter:
+    def __init__(self, path, headers):
+        import xlwt
+        self.path = path
+        self.headers = list(headers)
+        self.workbook = xlwt.Workbook()
+        self.date_style = xlwt.easyxf(num_format_str='YYYY-MM-DD')
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def write(self, df):
+        for row in zip(df['OrderID'], df['Amount'].tolist(), df['Status'], df['Date'].dt.to_pydatetime()):
+            if self.sheet is None or self.sheet_rows >= XLS_SHEET_ROWS:
+                self.sheet = self.workbook.add_sheet(f"Sheet{len(self.workbook._Workbook__worksheets) + 1}")
+                for column, header in enumerate(self.headers):
+                    self.sheet.write(0, column, header)
+                self.sheet_rows = 0
+            self.sheet_rows += 1
+            orderid, amount, status, date = row
+            self.sheet.write(self.sheet_rows, 0, orderid)
+            self.sheet.write(self.sheet_rows, 1, amount)
+            self.sheet.write(self.sheet_rows, 2, status)
+            self.sheet.write(self.sheet_rows, 3, date, self.date_style)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+FILE_WRITERS = {'csv': _CsvWriter, 'xlsx': _XlsxWriter, 'xlsm': _XlsxWriter, 'xls': _XlsWriter}
+
+
+def dataset_files(spec, fmt, directory=BENCHMARK_DIR):
+    # Paths of the API and Dashboard files for spec, generated on first use
+    if fmt not in FILE_WRITERS:
+        raise ValueError(f"Cannot generate {fmt} files; choose from {', '.join(FILE_WRITERS)}")
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:10]
+    paths = {
+        'api_file': os.path.join(directory, f"api_{spec['rows']}_{digest}.{fmt}"),
+        'dashboard_file': os.path.join(directory, f"dashboard_{spec['rows']}_{digest}.{fmt}"),
+    }
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+    os.makedirs(directory, exist_ok=True)
+    # Written under temporary names and renamed, so an interrupted run is not reused
+    partial = {field: f"{path}.partial.{fmt}" for field, path in paths.items()}
+    writers = {
+        'api_file': FILE_WRITERS[fmt](partial['api_file'], API_HEADERS),
+        'dashboard_file': FILE_WRITERS[fmt](partial['dashboard_file'], DASHBOARD_HEADERS),
+    }
+    for api, dashboard in generate_chunks(spec):
+        writers['api_file'].write(api)
+        writers['dashboard_file'].write(dashboard)
+    for field, writer in writers.items():
+        writer.close()
+        os.replace(partial[field], paths[field])
+    return paths
+
+
+# ---------------------- Stage Timing ---------------------- #
+class Stage:
+    # Times one stage of the flow: every backend call in it, the rows and bytes it
+    # handled and the peak resident memory while it ran
+    #   with Stage('paginate') as stage:
+    #       page = stage.call(backend.get_page, ...); stage.rows += len(page['data'])
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = None
+        self.memory = PeakMemory()
+
+    def call(self, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def __enter__(self):
+        self.memory.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.started
+        self.memory.__exit__(*exc_info)
+        return False
+
+
+def _percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 2) if latencies else None
+
+
+def stage_report(stages):
+    # One result per stage name over every repeat of the flow
+    name = stages[0].name
+    latencies = [latency for stage in stages for latency in stage.latencies]
+    seconds = float(np.median([stage.seconds for stage in stages]))
+    rows = stages[0].rows
+    bytes_moved = stages[0].bytes
+    peaks = [stage.memory.megabytes() for stage in stages if stage.memory.megabytes() is not None]
+    return {
+        'stage': name,
+        'calls': len(latencies) // len(stages),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds) if rows and seconds else None,
+        'mb_per_second': round(bytes_moved / seconds / 1024 / 1024, 1) if bytes_moved and seconds else None,
+        'p50_ms': _percentile_ms(latencies, 50),
+        'p95_ms': _percentile_ms(latencies, 95),
+        'p99_ms': _percentile_ms(latencies, 99),
+        'peak_rss_mb': max(peaks) if peaks else None,
+    }
+
+
+# ---------------------- Flow ---------------------- #
+def run_flow(backend, paths, spec, out_of_core=None):
+    # The app's flow once, start to finish; returns the Stage of each step in order
+    picker = random.Random(spec['seed'])
+    stages = []
+
+    with Stage('upload') as stage:
+        with open(paths['api_file'], 'rb') as api_file, open(paths['dashboard_file'], 'rb') as dashboard_file:
+            files = {
+                'api_file': (os.path.basename(paths['api_file']), api_file),
+                'dashboard_file': (os.path.basename(paths['dashboard_file']), dashboard_file),
+            }
+            session_id = stage.call(backend.upload, files, out_of_core=out_of_core)['session_id']
+        stage.rows = 2 * spec['rows']
+        stage.bytes = sum(os.path.getsize(path) for path in paths.values())
+    stages.append(stage)
+
+    try:
+        with Stage('date_range') as stage:
+            ranges = stage.call(backend.get_date_range, session_id)
+        stages.append(stage)
+        dates = [value for side in ranges.values() for value in (side['min_date'], side['max_date']) if value]
+        start_date, end_date = (min(dates), max(dates)) if dates else (None, None)
+
+        with Stage('process') as stage:
+            stage.call(backend.process, session_id, start_date, end_date)
+            stage.rows = 2 * spec['rows']
+        stages.append(stage)
+
+        with Stage('summary') as stage:
+            for _ in range(SUMMARY_CALLS):
+                cube = stage.call(backend.cube, session_id)
+                summary_cube.summary(cube)
+                summary_cube.status_counts(cube)
+                summary_cube.amount_per_status(cube)
+        stages.append(stage)
+
+        with Stage('paginate') as stage:
+            for endpoint in ReconciliationEngine.PAGE_ENDPOINTS:
+                first = stage.call(backend.get_page, session_id, endpoint, 1, PAGE_SIZE)
+                stage.rows += len(first['data'])
+                last_page = max(-(-first['total_records'] // PAGE_SIZE), 1)
+                pages = [last_page] + [picker.randint(1, last_page) for _ in range(PAGES_PER_ENDPOINT - 2)]
+                for page in pages:
+                    stage.rows += len(stage.call(backend.get_page, session_id, endpoint, page, PAGE_SIZE)['data'])
+            # A query pushed down to the store: the whole frame is sorted once, then paged
+            sort = [{'column': 'Amount', 'direction': 'desc'}]
+            for page in (1, 2, 3):
+                stage.rows += len(stage.call(backend.get_page, session_id, 'get_dataframe_api', page, PAGE_SIZE,
+                                             sort=sort)['data'])
+        stages.append(stage)
+
+        with Stage('search') as stage:
+            # Mostly orders that exist, some only on the dashboard and some on neither side
+            orderids = [f"ORD{picker.randrange(spec['rows']):010d}" for _ in range(SEARCH_CALLS)]
+            orderids[::5] = [f"DSH{picker.randrange(spec['rows']):010d}" for _ in orderids[::5]]
+            orderids[::10] = [f"NONE{i:010d}" for i in range(len(orderids[::10]))]
+            for orderid in orderids:
+                results = stage.call(backend.search, session_id, orderid)
+                stage.rows += sum(len(frame) for frame in results.values())
+            results = stage.call(backend.search, session_id, 'ORD00000001', match='prefix')
+            stage.rows += sum(len(frame) for frame in results.values())
+            batch = [f"ORD{picker.randrange(spec['rows']):010d}" for _ in range(BATCH_SEARCH_IDS)]
+            results = stage.call(backend.search_batch, session_id, batch)
+            stage.rows += sum(len(frame) for frame in results.values() if isinstance(frame, pd.DataFrame))
+        stages.append(stage)
+
+        with Stage('download') as stage:
+            for report in REPORTS:
+                spool = stage.call(backend.download_file, session_id, report, 'csv')
+                spool.seek(0, os.SEEK_END)
+                stage.bytes += spool.tell()
+                spool.close()
+        stages.append(stage)
+    finally:
+        backend.end_session(session_id)
+    return stages
+
+
+def run_benchmark(spec, fmt, repeat=1, out_of_core=None):
+    paths = dataset_files(spec, fmt)
+    # A store of its own, so the benchmark never shares a directory with a running app
+    store = SessionStore(os.path.join(BENCHMARK_DIR, 'sessions'))
+    runs = [run_flow(LocalBackend(ReconciliationEngine(store=store)), paths, spec, out_of_core=out_of_core)
+            for _ in range(repeat)]
+    return {
+        'format': fmt,
+        'rows': spec['rows'],
+        'dataset': spec,
+        'file_mb': round(sum(os.path.getsize(path) for path in paths.values()) / 1024 / 1024, 1),
+        'repeat': repeat,
+        'out_of_core': bool(out_of_core),
+        'stages': [stage_report([run[i] for run in runs]) for i in range(len(runs[0]))],
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+# ---------------------- Baselines ---------------------- #
+def baseline_key(result):
+    return f"{result['format']}-{result['rows']}" + ('-out_of_core' if result['out_of_core'] else '')
+
+
+def load_baselines(path=BENCHMARK_BASELINE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BENCHMARK_BASELINE):
+    baselines = load_baselines(path)
+    baselines.update({baseline_key(result): result for result in results})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def regressions(result, baseline):
+    # Stages slower or larger than the baseline by more than the thresholds
+    found = []
+    previous = {stage['stage']: stage for stage in baseline['stages']}
+    for stage in result['stages']:
+        before = previous.get(stage['stage'])
+        if before is None:
+            continue
+        checks = (('p50_ms', LATENCY_THRESHOLD, LATENCY_FLOOR_MS), ('peak_rss_mb', MEMORY_THRESHOLD, MEMORY_FLOOR_MB))
+        for metric, threshold, floor in checks:
+            old, new = before.get(metric), stage.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + threshold) and new - old > floor:
+                found.append(f"{baseline_key(result)} {stage['stage']}: {metric} {old} -> {new} "
+                             f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return found
+
+
+# ---------------------- Command Line ---------------------- #
+def print_result(result):
+    print(f"\n{result['format']}, {result['rows']:,} rows per side ({result['file_mb']:,} MB of files, "
+          f"{result['repeat']} run(s){', out of core' if result['out_of_core'] else ''})")
+    table = pd.DataFrame(result['stages']).set_index('stage')
+    print(table.to_string(na_rep='-'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the reconciliation flow on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[BENCHMARK_SIZES[0]],
+                        help=f"rows per side (suite sizes: {', '.join(f'{n:,}' for n in BENCHMARK_SIZES)})")
+    parser.add_argument('--format', nargs='+', default=['csv'], choices=BENCHMARK_FORMATS, dest='formats')
+    parser.add_argument('--mismatch-rate', type=float, default=MISMATCH_RATE)
+    parser.add_argument('--status-weights', type=json.loads, default=None,
+                        help='JSON object of status to weight, e.g. \'{"SUCCESS": 0.9, "FAILED": 0.1}\'')
+    parser.add_argument('--amount-noise', type=float, default=AMOUNT_NOISE)
+    parser.add_argument('--date-spread-days', type=int, default=DATE_SPREAD_DAYS)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeat', type=int, default=1, help='runs of the flow per dataset')
+    parser.add_argument('--out-of-core', action='store_true', help='upload with out-of-core processing')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baselines')
+    parser.add_argument('--compare', action='store_true', help='exit 1 when a stage regressed against its baseline')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        spec = dataset_spec(rows, mismatch_rate=args.mismatch_rate, status_weights=args.status_weights,
+                            amount_noise=args.amount_noise, date_spread_days=args.date_spread_days, seed=args.seed)
+        for fmt in args.formats:
+            result = run_benchmark(spec, fmt, repeat=max(args.repeat, 1), out_of_core=args.out_of_core or None)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    exit_code = 0
+    if args.compare:
+        baselines = load_baselines()
+        found = []
+        for result in results:
+            baseline = baselines.get(baseline_key(result))
+            if baseline is None:
+                print(f"\nNo baseline for {baseline_key(result)}")
+                continue
+            found += regressions(result, baseline)
+        if found:
+            print("\nRegressions:\n  " + "\n  ".join(found))
+            exit_code = 1
+        else:
+            print("\nNo regressions against the baselines.")
+    if args.save_baseline:
+        save_baselines(results)
+        print(f"\nBaselines saved to {BENCHMARK_BASELINE}")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
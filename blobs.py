@@ -0,0 +1,115 @@
+# blobs.py
+
+import os
+import re
+import tempfile
+import threading
+import time
+
+from sessions import SESSION_TTL_SECONDS
+
+# ---------------------- Configuration ---------------------- #
+
+# Uploaded files kept by SHA-256 so an identical re-upload is not sent again
+BLOB_DIR = os.environ.get('BLOB_DIR', os.path.join(tempfile.gettempdir(), 'excelcompare_blobs'))
+
+# A blob is kept this long after its owner last sent or used it: as long as a session
+# started from it stays alive while idle
+BLOB_TTL_SECONDS = int(os.environ.get('BLOB_TTL_SECONDS', SESSION_TTL_SECONDS))
+
+# Disk all blobs may use together; past it, the least recently used are deleted
+BLOB_DISK_BUDGET_MB = int(os.environ.get('BLOB_DISK_BUDGET_MB', 10 * 1024))
+
+# Seconds between checks for blobs past their TTL (the budget is checked as blobs arrive)
+BLOB_SWEEP_SECONDS = 60
+
+
+# ---------------------- Blob Store ---------------------- #
+class BlobStore:
+    # Files by content hash, each visible only to the owners who sent it: a client
+    # learns that a hash is held, or starts a session from it, only when it uploaded
+    # that content itself. Ownership is kept in memory, like the sessions made from
+    # the blobs, so files left by an earlier process belong to nobody and are removed.
+
+    def __init__(self, root=BLOB_DIR, ttl=BLOB_TTL_SECONDS, disk_budget=BLOB_DISK_BUDGET_MB * 1024 * 1024,
+                 sweep_seconds=BLOB_SWEEP_SECONDS):
+        self.root = root
+        self.ttl = ttl
+        self.disk_budget = disk_budget
+        self.sweep_seconds = sweep_seconds
+        # digest -> {owner: when the owner last sent or used it}
+        self._owners = {}
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+        os.makedirs(self.root, exist_ok=True)
+        for name in os.listdir(self.root):
+            if re.fullmatch(r'[0-9a-f]{64}|.+\.tmp', name):
+                os.remove(os.path.join(self.root, name))
+
+    def path(self, digest):
+        if not re.fullmatch(r'[0-9a-f]{64}', digest or ''):
+            raise ValueError("Invalid content hash")
+        return os.path.join(self.root, digest)
+
+    def present(self, owner, digests):
+        # The digests this owner already sent, marked as used
+        self._maybe_sweep()
+        now = time.time()
+        with self._lock:
+            held = [d for d in digests if owner in self._owners.get(d, {})]
+            for digest in held:
+                self._owners[digest][owner] = now
+        return held
+
+    def temporary(self):
+        # (fd, path) of a file to receive a blob into; add() moves it in place
+        return tempfile.mkstemp(dir=self.root, suffix='.tmp')
+
+    def add(self, owner, digest, tmp_path):
+        path = self.path(digest)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._owners.setdefault(digest, {})[owner] = time.time()
+        self.sweep()
+        return os.path.getsize(path)
+
+    def open(self, owner, digest):
+        # The blob opened for reading; KeyError unless this owner sent it. An open file
+        # stays readable if the blob is evicted meanwhile.
+        path = self.path(digest)
+        with self._lock:
+            owners = self._owners.get(digest)
+            if owners is None or owner not in owners:
+                raise KeyError(digest)
+            owners[owner] = time.time()
+            return open(path, 'rb')
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._swept > self.sweep_seconds:
+            self.sweep()
+
+    def sweep(self):
+        # Forget owners idle past the TTL, delete blobs nobody owns, then the least
+        # recently used until the rest fit the disk budget
+        self._swept = time.monotonic()
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for digest, owners in list(self._owners.items()):
+                for owner in [o for o, used in owners.items() if used < cutoff]:
+                    del owners[owner]
+                if not owners:
+                    self._remove(digest)
+            sizes = {digest: os.path.getsize(self.path(digest)) for digest in self._owners}
+            total = sum(sizes.values())
+            for digest in sorted(sizes, key=lambda d: max(self._owners[d].values())):
+                if total <= self.disk_budget:
+                    break
+                total -= sizes[digest]
+                self._remove(digest)
+
+    def _remove(self, digest):
+        self._owners.pop(digest, None)
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,233 @@
+# cache.py
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from backend import BackendError
+from engine import SESSION_EXPIRED, SESSION_NOT_FOUND
+
+# ---------------------- Configuration ---------------------- #
+
+# Entries kept per browser session before the least recently used is evicted
+CACHE_MAX_ENTRIES = 256
+
+# Seconds a cached response stays valid
+CACHE_TTL = 300
+
+# Seconds between checks of a shared session's results version; results its owner
+# replaces from another browser show up in a viewer's within this time
+VERSION_CHECK_INTERVAL = 2
+
+
+# ---------------------- Response Cache ---------------------- #
+class ResponseCache:
+    # LRU + TTL cache of backend responses. Keys include the session ID, the
+    # processing parameters the results were produced with and, for sessions
+    # opened from a share link, the backend's version of those results. A new
+    # /process from this browser invalidates the session here; one from another
+    # browser changes the version a viewer's keys carry.
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, version_interval=VERSION_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_interval = version_interval
+        self._entries = OrderedDict()
+        self._processing_params = {}
+        # Sessions opened from a share link, whose version is checked
+        self._watched = set()
+        # session_id -> (when it was checked, results version)
+        self._versions = {}
+        # Cleared once the backend turns out not to have the version endpoint
+        self.versions_supported = True
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, session_id, endpoint, params=()):
+        with self._lock:
+            processing_params = self._processing_params.get(session_id)
+            version = self._versions.get(session_id, (None, None))[1]
+        return (session_id, processing_params, version, endpoint, tuple(params))
+
+    def watch(self, session_id):
+        # Results another browser can replace (a session opened from a share link)
+        with self._lock:
+            self._watched.add(session_id)
+
+    def version_due(self, session_id):
+        # True for the one caller that should check now: the check is claimed under the
+        # lock, keeping the last version, so parallel fetches do not all send it
+        with self._lock:
+            if not self.versions_supported or session_id not in self._watched:
+                return False
+            checked = self._versions.get(session_id)
+            now = time.monotonic()
+            if checked is not None and now - checked[0] <= self.version_interval:
+                return False
+            self._versions[session_id] = (now, checked[1] if checked else None)
+            return True
+
+    def set_version(self, session_id, version):
+        with self._lock:
+            self._versions[session_id] = (time.monotonic(), version)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id, processing_params=None):
+        # Drop everything cached for the session and remember the new parameters
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session_id]:
+                del self._entries[key]
+            # Checked again on the next read
+            self._versions.pop(session_id, None)
+            if processing_params is None:
+                self._processing_params.pop(session_id, None)
+            else:
+                self._processing_params[session_id] = processing_params
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def processing_params(start_date, end_date, matching=None):
+    # Hashable identity of one /process run, part of every cache key
+    return (start_date, end_date, json.dumps(matching, sort_keys=True) if matching else None)
+
+
+class CachedBackend:
+    # Wraps a backend so repeated reads within a browser session hit the cache.
+    # Anything not cached here (uploads, downloads, metrics) is passed through.
+    # session_lost is set when the backend answers that the session is gone
+    # (ended elsewhere or expired), so the app can start over cleanly.
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.session_lost = None
+
+    def __getattr__(self, name):
+        attribute = getattr(self.backend, name)
+        if not callable(attribute):
+            return attribute
+        return lambda *args, **kwargs: self._call(attribute, *args, **kwargs)
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except BackendError as e:
+            if e.status_code == 404 and e.detail in (SESSION_NOT_FOUND, SESSION_EXPIRED):
+                self.session_lost = e.detail
+            raise
+
+    def _cached(self, session_id, endpoint, params, fetch):
+        self._check_version(session_id)
+        key = self.cache.key(session_id, endpoint, params)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return entry[1]
+        value = self._call(fetch)
+        self.cache.put(key, value)
+        return value
+
+    def _check_version(self, session_id):
+        # Shared sessions only, at most every VERSION_CHECK_INTERVAL seconds; this browser's
+        # own runs invalidate the cache themselves, so its unchanged reruns send nothing.
+        # A backend without the version endpoint is not asked again, and the processing
+        # parameters and TTL alone decide.
+        if not self.cache.version_due(session_id):
+            return
+        try:
+            version = self._call(self.backend.results_version, session_id)['version']
+        except BackendError as e:
+            if e.status_code in (404, 405) and e.detail not in (SESSION_NOT_FOUND, SESSION_EXPIRED):
+                self.cache.versions_supported = False
+            version = None
+        self.cache.set_version(session_id, version)
+
+    def open_share(self, token):
+        shared = self._call(self.backend.open_share, token)
+        self.cache.watch(shared['session_id'])
+        return shared
+
+    def get_date_range(self, session_id):
+        return self._cached(session_id, 'get_date_range', (),
+                            lambda: self.backend.get_date_range(session_id))
+
+    def process(self, session_id, start_date=None, end_date=None, matching=None):
+        result = self._call(self.backend.process, session_id, start_date=start_date, end_date=end_date,
+                            matching=matching)
+        self.cache.invalidate(session_id, processing_params(start_date, end_date, matching))
+        return result
+
+    def start_process(self, session_id, start_date=None, end_date=None, matching=None):
+        job = self._call(self.backend.start_process, session_id, start_date=start_date, end_date=end_date,
+                         matching=matching)
+        self._job_finished(job)
+        return job
+
+    def job_status(self, job_id):
+        job = self._call(self.backend.job_status, job_id)
+        self._job_finished(job)
+        return job
+
+    def _job_finished(self, job):
+        # Cached pages belong to the previous results until the job has succeeded
+        if job['state'] == 'succeeded':
+            params = job.get('params') or {}
+            self.cache.invalidate(job['session_id'], processing_params(params.get('start_date'), params.get('end_date'),
+                                                                       params.get('matching')))
+
+    def cube(self, session_id):
+        return self._cached(session_id, 'cube', (),
+                            lambda: self.backend.cube(session_id))
+
+    def chart(self, session_id, name, start_date=None, end_date=None, points=None):
+        return self._cached(session_id, 'chart', (name, start_date, end_date, points),
+                            lambda: self.backend.chart(session_id, name, start_date=start_date, end_date=end_date,
+                                                       points=points))
+
+    def summary(self, session_id):
+        return self._cached(session_id, 'summary', (),
+                            lambda: self.backend.summary(session_id))
+
+    def status_counts(self, session_id):
+        return self._cached(session_id, 'status_counts', (),
+                            lambda: self.backend.status_counts(session_id))
+
+    def total_amount_per_status(self, session_id):
+        return self._cached(session_id, 'total_amount_per_status', (),
+                            lambda: self.backend.total_amount_per_status(session_id))
+
+    def get_page(self, session_id, endpoint, page, page_size, sort=None, filters=None, columns=None):
+        query = json.dumps([sort, filters, columns], sort_keys=True, default=str)
+        return self._cached(session_id, endpoint, (page, page_size, query),
+                            lambda: self.backend.get_page(session_id, endpoint, page, page_size,
+                                                          sort=sort, filters=filters, columns=columns))
+
+    def search(self, session_id, orderid, match='exact', orderid_end=None):
+        return self._cached(session_id, 'search', (orderid, match, orderid_end),
+                            lambda: self.backend.search(session_id, orderid, match=match, orderid_end=orderid_end))
+
+    def end_session(self, session_id):
+        try:
+            return self._call(self.backend.end_session, session_id)
+        finally:
+            self.cache.invalidate(session_id)
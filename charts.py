@@ -0,0 +1,262 @@
+# charts.py
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import cube as summary_cube
+
+# ---------------------- Configuration ---------------------- #
+
+# Points per series sent to the browser, about the pixel width of a chart; more cannot be seen
+CHART_POINTS = 1500
+
+# Bounds on the points a caller may ask for
+MIN_CHART_POINTS = 50
+MAX_CHART_POINTS = 20000
+
+# Series with more points than this are drawn with WebGL (scattergl) instead of SVG
+WEBGL_POINTS = 1000
+
+# Figures kept per processed result (each is a few hundred KB of JSON at most)
+FIGURE_CACHE_SIZE = 32
+
+# Time-series views, built on the backend from the stored results
+CHART_NAMES = ('daily_amounts', 'mismatch_rate', 'transaction_amounts')
+
+SIDE_LABELS = {'api': 'API', 'dashboard': 'Dashboard'}
+
+
+class ChartError(ValueError):
+    # Raised for a chart name or date the results cannot be charted with
+    pass
+
+
+# ---------------------- Downsampling ---------------------- #
+# Both return the positions of the points to keep, in order; x must be sorted.
+
+def lttb(x, y, points):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, from each
+    # bucket in between, the point forming the largest triangle with the point kept
+    # before it and the average of the next bucket. Keeps the shape of smooth series.
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.floor(np.linspace(1, n - 1, points - 1)).astype(np.int64)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        following = slice(end, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        average_x, average_y = x[following].mean(), y[following].mean()
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(np.nanargmax(areas)) if np.isfinite(areas).any() else start
+        kept[i + 1] = previous
+    return kept
+
+
+def min_max(y, points):
+    # The lowest and highest point of each of points/2 equal-count buckets. Cheaper
+    # than LTTB and never hides a spike, which suits noisy per-transaction series.
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    buckets = np.arange(n) * max(points // 2, 1) // n
+    series = pd.Series(np.asarray(y, dtype=float))
+    grouped = series.groupby(buckets, sort=True)
+    kept = np.concatenate([grouped.idxmin().dropna().to_numpy(), grouped.idxmax().dropna().to_numpy()])
+    return np.unique(kept.astype(np.int64))
+
+
+def _trace(x, y, name, mode='lines', **kwargs):
+    # WebGL once the series is long enough for SVG to slow the browser down
+    trace = go.Scattergl if len(x) > WEBGL_POINTS else go.Scatter
+    return trace(x=x, y=y, name=name, mode=mode, **kwargs)
+
+
+def _downsampled_line(days, values, name, points, **kwargs):
+    kept = lttb(days.astype('datetime64[ns]').astype(np.int64), values, points)
+    return _trace(days[kept], values[kept], name, **kwargs)
+
+
+# ---------------------- Series ---------------------- #
+def _window(days, start_date, end_date):
+    # Mask of the days (datetime64[D]) inside the optional window
+    mask = ~np.isnat(days)
+    try:
+        if start_date:
+            mask &= days >= np.datetime64(str(start_date)[:10], 'D')
+        if end_date:
+            mask &= days <= np.datetime64(str(end_date)[:10], 'D')
+    except ValueError as e:
+        raise ChartError(f"Invalid date: {e}") from e
+    return mask
+
+
+def daily_amounts(cube, start_date=None, end_date=None):
+    # Amount per day and side, summed from the cube cells; no rows are read
+    cells = summary_cube.cells(cube)
+    cells = cells[cells['day'].notna()] if len(cells) else cells
+    if not len(cells):
+        return pd.DataFrame(columns=['day', 'API', 'Dashboard', 'difference'])
+    totals = cells.pivot_table(index='day', columns='side', values='amount', aggfunc='sum', fill_value=0.0)
+    totals = totals.reindex(columns=list(summary_cube.SIDES), fill_value=0.0)
+    days = pd.to_datetime(totals.index).to_numpy().astype('datetime64[D]')
+    df = pd.DataFrame({'day': days, 'API': totals['API'].to_numpy(), 'Dashboard': totals['Dashboard'].to_numpy()})
+    df['difference'] = df['API'] - df['Dashboard']
+    return df[_window(df['day'].to_numpy(), start_date, end_date)].reset_index(drop=True)
+
+
+def _day_numbers(table):
+    if 'Date' not in table.column_names:
+        return None
+    dates = table['Date']
+    if not pa.types.is_timestamp(dates.type):
+        dates = pc.cast(dates, pa.timestamp('ns'))
+    return dates.to_numpy().astype('datetime64[D]')
+
+
+def _mismatched_ids(tables, side):
+    # OrderIDs of this side in any report: a changed amount or status, or not on the other side
+    column = 'OrderID_Dashboard' if side == 'dashboard' else 'OrderID'
+    ids = []
+    for name in ('amount_differences', 'status_differences'):
+        table = tables(name)
+        ids.append(table[column if column in table.column_names else 'OrderID'])
+    uncommon = tables('uncommon_orderids')
+    ids.append(uncommon.filter(pc.equal(uncommon['Source'], SIDE_LABELS[side]))['OrderID'])
+    return pa.chunked_array([chunk.cast(pa.string()) for array in ids for chunk in array.chunks], type=pa.string())
+
+
+def mismatch_rate(tables, start_date=None, end_date=None):
+    # Per day: rows of both sides, the rows whose order is in a difference report, and the share
+    frames = []
+    for side in SIDE_LABELS:
+        table = tables(side)
+        days = _day_numbers(table)
+        if days is None:
+            continue
+        value_set = _mismatched_ids(tables, side).combine_chunks()
+        mismatched = pc.is_in(pc.cast(table['OrderID'], pa.string()), value_set=value_set)
+        mismatched = pc.fill_null(mismatched, False).to_numpy(zero_copy_only=False)
+        mask = _window(days, start_date, end_date)
+        frames.append(pd.DataFrame({'day': days[mask], 'mismatched': mismatched[mask]}))
+    if not frames:
+        return pd.DataFrame(columns=['day', 'rows', 'mismatched', 'rate'])
+    grouped = pd.concat(frames, ignore_index=True).groupby('day', sort=True)['mismatched']
+    df = pd.DataFrame({'rows': grouped.size(), 'mismatched': grouped.sum()}).reset_index()
+    df['rate'] = df['mismatched'] / df['rows'] * 100
+    return df
+
+
+def transaction_amounts(tables, start_date=None, end_date=None, points=CHART_POINTS):
+    # Every transaction's amount by date, per side, cut to about points per side
+    series = {}
+    for side, label in SIDE_LABELS.items():
+        table = tables(side)
+        if 'Date' not in table.column_names or 'Amount' not in table.column_names:
+            continue
+        dates = table['Date']
+        if not pa.types.is_timestamp(dates.type):
+            dates = pc.cast(dates, pa.timestamp('ns'))
+        x = dates.to_numpy()
+        y = table['Amount'].to_numpy().astype(float)
+        mask = _window(x.astype('datetime64[D]'), start_date, end_date) & ~np.isnan(y)
+        x, y = x[mask], y[mask]
+        order = np.argsort(x, kind='stable')
+        x, y = x[order], y[order]
+        kept = min_max(y, points)
+        series[label] = (x[kept], y[kept], len(x))
+    return series
+
+
+# ---------------------- Figures ---------------------- #
+def _layout(fig, title, y_title):
+    fig.update_layout(title=title, xaxis_title='Date', yaxis_title=y_title, hovermode='x unified',
+                      margin={'l': 40, 'r': 20, 't': 60, 'b': 40}, legend={'orientation': 'h'})
+    return fig
+
+
+def daily_amounts_figure(df, points=CHART_POINTS):
+    fig = go.Figure()
+    if len(df):
+        days = df['day'].to_numpy()
+        fig.add_trace(_downsampled_line(days, df['difference'].to_numpy(), 'API − Dashboard', points))
+        fig.add_trace(_downsampled_line(days, df['API'].to_numpy(), 'API', points, visible='legendonly'))
+        fig.add_trace(_downsampled_line(days, df['Dashboard'].to_numpy(), 'Dashboard', points,
+                                        visible='legendonly'))
+    return _layout(fig, 'Daily Amount Difference', 'Amount')
+
+
+def mismatch_rate_figure(df, points=CHART_POINTS):
+    fig = go.Figure()
+    if len(df):
+        days = df['day'].to_numpy()
+        kept = lttb(days.astype('datetime64[ns]').astype(np.int64), df['rate'].to_numpy(), points)
+        rows = df.iloc[kept]
+        fig.add_trace(_trace(days[kept], rows['rate'].to_numpy(), 'Mismatch rate',
+                             customdata=rows[['mismatched', 'rows']].to_numpy(),
+                             hovertemplate='%{y:.2f}% (%{customdata[0]:,} of %{customdata[1]:,} rows)'))
+    fig = _layout(fig, 'Mismatch Rate over the Processing Window', 'Rows with a difference (%)')
+    fig.update_yaxes(rangemode='tozero')
+    return fig
+
+
+def transaction_amounts_figure(series):
+    fig = go.Figure()
+    for label, (x, y, total) in series.items():
+        fig.add_trace(_trace(x, y, f"{label} ({len(x):,} of {total:,} shown)", mode='markers',
+                             marker={'size': 3, 'opacity': 0.6}))
+    return _layout(fig, 'Transaction Amounts', 'Amount')
+
+
+def figure_json(name, cube, tables, start_date=None, end_date=None, points=CHART_POINTS):
+    # The chart as Plotly figure JSON. tables(name) returns a stored result frame as an Arrow table.
+    if name == 'daily_amounts':
+        fig = daily_amounts_figure(daily_amounts(cube, start_date, end_date), points)
+    elif name == 'mismatch_rate':
+        fig = mismatch_rate_figure(mismatch_rate(tables, start_date, end_date), points)
+    elif name == 'transaction_amounts':
+        fig = transaction_amounts_figure(transaction_amounts(tables, start_date, end_date, points))
+    else:
+        raise ChartError(f"Unknown chart: {name}")
+    return fig.to_json()
+
+
+def clamp_points(points):
+    if points is None:
+        return CHART_POINTS
+    return min(max(int(points), MIN_CHART_POINTS), MAX_CHART_POINTS)
+
+
+# ---------------------- Figure Cache ---------------------- #
+class FigureCache:
+    # Figure JSON of one processed result, keyed by chart, date window and points.
+    # It lives with the result, so processing again starts with an empty cache.
+
+    def __init__(self, max_entries=FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                return figure
+        figure = build()
+        with self._lock:
+            self._figures[key] = figure
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return figure
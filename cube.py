@@ -0,0 +1,181 @@
+# cube.py
+
+import numpy as np
+import pandas as pd
+
+# ---------------------- Configuration ---------------------- #
+
+# Columns every cube cell is keyed by, besides side and day
+CUBE_DIMENSIONS = ('Status',)
+
+# Further breakdowns added to the cube when a file has the column
+CUBE_OPTIONAL_DIMENSIONS = ('PaymentMethod',)
+
+# Label for rows with no value in a dimension
+UNKNOWN = 'Unknown'
+
+SIDES = ('API', 'Dashboard')
+
+# Day number of rows without a date (NaT as int64)
+NO_DAY = np.iinfo(np.int64).min
+
+# ---------------------- Summary Cube ---------------------- #
+# /process aggregates each side once into cells of (day, Status, ...) with a
+# row count and amount sum, and adds the OrderID totals from the join. The
+# metrics, status tables and charts are all sums over those cells, so the UI
+# gets everything in one response and a new breakdown costs no extra scan.
+#
+#   {'dimensions': ['Status', ...],
+#    'cells': {'side': [...], 'day': ['2024-01-31' or None, ...], 'Status': [...], ..., 'rows': [...], 'amount': [...]},
+#    'orderids': {'common': n, 'uncommon': n, 'api_only': n, 'dashboard_only': n},
+#    'differences': {'amount': n, 'status': n}}
+
+
+def dimensions(df):
+    return list(CUBE_DIMENSIONS) + [column for column in CUBE_OPTIONAL_DIMENSIONS if column in df.columns]
+
+
+def partials(df, days=None):
+    # One pass over a side: row count and amount sum per (day, dimension values).
+    # days: day numbers per row (NO_DAY where missing), or None when there is no Date column.
+    keys = dimensions(df)
+    frame = {'day': days if days is not None else np.zeros(len(df), dtype=np.int64)}
+    for column in keys:
+        frame[column] = df[column].astype('string').fillna(UNKNOWN).to_numpy(dtype=object)
+    frame['Amount'] = df['Amount'].to_numpy(dtype=float, na_value=np.nan)
+    grouped = pd.DataFrame(frame).groupby(['day', *keys], sort=True)
+    result = grouped.size().rename('rows').to_frame()
+    result['amount'] = grouped['Amount'].sum()
+    return result.reset_index()
+
+
+def build(side_partials, has_days, orderids, differences):
+    # side_partials: {'API': partials, 'Dashboard': partials} already limited to the window
+    keys = _dimension_order({column for p in side_partials.values() for column in p.columns} - {'day', 'rows', 'amount'})
+    cells = []
+    for side in SIDES:
+        p = side_partials[side]
+        cell = p.reindex(columns=['day', *keys, 'rows', 'amount'])
+        if has_days[side]:
+            days = p['day'].to_numpy()
+            dates = np.where(days == NO_DAY, None,
+                             pd.to_datetime(np.where(days == NO_DAY, 0, days), unit='D').strftime('%Y-%m-%d'))
+        else:
+            dates = np.full(len(p), None, dtype=object)
+        cells.append(cell.assign(side=side, day=dates))
+    return _cube(keys, pd.concat(cells, ignore_index=True), orderids, differences)
+
+
+def _dimension_order(columns):
+    return sorted(columns, key=lambda column: (column not in CUBE_DIMENSIONS, column))
+
+
+def _cube(keys, cells, orderids, differences):
+    return {
+        'dimensions': keys,
+        'cells': {
+            column: [None if value is None or value != value else value for value in cells[column].tolist()]
+            if column in ('day', *keys) else cells[column].tolist()
+            for column in ('side', 'day', *keys, 'rows', 'amount')
+        },
+        'orderids': orderids,
+        'differences': differences,
+    }
+
+
+def merge(cubes):
+    # One cube from cubes over disjoint sets of OrderIDs (the partitions of an
+    # out-of-core run): cells with the same side, day and dimension values are
+    # summed, and cells come out in the order build() gives them
+    keys = _dimension_order({column for cube in cubes for column in cube['dimensions']})
+    df = pd.concat([cells(cube) for cube in cubes], ignore_index=True).reindex(
+        columns=['side', 'day', *keys, 'rows', 'amount'])
+    df['_side'] = df['side'].map({side: i for i, side in enumerate(SIDES)})
+    # Cells without a day sort first, as NO_DAY does
+    df['_day'] = df['day'].fillna('')
+    merged = df.groupby(['_side', '_day', *keys], dropna=False, sort=True)[['rows', 'amount']].sum().reset_index()
+    merged['side'] = [SIDES[i] for i in merged['_side']]
+    merged['day'] = merged['_day'].replace('', None)
+    merged['rows'] = merged['rows'].astype(np.int64)
+    totals = {}
+    for part in ('orderids', 'differences'):
+        names = cubes[0][part] if cubes else {}
+        totals[part] = {name: sum(cube[part][name] for cube in cubes) for name in names}
+    return _cube(keys, merged, totals['orderids'], totals['differences'])
+
+
+def cells(cube):
+    return pd.DataFrame(cube['cells'])
+
+
+def _side(cube, side):
+    df = cells(cube)
+    return df[df['side'] == side] if len(df) else df
+
+
+def summary(cube):
+    # The Key Metrics, as /summary returns them
+    totals = {}
+    for side in SIDES:
+        df = _side(cube, side)
+        totals[side] = (float(df['amount'].sum()) if len(df) else 0.0, int(df['rows'].sum()) if len(df) else 0)
+    return {
+        'total_amount_api': totals['API'][0],
+        'total_amount_dashboard': totals['Dashboard'][0],
+        'total_amount_difference': totals['API'][0] - totals['Dashboard'][0],
+        'num_transactions_api': totals['API'][1],
+        'num_transactions_dashboard': totals['Dashboard'][1],
+        'num_common_orderids': cube['orderids']['common'],
+        'num_uncommon_orderids': cube['orderids']['uncommon'],
+    }
+
+
+def breakdown(cube, side, by, value='rows'):
+    # Sum of value ('rows' or 'amount') per value of one dimension (or 'day') for one side
+    df = _side(cube, side)
+    if not len(df):
+        return pd.Series(dtype=float if value == 'amount' else np.int64, name=value)
+    return df.groupby(df[by].fillna(UNKNOWN), sort=True)[value].sum()
+
+
+def status_counts(cube):
+    # As /status_counts returns it: most frequent status first
+    result = {}
+    for side in SIDES:
+        counts = breakdown(cube, side, 'Status').sort_values(ascending=False, kind='stable')
+        result[f"status_counts_{side.lower()}"] = {str(status): int(count) for status, count in counts.items()}
+    return result
+
+
+def amount_per_status(cube):
+    # As /total_amount_per_status returns it: statuses in order
+    result = {}
+    for side in SIDES:
+        totals = breakdown(cube, side, 'Status', 'amount')
+        result[f"total_amount_per_status_{side.lower()}"] = [
+            {'Status': str(status), 'Amount': float(amount)} for status, amount in totals.items()
+        ]
+    return result
+
+
+def from_legacy(summary_body, status_counts_body, amount_per_status_body):
+    # A day-less cube rebuilt from the three older endpoints, for backends without /cube
+    columns = {'side': [], 'day': [], 'Status': [], 'rows': [], 'amount': []}
+    for side in SIDES:
+        counts = status_counts_body.get(f"status_counts_{side.lower()}", {})
+        amounts = {item['Status']: item['Amount']
+                   for item in amount_per_status_body.get(f"total_amount_per_status_{side.lower()}", [])}
+        for status in sorted(set(counts) | set(amounts)):
+            columns['side'].append(side)
+            columns['day'].append(None)
+            columns['Status'].append(status)
+            columns['rows'].append(int(counts.get(status, 0)))
+            columns['amount'].append(float(amounts.get(status, 0.0)))
+    uncommon = summary_body.get('num_uncommon_orderids', 0)
+    return {
+        'dimensions': ['Status'],
+        'cells': columns,
+        'orderids': {'common': summary_body.get('num_common_orderids', 0), 'uncommon': uncommon,
+                     'api_only': None, 'dashboard_only': None},
+        'differences': {'amount': None, 'status': None},
+    }
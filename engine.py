@@ -0,0 +1,1264 @@
+# engine.py
+
+import os
+import secrets
+import shutil
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import charts
+import cube as summary_cube
+from cube import NO_DAY
+from export import EXPORT_FORMATS, iter_export
+from index import BATCH_MAX_ORDERIDS, SEARCH_MAX_MATCHES, OrderIDIndex
+from ingest import COLUMN_ALIASES, IngestError, PeakMemory, canonical_name, ingest_files, stream
+from jobs import CANCELLED, FAILED, NO_PROGRESS, JobManager, JobQueueFull
+from matching import MatchingError, amount_mismatch, match_sides, parse_matching
+from sessions import SessionRegistry
+from outofcore import (FILE, ROW, SPILL_DIR, Spill, SpillWriter, conform, estimated_bytes, merge_sorted,
+                       needs_out_of_core, partition_count, partition_of, read_arrow, run_partitions, spill_schema,
+                       unified, with_pandas_metadata, worker_count, write_arrow)
+from store import QueryError, SessionStore
+
+# ---------------------- Column Normalization ---------------------- #
+
+# Column types applied after parsing. Each value is '<type>' or '<type>:<argument>':
+#   OrderID, Status: 'string' or 'category'
+#   Amount: 'float', or 'fixed:<decimals>' to round every amount to that many places
+#   Date: 'datetime', or 'datetime:<strftime format>' to parse with one known format
+DEFAULT_SCHEMA = {'OrderID': 'string', 'Amount': 'float', 'Status': 'string', 'Date': 'datetime'}
+SCHEMA_TYPES = {
+    'OrderID': ('string', 'category'),
+    'Status': ('string', 'category'),
+    'Amount': ('float', 'fixed'),
+    'Date': ('datetime',),
+}
+
+# Relative tolerance below which two amounts are treated as equal
+AMOUNT_TOLERANCE = 1e-9
+
+# Processed frames that are written to the session store instead of kept in memory
+STORED_FRAMES = ('api', 'dashboard', 'amount_differences', 'status_differences', 'uncommon_orderids')
+
+# Added to both sides when a session has more than one file: the file each row came from
+SOURCE_FILE = 'SourceFile'
+
+# 404 details for a session that never existed (or was ended) and one the registry ended
+SESSION_NOT_FOUND = "Session not found"
+SESSION_EXPIRED = "Session expired; please upload the files again"
+
+# Details for share links: one that does not exist (any more), and a change attempted through one
+SHARE_NOT_FOUND = "Share link not found or its session has ended"
+SHARE_READ_ONLY = "This session is shared read-only"
+
+
+class EngineError(Exception):
+    # Raised for invalid requests; status_code mirrors what the HTTP backend returns
+
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def read_tables(files):
+    # Parse [(filename, file_obj)] uploads side by side; returns [(DataFrame, ingest stats)]
+    try:
+        return ingest_files(files)
+    except IngestError as e:
+        raise EngineError(str(e)) from e
+
+
+def read_table(filename, file_obj):
+    # Parse an uploaded csv/xls/xlsx/xlsb buffer; returns (DataFrame, ingest stats)
+    return read_tables([(filename, file_obj)])[0]
+
+
+def parse_schema(schema=None):
+    # Validate a {column: type} schema and fill in the defaults for columns it leaves out
+    merged = dict(DEFAULT_SCHEMA)
+    for column, spec in (schema or {}).items():
+        if column not in SCHEMA_TYPES:
+            raise EngineError(f"Unknown schema column: {column}")
+        kind, _, argument = str(spec).partition(':')
+        if kind not in SCHEMA_TYPES[column]:
+            raise EngineError(f"{column} cannot be read as {kind}")
+        if kind == 'fixed' and not argument.isdigit():
+            raise EngineError("Amount as fixed needs the number of decimals, e.g. fixed:2")
+        merged[column] = str(spec)
+    return merged
+
+
+def _matching_rules(matching=None):
+    try:
+        return parse_matching(matching)
+    except MatchingError as e:
+        raise EngineError(str(e)) from e
+
+
+def _text_column(values, spec):
+    values = values.astype('string').str.strip()
+    return values.astype('category') if spec == 'category' else values
+
+
+def normalize_columns(df, side, schema=DEFAULT_SCHEMA):
+    # Rename known headers to canonical names and coerce them to the schema's types
+    renames = {}
+    for column in df.columns:
+        canonical = canonical_name(column)
+        if canonical and canonical not in renames.values():
+            renames[column] = canonical
+    df = df.rename(columns=renames)
+
+    if 'OrderID' not in df.columns:
+        raise EngineError(f"No OrderID column found in {side} file")
+    df['OrderID'] = _text_column(df['OrderID'], schema['OrderID'])
+    if 'Amount' in df.columns:
+        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce')
+        kind, _, decimals = schema['Amount'].partition(':')
+        if kind == 'fixed':
+            df['Amount'] = df['Amount'].round(int(decimals))
+    else:
+        df['Amount'] = np.nan
+    if 'Status' in df.columns:
+        df['Status'] = _text_column(df['Status'], schema['Status'])
+    else:
+        df['Status'] = pd.NA
+    if 'Date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        # Parsed once here, with the declared format when there is one
+        date_format = schema['Date'].partition(':')[2] or None
+        df['Date'] = pd.to_datetime(df['Date'], format=date_format, errors='coerce')
+    if 'Date' in df.columns:
+        # One resolution whatever the file format, the same as out-of-core partitions store
+        df['Date'] = df['Date'].dt.as_unit('us')
+    return df
+
+
+# ---------------------- Multi-file Sides ---------------------- #
+def file_labels(names):
+    # One label per uploaded file; repeated names get a ' (n)' suffix so every label is unique
+    seen = {}
+    labels = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        labels.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return labels
+
+
+def combine_files(frames, labels, schema=DEFAULT_SCHEMA, source_files=None):
+    # Stack one side's normalized frames in upload order. A row repeated in a later file
+    # (same values in every known column) is dropped there, so overlapping exports count
+    # once; repeats within one file are kept, as they are for a single upload.
+    # source_files: categories of the SourceFile column, or None to leave it out.
+    # Returns (frame, rows dropped).
+    files = np.repeat(np.arange(len(frames)), [len(df) for df in frames])
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+    for column in ('OrderID', 'Status'):
+        # Categories differ per file and concat falls back to object
+        if schema[column] == 'category' and df[column].dtype != 'category':
+            df[column] = df[column].astype('category')
+    dropped = 0
+    if len(frames) > 1 and len(df):
+        # Only OrderIDs present in more than one file can be repeated rows, so the
+        # (slower) comparison of whole rows is limited to those
+        codes, uniques = pd.factorize(df['OrderID'])
+        codes = codes.astype(np.int64) + 1  # 0 for a missing OrderID
+        pairs = pd.unique(codes * len(frames) + files)
+        shared = np.bincount(pairs // len(frames), minlength=len(uniques) + 1)[codes] > 1
+        keep = np.ones(len(df), dtype=bool)
+        if shared.any():
+            candidates = df[shared]
+            keys = [column for column in COLUMN_ALIASES if column in df.columns]
+            first_file = pd.Series(files[shared]).groupby([candidates[column].to_numpy() for column in keys],
+                                                          dropna=False, sort=False).transform('min').to_numpy()
+            keep[shared] = first_file == files[shared]
+        dropped = int(len(df) - keep.sum())
+        if dropped:
+            df = df[keep].reset_index(drop=True)
+            files = files[keep]
+    if source_files is not None:
+        labels = pd.Categorical(labels, categories=source_files)
+        df[SOURCE_FILE] = pd.Categorical.from_codes(labels.codes[files], categories=source_files)
+    return df, dropped
+
+
+def _combined_stats(stats, names, dropped):
+    # One side's parse report: totals over its files (parsed side by side, so the
+    # slowest one is the side's time), plus each file's own report
+    peaks = [s['peak_memory_mb'] for s in stats if s.get('peak_memory_mb') is not None]
+    worker_peaks = [s['worker_peak_memory_mb'] for s in stats if s.get('worker_peak_memory_mb') is not None]
+    return {
+        'format': ','.join(dict.fromkeys(s['format'] for s in stats)),
+        'rows': sum(s['rows'] for s in stats),
+        'columns': max(s['columns'] for s in stats),
+        'sheets': sum(s['sheets'] for s in stats),
+        'seconds': max(s['seconds'] for s in stats),
+        'peak_memory_mb': max(peaks) if peaks else None,
+        'worker_peak_memory_mb': max(worker_peaks) if worker_peaks else None,
+        'files': [{'name': name, **s} for name, s in zip(names, stats)],
+        'duplicates_dropped': dropped,
+    }
+
+
+def filter_by_date(df, start_date, end_date):
+    # Inclusive date window on the Date column; frames without dates pass through
+    if 'Date' not in df.columns or (start_date is None and end_date is None):
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if start_date is not None:
+        mask &= (df['Date'] >= pd.Timestamp(start_date)).to_numpy(dtype=bool, na_value=False)
+    if end_date is not None:
+        mask &= (df['Date'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_numpy(dtype=bool, na_value=False)
+    return df[mask]
+
+
+def date_range(df):
+    if 'Date' not in df.columns or df['Date'].isna().all():
+        return {'min_date': None, 'max_date': None}
+    return {
+        'min_date': df['Date'].min().strftime('%Y-%m-%d'),
+        'max_date': df['Date'].max().strftime('%Y-%m-%d'),
+    }
+
+
+# ---------------------- Reconciliation ---------------------- #
+def reconcile(api, dashboard, progress=NO_PROGRESS, matching=None):
+    # Join both sides on OrderID and compute every frame and aggregate the UI needs;
+    # progress receives the normalize/join/diff/aggregate stages as they run.
+    # matching: rules from parse_matching for tolerant matching, None for exact keys.
+    if matching is not None:
+        with progress.stage('normalize') as stage:
+            stage['rows'] = len(api) + len(dashboard)
+        with progress.stage('join') as stage:
+            merged = match_sides(api, dashboard, matching)
+            both = merged['_merge'].to_numpy() == 'both'
+            common = merged[both]
+            stage['rows'] = len(merged)
+    else:
+        with progress.stage('normalize') as stage:
+            left = _first_rows(api)
+            right = _first_rows(dashboard)
+            stage['rows'] = len(left) + len(right)
+
+        with progress.stage('join') as stage:
+            merged, both, common = _outer_join(left, right)
+            stage['rows'] = len(merged)
+
+    with progress.stage('diff') as stage:
+        amount_differences, status_differences, uncommon = _differences(merged, common, both, matching)
+        stage['rows'] = len(amount_differences) + len(status_differences) + len(uncommon)
+
+    with progress.stage('aggregate') as stage:
+        side_partials = {'API': summary_cube.partials(api, _day_numbers(api)),
+                         'Dashboard': summary_cube.partials(dashboard, _day_numbers(dashboard))}
+        cube = _build_cube(side_partials, {'API': 'Date' in api.columns, 'Dashboard': 'Date' in dashboard.columns},
+                           int(both.sum()), uncommon, amount_differences, status_differences)
+        stage['rows'] = len(api) + len(dashboard)
+
+    return {
+        'api': api.reset_index(drop=True),
+        'dashboard': dashboard.reset_index(drop=True),
+        'amount_differences': amount_differences.reset_index(drop=True),
+        'status_differences': status_differences.reset_index(drop=True),
+        'uncommon_orderids': uncommon.reset_index(drop=True),
+        'cube': cube,
+    }
+
+
+def _compared_columns(df):
+    # The columns the comparison needs, and the source file for the uncommon report
+    return ['OrderID', 'Amount', 'Status'] + ([SOURCE_FILE] if SOURCE_FILE in df.columns else [])
+
+
+def _first_rows(df):
+    # One row per OrderID (the first), with the columns the comparison needs
+    return df.drop_duplicates('OrderID')[_compared_columns(df)]
+
+
+def _outer_join(left, right):
+    merged = left.merge(right, on='OrderID', how='outer', suffixes=('_API', '_Dashboard'), indicator=True)
+    both = merged['_merge'].to_numpy() == 'both'
+    return merged, both, merged[both]
+
+
+def _amount_mismatch(amount_api, amount_dashboard, matching=None):
+    if matching is not None:
+        return amount_mismatch(amount_api, amount_dashboard, matching)
+    return ~np.isclose(amount_api, amount_dashboard, rtol=AMOUNT_TOLERANCE, atol=0, equal_nan=True)
+
+
+def _differences(merged, common, both, matching=None):
+    # Amount mismatches, status mismatches and OrderIDs found on one side only.
+    # Tolerant matching pairs OrderIDs that may be written differently, so both are shown.
+    ids = ['OrderID', 'OrderID_Dashboard'] if 'OrderID_Dashboard' in merged.columns else ['OrderID']
+    amount_api = common['Amount_API'].to_numpy(dtype=float, na_value=np.nan)
+    amount_dashboard = common['Amount_Dashboard'].to_numpy(dtype=float, na_value=np.nan)
+    amount_mismatch = _amount_mismatch(amount_api, amount_dashboard, matching)
+    amount_differences = common.loc[amount_mismatch, [*ids, 'Amount_API', 'Amount_Dashboard']].copy()
+    amount_differences['Difference'] = amount_differences['Amount_API'] - amount_differences['Amount_Dashboard']
+
+    status_api = common['Status_API'].astype('string').fillna('').to_numpy(dtype=object)
+    status_dashboard = common['Status_Dashboard'].astype('string').fillna('').to_numpy(dtype=object)
+    status_mismatch = status_api != status_dashboard
+    status_differences = common.loc[status_mismatch, [*ids, 'Status_API', 'Status_Dashboard']].copy()
+
+    uncommon = _uncommon(merged, ~both, merged['_merge'].to_numpy()[~both] == 'left_only')
+    return amount_differences, status_differences, uncommon
+
+
+def _uncommon(merged, rows, from_api):
+    # OrderIDs of the rows found on one side only; from_api says, per row, which side that is
+    uncommon = merged.loc[rows, ['OrderID']].assign(Source=np.where(from_api, 'API', 'Dashboard'))
+    if f"{SOURCE_FILE}_API" in merged.columns:
+        uncommon[SOURCE_FILE] = merged.loc[rows, f"{SOURCE_FILE}_API"].where(
+            from_api, merged.loc[rows, f"{SOURCE_FILE}_Dashboard"])
+    return uncommon
+
+
+def _build_cube(side_partials, has_days, num_common, uncommon, amount_differences, status_differences):
+    api_only = int((uncommon['Source'] == 'API').sum())
+    return summary_cube.build(
+        side_partials, has_days,
+        orderids={'common': num_common, 'uncommon': int(len(uncommon)),
+                  'api_only': api_only, 'dashboard_only': int(len(uncommon)) - api_only},
+        differences={'amount': int(len(amount_differences)), 'status': int(len(status_differences))},
+    )
+
+
+def to_records(df):
+    # JSON-friendly records: timestamps as ISO strings, missing values as None
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
+
+def reconcile_window(api, dashboard, start_date, end_date, progress=NO_PROGRESS, matching=None):
+    # The full path: select the window's rows, then reconcile them from scratch
+    with progress.stage('parse') as stage:
+        api = filter_by_date(api, start_date, end_date)
+        dashboard = filter_by_date(dashboard, start_date, end_date)
+        stage['rows'] = len(api) + len(dashboard)
+    return reconcile(api, dashboard, progress, matching)
+
+
+# ---------------------- Per-date Partitions ---------------------- #
+def _day_numbers(df):
+    # Days since the epoch for each row, NO_DAY where the date is missing; None without a Date column
+    if 'Date' not in df.columns:
+        return None
+    return df['Date'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+
+
+def _window_days(start_date, end_date):
+    # (first day, last day) of the window, or None when a bound is not a whole day
+    bounds = []
+    for value in (start_date, end_date):
+        if value is None:
+            bounds.append(None)
+            continue
+        timestamp = pd.Timestamp(value)
+        if timestamp != timestamp.normalize():
+            return None
+        bounds.append(int(timestamp.to_datetime64().astype('datetime64[D]').astype(np.int64)))
+    return tuple(bounds)
+
+
+def _in_window(days, first_day, last_day):
+    # Same rule as filter_by_date: rows without a date only pass when there are no bounds
+    if first_day is None and last_day is None:
+        return np.ones(len(days), dtype=bool)
+    mask = days != NO_DAY
+    if first_day is not None:
+        mask &= days >= first_day
+    if last_day is not None:
+        mask &= days <= last_day
+    return mask
+
+
+class DatePartitions:
+    # Built once per upload so a new date window only re-aggregates what it covers:
+    #  - each side is indexed by day, so the window's rows are a range lookup;
+    #  - counts and amounts are pre-summed per (day, status);
+    #  - OrderIDs found at most once on each side are joined once, up front, and a
+    #    window only masks that join by the day of each side's row;
+    #  - OrderIDs that are duplicated or missing depend on which duplicate falls in
+    #    the window, so their (few) rows go through the full reconciliation.
+
+    def __init__(self, api, dashboard):
+        self.sides = {'API': self._index_side(api), 'Dashboard': self._index_side(dashboard)}
+        api_counts = api['OrderID'].value_counts()
+        dashboard_counts = dashboard['OrderID'].value_counts()
+        repeated = set(api_counts.index[api_counts.to_numpy() > 1]) | set(dashboard_counts.index[dashboard_counts.to_numpy() > 1])
+        for side, df in (('API', api), ('Dashboard', dashboard)):
+            unstable = df['OrderID'].isna().to_numpy() | df['OrderID'].isin(repeated).to_numpy()
+            self.sides[side]['unstable'] = np.flatnonzero(unstable)
+            self.sides[side]['stable'] = np.flatnonzero(~unstable)
+        self.join = self._stable_join()
+
+    def nbytes(self):
+        # Memory held beyond the frames themselves
+        arrays = [value for info in self.sides.values() for value in info.values() if isinstance(value, np.ndarray)]
+        arrays += [value for value in self.join.values() if isinstance(value, np.ndarray)]
+        frames = [self.join['frame']] + [info['partials'] for info in self.sides.values()]
+        return int(sum(a.nbytes for a in arrays) + sum(df.memory_usage(index=False, deep=True).sum() for df in frames))
+
+    @staticmethod
+    def _index_side(df):
+        days = _day_numbers(df)
+        side = {'frame': df, 'days': days}
+        if days is not None:
+            side['order'] = np.argsort(days, kind='stable')
+            side['sorted_days'] = days[side['order']]
+        side['partials'] = summary_cube.partials(df, days)
+        return side
+
+    def _stable_join(self):
+        frames = []
+        for side in ('API', 'Dashboard'):
+            info = self.sides[side]
+            df = info['frame'].iloc[info['stable']][_compared_columns(info['frame'])]
+            days = info['days'][info['stable']] if info['days'] is not None else np.zeros(len(df), dtype=np.int64)
+            frames.append(df.assign(Day=days))
+        merged, both, _ = _outer_join(*frames)
+        flag = merged['_merge'].to_numpy()
+        join = {
+            'frame': merged,
+            'has_api': flag != 'right_only',
+            'has_dashboard': flag != 'left_only',
+            'day_api': merged['Day_API'].fillna(NO_DAY).to_numpy(dtype=np.int64),
+            'day_dashboard': merged['Day_Dashboard'].fillna(NO_DAY).to_numpy(dtype=np.int64),
+        }
+        amount_api = merged['Amount_API'].to_numpy(dtype=float, na_value=np.nan)
+        amount_dashboard = merged['Amount_Dashboard'].to_numpy(dtype=float, na_value=np.nan)
+        join['amount_mismatch'] = _amount_mismatch(amount_api, amount_dashboard)
+        status_api = merged['Status_API'].astype('string').fillna('').to_numpy(dtype=object)
+        status_dashboard = merged['Status_Dashboard'].astype('string').fillna('').to_numpy(dtype=object)
+        join['status_mismatch'] = status_api != status_dashboard
+        return join
+
+    def _window_rows(self, side, first_day, last_day):
+        # Row positions of the side inside the window, in file order
+        info = self.sides[side]
+        if info['days'] is None or (first_day is None and last_day is None):
+            return np.arange(len(info['frame']))
+        low = np.searchsorted(info['sorted_days'], NO_DAY + 1 if first_day is None else first_day, side='left')
+        high = len(info['sorted_days']) if last_day is None else np.searchsorted(info['sorted_days'], last_day, side='right')
+        return np.sort(info['order'][low:high])
+
+    def _side_in_window(self, side, days, first_day, last_day):
+        if self.sides[side]['days'] is None:
+            return np.ones(len(days), dtype=bool)
+        return _in_window(days, first_day, last_day)
+
+    def _window_partials(self, side, first_day, last_day):
+        partials = self.sides[side]['partials']
+        if self.sides[side]['days'] is None:
+            return partials
+        return partials[_in_window(partials['day'].to_numpy(), first_day, last_day)]
+
+    def reconcile(self, start_date, end_date, progress=NO_PROGRESS):
+        # Same frames and aggregates as reconcile(filter_by_date(...)) for whole-day windows
+        window = _window_days(start_date, end_date)
+        if window is None:
+            return reconcile_window(self.sides['API']['frame'], self.sides['Dashboard']['frame'],
+                                    start_date, end_date, progress)
+        first_day, last_day = window
+
+        with progress.stage('parse') as stage:
+            rows = {side: self._window_rows(side, first_day, last_day) for side in self.sides}
+            api = self.sides['API']['frame'].iloc[rows['API']]
+            dashboard = self.sides['Dashboard']['frame'].iloc[rows['Dashboard']]
+            stage['rows'] = len(api) + len(dashboard)
+
+        with progress.stage('normalize') as stage:
+            # Only the duplicated/missing OrderIDs need deduplicating per window
+            unstable = {}
+            for side in self.sides:
+                info = self.sides[side]
+                positions = info['unstable']
+                if info['days'] is not None:
+                    positions = positions[_in_window(info['days'][positions], first_day, last_day)]
+                unstable[side] = _first_rows(info['frame'].iloc[positions])
+            stage['rows'] = len(unstable['API']) + len(unstable['Dashboard'])
+
+        with progress.stage('join') as stage:
+            join = self.join
+            api_in = join['has_api'] & self._side_in_window('API', join['day_api'], first_day, last_day)
+            dashboard_in = join['has_dashboard'] & self._side_in_window('Dashboard', join['day_dashboard'],
+                                                                         first_day, last_day)
+            both = api_in & dashboard_in
+            merged_unstable, both_unstable, common_unstable = _outer_join(unstable['API'], unstable['Dashboard'])
+            stage['rows'] = int((api_in | dashboard_in).sum()) + len(merged_unstable)
+
+        with progress.stage('diff') as stage:
+            frame = join['frame']
+            amount_differences = frame.loc[both & join['amount_mismatch'], ['OrderID', 'Amount_API', 'Amount_Dashboard']]
+            amount_differences = amount_differences.assign(
+                Difference=amount_differences['Amount_API'] - amount_differences['Amount_Dashboard'])
+            status_differences = frame.loc[both & join['status_mismatch'], ['OrderID', 'Status_API', 'Status_Dashboard']]
+            one_side = api_in ^ dashboard_in
+            uncommon = _uncommon(frame, one_side, api_in[one_side])
+            if len(merged_unstable):
+                extra = _differences(merged_unstable, common_unstable, both_unstable)
+                amount_differences, status_differences, uncommon = [
+                    pd.concat([stable, more], ignore_index=True).sort_values('OrderID', kind='stable')
+                    for stable, more in zip((amount_differences, status_differences, uncommon), extra)
+                ]
+            stage['rows'] = len(amount_differences) + len(status_differences) + len(uncommon)
+
+        with progress.stage('aggregate') as stage:
+            side_partials = {side: self._window_partials(side, first_day, last_day) for side in self.sides}
+            cube = _build_cube(side_partials, {side: info['days'] is not None for side, info in self.sides.items()},
+                               int(both.sum()) + int(both_unstable.sum()), uncommon,
+                               amount_differences, status_differences)
+            stage['rows'] = len(self.sides['API']['partials']) + len(self.sides['Dashboard']['partials'])
+
+        return {
+            'api': api.reset_index(drop=True),
+            'dashboard': dashboard.reset_index(drop=True),
+            'amount_differences': amount_differences.reset_index(drop=True),
+            'status_differences': status_differences.reset_index(drop=True),
+            'uncommon_orderids': uncommon.reset_index(drop=True),
+            'cube': cube,
+        }
+
+
+# ---------------------- Out-of-core Sessions ---------------------- #
+# Uploads too large for memory are streamed batch by batch into per-OrderID-hash
+# partition files (outofcore.py) instead of being held as DataFrames. A run
+# reconciles every partition on its own, in worker processes, with the same
+# reconcile() as an in-memory session; the partition cubes are merged and the
+# partition frames are merged back into OrderID (or upload) order as they are
+# written to the store.
+
+def _stream_side(files, label, schema):
+    # (normalized columns of the whole side, [(filename, raw header, batches)]) for a side's files
+    streams = []
+    columns = []
+    for filename, file_obj in files:
+        try:
+            headers, batches = stream(filename, file_obj)
+        except IngestError as e:
+            raise EngineError(str(e)) from e
+        # Sheets are stacked before normalizing, as ingest() does
+        header = list(dict.fromkeys(name for sheet_header in headers for name in sheet_header))
+        name = f"{label} ({filename})" if len(files) > 1 else label
+        normalized = normalize_columns(pd.DataFrame(columns=header), name, schema)
+        columns.extend(column for column in normalized.columns if column not in columns)
+        streams.append((filename, name, header, batches))
+    return columns, streams
+
+
+def _spill_side(writer, streams, schema):
+    # Normalizes every batch against its file's full header and appends it to the partitions
+    stats = []
+    for file_index, (filename, name, header, batches) in enumerate(streams):
+        rows = 0
+        started = pd.Timestamp.now()
+        with PeakMemory() as memory:
+            try:
+                for batch in batches:
+                    df = normalize_columns(batch.reindex(columns=header), name, schema)
+                    writer.write(df, file_index)
+                    rows += len(df)
+            except IngestError as e:
+                raise EngineError(str(e)) from e
+        stats.append({
+            'format': os.path.splitext(filename)[1].lower().lstrip('.'),
+            'rows': rows,
+            'columns': len(header),
+            'sheets': 1,
+            'seconds': round((pd.Timestamp.now() - started).total_seconds(), 3),
+            'peak_memory_mb': memory.megabytes(),
+            'worker_peak_memory_mb': None,
+        })
+    return stats
+
+
+def _spilled_frame(path, source_files=None):
+    # A partition with the dtypes an in-memory session has: text as normalize_columns()
+    # leaves it and, for multi-file sessions, SourceFile over every file's label
+    df = read_arrow(path).to_pandas().drop(columns=[FILE], errors='ignore')
+    for column in df.columns:
+        if column == SOURCE_FILE and source_files is not None:
+            df[column] = pd.Categorical(df[column], categories=source_files)
+        elif pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype('string')
+    return df
+
+
+def _combine_partition(task):
+    # Worker: drops rows repeated across files in one partition and labels every row
+    # with its file. Equal rows have equal OrderIDs, so no other partition is needed.
+    path, labels, source_files = task
+    table = read_arrow(path)
+    df = table.to_pandas()
+    files = df[FILE].to_numpy()
+    # FILE is not one of the compared columns, so it stays with the rows that are kept
+    frames = [df[files == i] for i in range(len(labels))]
+    df, dropped = combine_files(frames, labels, DEFAULT_SCHEMA, source_files)
+    # combine_files stacks file after file; partitions stay in upload order
+    df = df.sort_values(ROW, kind='stable')
+    # Written back in the spill schema (plain string text, FILE kept) so every partition
+    # of both sides reads back with the same types
+    columns = [name for name in table.column_names if name not in (ROW, FILE, SOURCE_FILE)]
+    write_arrow(path, conform(df, spill_schema(columns + [SOURCE_FILE])))
+    return dropped
+
+
+def _reconcile_partition(task):
+    # Worker: reconciles one partition exactly as reconcile_window() does a whole
+    # in-memory session, and writes its frames next to the other partitions'
+    api_path, dashboard_path, out_dir, partition, start_date, end_date, source_files = task
+    with PeakMemory() as memory:
+        api = filter_by_date(_spilled_frame(api_path, source_files), start_date, end_date)
+        dashboard = filter_by_date(_spilled_frame(dashboard_path, source_files), start_date, end_date)
+        results = reconcile(api, dashboard)
+        for name in STORED_FRAMES:
+            write_arrow(os.path.join(out_dir, f"{name}-{partition:04d}.arrow"),
+                        pa.Table.from_pandas(results[name], preserve_index=False))
+    return {'cube': results['cube'], 'rows': len(api) + len(dashboard), 'peak_memory': memory.peak}
+
+
+def _spilled_date_range(info):
+    if info['min_date'] is None:
+        return {'min_date': None, 'max_date': None}
+    return {'min_date': info['min_date'].strftime('%Y-%m-%d'), 'max_date': info['max_date'].strftime('%Y-%m-%d')}
+
+
+def _spilled_rows(spill, side, partitions, condition, limit=None):
+    # Rows of a spilled side, in upload order, where condition(table) holds; only the
+    # given partitions are read. With a limit, only the first rows in upload order.
+    tables = []
+    for partition in partitions:
+        table = spill.read(side, partition)
+        table = table.filter(pc.fill_null(condition(table), False)).sort_by(ROW)
+        tables.append(table if limit is None else table.slice(0, limit))
+    tables, _ = unified(tables)
+    table = pa.concat_tables(tables).sort_by(ROW)
+    if limit is not None:
+        table = table.slice(0, limit)
+    return table.drop_columns([c for c in (ROW, FILE) if c in table.column_names])
+
+
+def _stored_frame(name, version):
+    # Store name of one processed frame of one run: each run writes its own, so a run
+    # never overwrites the frames readers of the previous results are paging through
+    return f"{name}.v{version}"
+
+
+# ---------------------- Engine ---------------------- #
+class ReconciliationEngine:
+    # In-process equivalent of the FastAPI backend; one instance serves many sessions
+
+    # Page endpoints and the processed frame each one reads
+    PAGE_ENDPOINTS = {
+        'get_dataframe_api': 'api',
+        'get_dataframe_dashboard': 'dashboard',
+        'get_amount_differences': 'amount_differences',
+        'get_status_differences': 'status_differences',
+        'get_uncommon_orderids': 'uncommon_orderids',
+    }
+
+    # Downloadable reports and the processed frame each one exports
+    REPORTS = {
+        'amount_differences': 'amount_differences',
+        'status_differences': 'status_differences',
+        'uncommon_orderids': 'uncommon_orderids',
+    }
+
+    def __init__(self, store=None, registry_options=None):
+        # registry_options: overrides for the SessionRegistry's TTL and budgets
+        self.store = store or SessionStore()
+        self.jobs = JobManager()
+        # Share token -> the session it opens read-only
+        self._shares = {}
+        self._shares_lock = threading.Lock()
+        self.sessions = SessionRegistry(self._session_bytes, self._spill_session, self._free_session,
+                                        self._session_busy, **(registry_options or {}))
+
+    # ---------------------- Session State ---------------------- #
+    # Sessions live in a SessionRegistry (sessions.py) that ends idle ones and,
+    # when memory runs short, spills the uploaded frames of the least recently
+    # used ones to the store. A spilled session is loaded back on its next use.
+
+    def _add_session(self, session_id=None, owner=None, **fields):
+        session_id = session_id or uuid.uuid4().hex
+        # Owner of the session's jobs: the user who uploaded it, so the per-user job limits
+        # hold across all of that user's sessions. Without one, the session itself.
+        session = {'results': None, 'spilled': False, 'process_lock': threading.Lock(),
+                   'index_lock': threading.Lock(), 'state_lock': threading.Lock(), 'owner': owner or session_id,
+                   **fields}
+        self.sessions.add(session_id, session)
+        return session_id
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            if self.sessions.expired(session_id):
+                raise EngineError(SESSION_EXPIRED, status_code=404)
+            raise EngineError(SESSION_NOT_FOUND, status_code=404)
+        return session
+
+    def _frames(self, session_id, session):
+        # The uploaded frames of the session, loaded back first if it was spilled
+        with session['state_lock']:
+            if not session['spilled']:
+                return {'api': session['api'], 'dashboard': session['dashboard']}
+            for side in ('api', 'dashboard'):
+                # Arrow does not keep every pandas dtype (string NA semantics, datetime unit)
+                df = self.store.read(session_id, f"uploaded_{side}")
+                session[side] = df.astype(session['dtypes'][side].to_dict())
+            session['spilled'] = False
+            frames = {'api': session['api'], 'dashboard': session['dashboard']}
+        self.sessions.resize(session_id)
+        return frames
+
+    def _session_bytes(self, session_id, session):
+        # (bytes held in memory, bytes on disk) by one session
+        memory = 0
+        for side in ('api', 'dashboard'):
+            df = session.get(side)
+            if df is not None:
+                memory += int(df.memory_usage(index=False, deep=True).sum())
+        if session.get('partitions') is not None:
+            memory += session['partitions'].nbytes()
+        for index in (session.get('orderid_indexes') or {}).values():
+            memory += index.nbytes()
+        disk = self.store.nbytes(session_id)
+        if 'spill' in session:
+            disk += session['spill'].nbytes()
+        return memory, disk
+
+    def _spill_session(self, session_id, session):
+        # Moves the uploaded frames to the store and drops what is derived from them;
+        # sessions being processed or searched are skipped
+        if 'spill' in session or not session['process_lock'].acquire(blocking=False):
+            return False
+        try:
+            if not session['index_lock'].acquire(blocking=False):
+                return False
+            try:
+                with session['state_lock']:
+                    if session['spilled']:
+                        return False
+                    for side in ('api', 'dashboard'):
+                        # Uploaded frames never change, so a file from an earlier spill is still good
+                        if not self.store.exists(session_id, f"uploaded_{side}"):
+                            self.store.write(session_id, f"uploaded_{side}", session[side])
+                    session['dtypes'] = {side: session[side].dtypes for side in ('api', 'dashboard')}
+                    session.update(api=None, dashboard=None, partitions=None, orderid_indexes=None, spilled=True)
+                return True
+            finally:
+                session['index_lock'].release()
+        finally:
+            session['process_lock'].release()
+
+    @staticmethod
+    def _session_busy(session):
+        return session['process_lock'].locked()
+
+    def _free_session(self, session_id, session):
+        self.jobs.cancel_session(session_id)
+        with self._shares_lock:
+            self._shares.pop(session.get('share_token'), None)
+        self.store.delete(session_id)
+        if 'spill' in session:
+            session['spill'].delete()
+
+    def sessions_report(self):
+        # Live sessions with their sizes, for the admin endpoint
+        report = self.sessions.report()
+        for entry in report['sessions']:
+            session = self.sessions.peek(entry['session_id'])
+            if session is not None:
+                entry.update(out_of_core='spill' in session, spilled=session['spilled'],
+                             processed=session['results'] is not None)
+        return report
+
+    def _results(self, session_id):
+        results = self._session(session_id).get('results')
+        if results is None:
+            raise EngineError("Data has not been processed for this session")
+        return results
+
+    def upload(self, api_name, api_file, dashboard_name, dashboard_file, schema=None, owner=None):
+        return self.upload_files([(api_name, api_file)], [(dashboard_name, dashboard_file)], schema=schema,
+                                 owner=owner)
+
+    def upload_files(self, api_files, dashboard_files, schema=None, out_of_core=None, owner=None):
+        # api_files, dashboard_files: [(filename, file_obj)], one or more per side.
+        # Every file of both sides is parsed in parallel and each side is reconciled as one set.
+        # out_of_core: True/False to force either mode; None decides from the upload's size.
+        # owner: the user uploading, whose job limits the session's runs count against.
+        schema = parse_schema(schema)
+        if not api_files or not dashboard_files:
+            raise EngineError("At least one API and one Dashboard file are needed")
+        estimate = estimated_bytes(list(api_files) + list(dashboard_files))
+        if out_of_core or (out_of_core is None and needs_out_of_core(estimate)):
+            return self._upload_out_of_core(api_files, dashboard_files, schema, estimate, owner)
+        sides = {'api': ('API', api_files), 'dashboard': ('Dashboard', dashboard_files)}
+        parsed = read_tables(list(api_files) + list(dashboard_files))
+        labels = {side: file_labels([name for name, _ in files]) for side, (_, files) in sides.items()}
+        # Single-file sessions keep their original columns
+        source_files = None
+        if len(api_files) + len(dashboard_files) > 2:
+            source_files = list(dict.fromkeys(labels['api'] + labels['dashboard']))
+
+        combined = {}
+        stats = {}
+        for side, (name, files) in sides.items():
+            side_parsed, parsed = parsed[:len(files)], parsed[len(files):]
+            frames = [normalize_columns(df, f"{name} ({filename})" if len(files) > 1 else name, schema)
+                      for (filename, _), (df, _) in zip(files, side_parsed)]
+            combined[side], dropped = combine_files(frames, labels[side], schema, source_files)
+            stats[f"{side}_file"] = _combined_stats([s for _, s in side_parsed], labels[side], dropped)
+        session_id = self._add_session(owner=owner, **combined)
+        return {'session_id': session_id, 'ingest': stats}
+
+    def _upload_out_of_core(self, api_files, dashboard_files, schema, estimate, owner):
+        # Streams every file into the session's partition files; nothing is held whole
+        session_id = uuid.uuid4().hex
+        spill = Spill(os.path.join(SPILL_DIR, session_id), partition_count(estimate))
+        sides = {'api': ('API', api_files), 'dashboard': ('Dashboard', dashboard_files)}
+        labels = {side: file_labels([name for name, _ in files]) for side, (_, files) in sides.items()}
+        source_files = None
+        if len(api_files) + len(dashboard_files) > 2:
+            source_files = list(dict.fromkeys(labels['api'] + labels['dashboard']))
+        stats = {}
+        try:
+            for side, (name, files) in sides.items():
+                columns, streams = _stream_side(files, name, schema)
+                writer = SpillWriter(spill, side, columns)
+                try:
+                    side_stats = _spill_side(writer, streams, schema)
+                finally:
+                    writer.close()
+                dropped = 0
+                if source_files is not None:
+                    tasks = [(spill.path(side, p), labels[side], source_files) for p in range(spill.partitions)]
+                    workers = worker_count([spill.partition_bytes(p) for p in range(spill.partitions)])
+                    dropped = sum(run_partitions(_combine_partition, tasks, workers))
+                    spill.sides[side]['schema'] = spill.read(side, 0).schema
+                stats[f"{side}_file"] = _combined_stats(side_stats, labels[side], dropped)
+        except BaseException:
+            spill.delete()
+            raise
+        spill.source_files = source_files
+        stats['out_of_core'] = {'partitions': spill.partitions, 'spill_mb': round(spill.nbytes() / 2 ** 20, 1)}
+        self._add_session(session_id, owner=owner, spill=spill)
+        return {'session_id': session_id, 'ingest': stats}
+
+    def results_version(self, session_id):
+        # Counts the runs that replaced the session's results; readers that cache results
+        # (shared viewers in particular) compare it to see that theirs are out of date
+        session_id = self._resolve(session_id)
+        return {'version': (self._session(session_id)['results'] or {}).get('version', 0)}
+
+    def get_date_range(self, session_id):
+        session_id = self._resolve(session_id)
+        session = self._session(session_id)
+        if 'spill' in session:
+            return {
+                'date_range_api': _spilled_date_range(session['spill'].sides['api']),
+                'date_range_dashboard': _spilled_date_range(session['spill'].sides['dashboard']),
+            }
+        frames = self._frames(session_id, session)
+        return {
+            'date_range_api': date_range(frames['api']),
+            'date_range_dashboard': date_range(frames['dashboard']),
+        }
+
+    def process(self, session_id, start_date=None, end_date=None, matching=None):
+        # matching: optional tolerant matching rules (see matching.DEFAULT_MATCHING).
+        # Runs as a job and waits for it, so blocking callers queue under the same
+        # per-user limits as start_process() instead of running beside them.
+        job = self._submit_process(session_id, start_date, end_date, matching)
+        job.wait()
+        if job.state == FAILED:
+            raise job.exception
+        if job.state == CANCELLED:
+            raise EngineError("Processing was cancelled by a newer run of this session", status_code=409)
+        return job.result
+
+    def _process(self, session_id, start_date, end_date, progress=NO_PROGRESS, matching=None):
+        session_id = self._resolve(session_id, write=True)
+        session = self._session(session_id)
+        matching = _matching_rules(matching)
+        if 'spill' in session:
+            if matching is not None:
+                raise EngineError("Tolerant matching is not available for out-of-core sessions")
+            return self._process_out_of_core(session_id, session, start_date, end_date, progress)
+        # One run per session at a time; a superseded job gives up at its next stage
+        with session['process_lock']:
+            # Files are parsed at upload; the first exact run indexes them by date so later
+            # date windows reuse that work (the 'parse' stage selects the window's rows).
+            # Tolerant matching pairs rows differently, so it always takes the full path.
+            frames = self._frames(session_id, session)
+            with progress.stage('index') as stage:
+                if matching is None and session.get('partitions') is None:
+                    session['partitions'] = DatePartitions(frames['api'], frames['dashboard'])
+                    stage['rows'] = len(frames['api']) + len(frames['dashboard'])
+                else:
+                    stage['rows'] = 0
+            if matching is None:
+                results = session['partitions'].reconcile(start_date, end_date, progress)
+            else:
+                results = reconcile_window(frames['api'], frames['dashboard'], start_date, end_date,
+                                           progress, matching)
+            # Frames go to the columnar store once; pages are sliced from it afterwards.
+            # Until this point a cancelled run leaves the previous results untouched.
+            version = self._next_version(session)
+            with progress.stage('write') as stage:
+                stage['rows'] = sum(self.store.write(session_id, _stored_frame(name, version), results.pop(name))
+                                    for name in STORED_FRAMES)
+            self._swap_results(session_id, session, {**results, 'version': version})
+        self.sessions.resize(session_id)
+        return {'message': 'Data processed successfully', **summary_cube.summary(results['cube'])}
+
+    def _process_out_of_core(self, session_id, session, start_date, end_date, progress):
+        # Every partition is reconciled on its own, side by side in worker processes as
+        # many as fit in the memory limit; the partition cubes are summed and the frames
+        # merged into one ordered frame each as they are written to the store
+        spill = session['spill']
+        with session['process_lock']:
+            for name in ('index', 'parse', 'normalize'):
+                # Done when the files were spilled
+                with progress.stage(name) as stage:
+                    stage['rows'] = 0
+            out_dir = spill.output_dir()
+            version = self._next_version(session)
+            try:
+                with progress.stage('join') as stage:
+                    workers = worker_count([spill.partition_bytes(p) for p in range(spill.partitions)])
+                    tasks = [(spill.path('api', p), spill.path('dashboard', p), out_dir, p, start_date, end_date,
+                              spill.source_files) for p in range(spill.partitions)]
+                    with PeakMemory() as memory:
+                        partials = run_partitions(_reconcile_partition, tasks, workers, progress.check_cancelled)
+                    stage['rows'] = sum(partial['rows'] for partial in partials)
+                with progress.stage('diff') as stage:
+                    stage['rows'] = sum(partial['cube']['differences']['amount'] + partial['cube']['differences']['status']
+                                        + partial['cube']['orderids']['uncommon'] for partial in partials)
+                with progress.stage('aggregate') as stage:
+                    cube = summary_cube.merge([partial['cube'] for partial in partials])
+                    stage['rows'] = len(partials)
+                with progress.stage('write') as stage:
+                    stage['rows'] = sum(self._write_partitions(session_id, name, version, out_dir, spill.partitions)
+                                        for name in STORED_FRAMES)
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+            self._swap_results(session_id, session, {'cube': cube, 'version': version})
+        self.sessions.resize(session_id)
+        worker_peaks = [partial['peak_memory'] for partial in partials if partial['peak_memory']]
+        return {
+            'message': 'Data processed successfully',
+            **summary_cube.summary(cube),
+            'out_of_core': {
+                'partitions': spill.partitions,
+                'workers': workers,
+                'peak_memory_mb': memory.megabytes(),
+                'worker_peak_memory_mb': round(max(worker_peaks) / 2 ** 20, 1) if worker_peaks else None,
+            },
+        }
+
+    @staticmethod
+    def _next_version(session):
+        # Version of the run about to replace the session's results (under its process_lock)
+        return (session['results'] or {}).get('version', 0) + 1
+
+    def _swap_results(self, session_id, session, results):
+        # The new frames were written under their own version's names, so readers holding
+        # the previous results keep reading whole previous frames; one assignment then
+        # moves readers to the new frames and version together. The frames of the run
+        # before the previous one go, by which time no read can still be using them.
+        session['results'] = results
+        for name in STORED_FRAMES:
+            self.store.remove(session_id, _stored_frame(name, results['version'] - 2))
+
+    def _write_partitions(self, session_id, name, version, out_dir, partitions):
+        # The sides come back in upload order, the reports in OrderID order, as in memory
+        outputs = [read_arrow(os.path.join(out_dir, f"{name}-{p:04d}.arrow")) for p in range(partitions)]
+        tables, schema = unified(outputs)
+        key = ROW if name in ('api', 'dashboard') else 'OrderID'
+        batches = merge_sorted(tables, key)
+        if key == ROW:
+            schema = schema.remove(schema.get_field_index(ROW))
+            batches = (batch.drop_columns([ROW]) for batch in batches)
+        schema = with_pandas_metadata(schema, outputs[0].schema)
+        return self.store.write_batches(session_id, _stored_frame(name, version), schema, batches)
+
+    # ---------------------- Background Jobs ---------------------- #
+    def start_process(self, session_id, start_date=None, end_date=None, matching=None):
+        # Runs the processing as a job and returns its first snapshot right away
+        return self._submit_process(session_id, start_date, end_date, matching).to_dict()
+
+    def _submit_process(self, session_id, start_date, end_date, matching):
+        # Jobs are queued and limited per session owner (see jobs.JobManager), recorded when
+        # the session was uploaded; a run cannot name one, so no one gets a fresh queue by
+        # asking for it
+        session_id = self._resolve(session_id, write=True)
+        session = self._session(session_id)
+        _matching_rules(matching)
+        try:
+            return self.jobs.submit(
+                session_id,
+                lambda job: self._process(session_id, start_date, end_date, progress=job, matching=matching),
+                params={'start_date': start_date, 'end_date': end_date, 'matching': matching},
+                owner=session['owner'],
+            )
+        except JobQueueFull as e:
+            raise EngineError(str(e), status_code=429) from e
+
+    def job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise EngineError("Job not found", status_code=404)
+        return job.to_dict()
+
+    def cancel_job(self, job_id):
+        job = self.jobs.cancel(job_id)
+        if job is None:
+            raise EngineError("Job not found", status_code=404)
+        return job.to_dict()
+
+    # Every metric and chart is a sum over the cube computed by process()
+    def cube(self, session_id):
+        session_id = self._resolve(session_id)
+        return self._results(session_id)['cube']
+
+    def summary(self, session_id):
+        return summary_cube.summary(self.cube(session_id))
+
+    def status_counts(self, session_id):
+        return summary_cube.status_counts(self.cube(session_id))
+
+    def total_amount_per_status(self, session_id):
+        return summary_cube.amount_per_status(self.cube(session_id))
+
+    def chart(self, session_id, name, start_date=None, end_date=None, points=None):
+        # Plotly figure JSON of a time-series view, aggregated and downsampled here so
+        # the browser gets about as many points as it can draw. Figures are cached
+        # with the processed result, per chart, date window and resolution.
+        if name not in charts.CHART_NAMES:
+            raise EngineError(f"Unknown chart: {name}", status_code=404)
+        session_id = self._resolve(session_id)
+        results = self._results(session_id)
+        points = charts.clamp_points(points)
+        figures = results.setdefault('figures', charts.FigureCache())
+        table = lambda frame: self.store.table(session_id, _stored_frame(frame, results['version']))
+        try:
+            return figures.get_or_build(
+                (name, start_date, end_date, points),
+                lambda: charts.figure_json(name, results['cube'], table, start_date, end_date, points),
+            )
+        except charts.ChartError as e:
+            raise EngineError(str(e)) from e
+
+    def frame(self, session_id, name):
+        session_id = self._resolve(session_id)
+        results = self._results(session_id)
+        if name in STORED_FRAMES:
+            return self.store.read(session_id, _stored_frame(name, results['version']))
+        return results[name]
+
+    def get_page_table(self, session_id, endpoint, page, page_size, sort=None, filters=None, columns=None):
+        # Sorting, filtering and column projection run on the full stored frame.
+        # Returns the page as an Arrow table plus the number of matching rows.
+        session_id = self._resolve(session_id)
+        if endpoint not in self.PAGE_ENDPOINTS:
+            raise EngineError(f"Unknown endpoint: {endpoint}", status_code=404)
+        results = self._results(session_id)
+        name = _stored_frame(self.PAGE_ENDPOINTS[endpoint], results['version'])
+        start = max(page - 1, 0) * page_size
+        try:
+            return self.store.query(session_id, name, start, page_size, sort=sort, filters=filters, columns=columns)
+        except QueryError as e:
+            raise EngineError(str(e)) from e
+
+    def get_page(self, session_id, endpoint, page, page_size, sort=None, filters=None, columns=None):
+        table, total_records = self.get_page_table(session_id, endpoint, page, page_size,
+                                                   sort=sort, filters=filters, columns=columns)
+        return {
+            'data': table.to_pandas(),
+            'total_records': total_records,
+            'page': page,
+            'page_size': page_size,
+        }
+
+    # ---------------------- OrderID Search ---------------------- #
+    SEARCH_MATCHES = ('exact', 'prefix', 'range')
+
+    def _orderid_indexes(self, session_id, session, frames):
+        # One OrderIDIndex per side, built on the first search and kept for the session
+        with session['index_lock']:
+            indexes = session.get('orderid_indexes')
+            if indexes is None:
+                indexes = {side: OrderIDIndex(frames[side]['OrderID']) for side in ('api', 'dashboard')}
+                session['orderid_indexes'] = indexes
+                built = True
+            else:
+                built = False
+        if built:
+            self.sessions.resize(session_id)
+        return indexes
+
+    def search(self, session_id, orderid, match='exact', orderid_end=None):
+        # match: 'exact', 'prefix', or 'range' for OrderIDs from orderid to orderid_end
+        session_id = self._resolve(session_id)
+        if match not in self.SEARCH_MATCHES:
+            raise EngineError(f"Unknown search match: {match}")
+        session = self._session(session_id)
+        if 'spill' in session:
+            return self._search_spilled(session['spill'], str(orderid).strip(), match, orderid_end)
+        frames = self._frames(session_id, session)
+        indexes = self._orderid_indexes(session_id, session, frames)
+        orderid = str(orderid).strip()
+        results = {}
+        for side, index in indexes.items():
+            if match == 'exact':
+                rows, _ = index.lookup([orderid])
+            elif match == 'prefix':
+                rows = index.prefix(orderid, limit=SEARCH_MAX_MATCHES)
+            else:
+                end = str(orderid_end).strip() if orderid_end is not None else None
+                rows = index.range(orderid or None, end or None, limit=SEARCH_MAX_MATCHES)
+            results[f"{side}_matches"] = frames[side].iloc[rows].reset_index(drop=True)
+        return results
+
+    def _search_spilled(self, spill, orderid, match, orderid_end):
+        # An exact OrderID is in one known partition; prefixes and ranges scan them all
+        if match == 'exact':
+            partitions = [int(partition_of([orderid], spill.partitions)[0])]
+            condition, limit = (lambda table: pc.equal(table['OrderID'], orderid)), None
+        elif match == 'prefix':
+            partitions = range(spill.partitions)
+            condition, limit = (lambda table: pc.starts_with(table['OrderID'], orderid)), SEARCH_MAX_MATCHES
+        else:
+            low = orderid or None
+            high = (str(orderid_end).strip() or None) if orderid_end is not None else None
+
+            def condition(table):
+                mask = pa.array(np.ones(table.num_rows, dtype=bool))
+                if low is not None:
+                    mask = pc.and_kleene(mask, pc.greater_equal(table['OrderID'], low))
+                if high is not None:
+                    mask = pc.and_kleene(mask, pc.less_equal(table['OrderID'], high))
+                return mask
+            partitions, limit = range(spill.partitions), SEARCH_MAX_MATCHES
+        return {f"{side}_matches": _spilled_rows(spill, side, partitions, condition, limit).to_pandas()
+                for side in ('api', 'dashboard')}
+
+    def _search_batch_spilled(self, spill, orderids):
+        # Each OrderID is read from its own partition only
+        parts = partition_of(orderids, spill.partitions) if orderids else np.empty(0, dtype=np.int64)
+        position = {orderid: i for i, orderid in enumerate(orderids)}
+        results = {}
+        found = set()
+        for side in ('api', 'dashboard'):
+            tables = []
+            for partition in np.unique(parts):
+                wanted = pa.array([orderids[i] for i in np.flatnonzero(parts == partition)], type=pa.string())
+                table = spill.read(side, int(partition))
+                tables.append(table.filter(pc.fill_null(pc.is_in(table['OrderID'], value_set=wanted), False)))
+            if tables:
+                tables, _ = unified(tables)
+                table = pa.concat_tables(tables)
+            else:
+                table = pa.Table.from_batches([], schema=spill.sides[side]['schema'])
+            # Grouped in list order, upload order within each OrderID
+            ids = table['OrderID'].to_pylist()
+            found.update(ids)
+            table = table.append_column('_position', pa.array([position[i] for i in ids], type=pa.int64()))
+            table = table.sort_by([('_position', 'ascending'), (ROW, 'ascending')])
+            table = table.drop_columns([c for c in ('_position', ROW, FILE) if c in table.column_names])
+            results[f"{side}_matches"] = table.to_pandas()
+        results['not_found'] = [orderid for orderid in orderids if orderid not in found]
+        return results
+
+    def search_batch(self, session_id, orderids):
+        # Every row of either side whose OrderID is in the list, grouped in list order,
+        # plus the OrderIDs found on neither side
+        session_id = self._resolve(session_id)
+        orderids = list(dict.fromkeys(str(orderid).strip() for orderid in orderids))
+        if len(orderids) > BATCH_MAX_ORDERIDS:
+            raise EngineError(f"At most {BATCH_MAX_ORDERIDS} OrderIDs can be searched at once")
+        session = self._session(session_id)
+        if 'spill' in session:
+            return self._search_batch_spilled(session['spill'], orderids)
+        frames = self._frames(session_id, session)
+        results = {}
+        not_found = None
+        for side, index in self._orderid_indexes(session_id, session, frames).items():
+            rows, missing = index.lookup(orderids)
+            results[f"{side}_matches"] = frames[side].iloc[rows].reset_index(drop=True)
+            not_found = set(missing) if not_found is None else not_found & set(missing)
+        results['not_found'] = [orderid for orderid in orderids if orderid in not_found]
+        return results
+
+    def export(self, session_id, report, fmt='csv'):
+        # Report bytes in chunks, streamed from the stored frame; errors are raised
+        # here, before the first chunk, so the caller can still answer with a status
+        session_id = self._resolve(session_id)
+        if report not in self.REPORTS:
+            raise EngineError(f"Unknown report: {report}", status_code=404)
+        if fmt not in EXPORT_FORMATS:
+            raise EngineError(f"Unknown export format: {fmt}")
+        results = self._results(session_id)
+        table = self.store.table(session_id, _stored_frame(self.REPORTS[report], results['version']))
+        return iter_export(table, fmt, sheet_name=report[:31])
+
+    def export_csv(self, session_id, report):
+        return b''.join(self.export(session_id, report, 'csv'))
+
+    def end_session(self, session_id):
+        session_id = self._resolve(session_id, write=True)
+        session = self.sessions.pop(session_id)
+        if session is None:
+            raise EngineError(SESSION_NOT_FOUND, status_code=404)
+        self._free_session(session_id, session)
+        return {'message': 'Session ended'}
+
+    # ---------------------- Shared Sessions ---------------------- #
+    # A share token opens a processed session read-only: pages, search, charts and
+    # downloads take it in place of the session ID and read the same stored results,
+    # so nothing is uploaded or computed again. Processing and ending need the
+    # session ID itself, which the token does not reveal.
+
+    def _resolve(self, session_id, write=False):
+        # The session a token stands for; IDs that are not tokens are returned as they are
+        with self._shares_lock:
+            shared = self._shares.get(session_id)
+        if shared is None:
+            return session_id
+        if write:
+            raise EngineError(SHARE_READ_ONLY, status_code=403)
+        return shared
+
+    def share_session(self, session_id):
+        # The session's share token, made on first use and valid while the session lives
+        session_id = self._resolve(session_id, write=True)
+        session = self._session(session_id)
+        self._results(session_id)
+        with self._shares_lock:
+            token = session.get('share_token')
+            if token is None:
+                token = secrets.token_urlsafe(24)
+                session['share_token'] = token
+                self._shares[token] = session_id
+        return {'share_token': token}
+
+    def open_share(self, token):
+        # What a viewer needs to attach to a shared session
+        with self._shares_lock:
+            session_id = self._shares.get(token)
+        if session_id is None or self.sessions.peek(session_id) is None:
+            raise EngineError(SHARE_NOT_FOUND, status_code=404)
+        return {'session_id': token, 'read_only': True, 'date_ranges': self.get_date_range(token)}
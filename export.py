@@ -0,0 +1,265 @@
+# export.py
+
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from ingest import EXCEL_EPOCH
+
+# ---------------------- Configuration ---------------------- #
+
+# Rows converted and sent per chunk; memory use depends on this, not on the report size
+EXPORT_BATCH_ROWS = 50000
+
+# Download formats: file extension and media type of each
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# Deflate level for gzip CSV and xlsx; 1 is several times faster than 6 for a few percent more bytes
+GZIP_LEVEL = 1
+
+# How timestamps are written to CSV
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Rows per worksheet including the header (Excel's limit); longer reports continue on a new sheet
+XLSX_MAX_ROWS = 1048576
+
+# Characters XML 1.0 does not allow, dropped from text cells
+XML_ILLEGAL = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+XML_ILLEGAL_PATTERN = '[\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f]'
+
+# Excel's day zero in nanoseconds, for date serial numbers
+EXCEL_EPOCH_NS = EXCEL_EPOCH.as_unit('ns').value
+
+# ---------------------- Streaming Exports ---------------------- #
+# Each exporter takes an Arrow table (the memory-mapped stored frame) and yields
+# bytes as it goes, one batch of rows at a time, so a report is never built in
+# memory as a whole.
+
+
+def _csv_batch(batch):
+    # Timestamps written the way the JSON endpoints show them rather than with nanoseconds
+    columns = [
+        pc.strftime(column.cast(pa.timestamp('s', column.type.tz), safe=False), format=CSV_TIMESTAMP_FORMAT)
+        if pa.types.is_timestamp(column.type) else column
+        for column in batch.columns
+    ]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def iter_csv(table):
+    # Arrow's CSV writer: the header once, then each batch as it is converted
+    sink = _ChunkSink()
+    schema = pa.schema([
+        pa.field(field.name, pa.string()) if pa.types.is_timestamp(field.type) else field
+        for field in table.schema
+    ])
+    with pacsv.CSVWriter(sink, schema) as writer:
+        for batch in table.to_batches(max_chunksize=EXPORT_BATCH_ROWS):
+            writer.write_batch(_csv_batch(batch))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_gzip(chunks, level=GZIP_LEVEL):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ---------------------- Streaming XLSX Writer ---------------------- #
+# A minimal SpreadsheetML package written straight into a zip stream: text as
+# inline strings (no shared string table to hold in memory), dates as serial
+# numbers with a date format.
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_SHEET = '<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>'
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rIdStyles" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_SHEET_REL = (
+    '<Relationship Id="rId{n}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{n}.xml"/>'
+)
+# Style 1 is the date format used for datetime columns
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+class _ChunkSink:
+    # Write-only, unseekable target for ZipFile and the CSV writer; the generator drains what was written
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _text_cells(values):
+    return [
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(value).translate(XML_ILLEGAL))}</t></is></c>'
+        for value in values
+    ]
+
+
+def _wrap(values, before, after, empty='<c/>'):
+    # before + value + after for each value, empty where the value is missing
+    joined = pc.binary_join_element_wise(pa.scalar(before), values, pa.scalar(after), '')
+    return pc.fill_null(joined, empty)
+
+
+def _xlsx_cells(column):
+    # One '<c>' element per value, built with Arrow kernels rather than row by row
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    if pa.types.is_boolean(column.type):
+        return _wrap(column.cast(pa.int8()).cast(pa.string()), '<c t="b"><v>', '</v></c>')
+    if pa.types.is_timestamp(column.type):
+        nanoseconds = pc.subtract(column.cast(pa.timestamp('ns', column.type.tz)).cast(pa.int64()), EXCEL_EPOCH_NS)
+        days = pc.divide(nanoseconds.cast(pa.float64(), safe=False), 86400e9)
+        return _wrap(days.cast(pa.string()), '<c s="1"><v>', '</v></c>')
+    if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+        values = column.cast(pa.float64())
+        # NaN and infinities have no cell value
+        values = pc.if_else(pc.is_finite(values), values, pa.scalar(None, pa.float64()))
+        return _wrap(values.cast(pa.string()), '<c><v>', '</v></c>')
+    text = column.cast(pa.string())
+    text = pc.replace_substring_regex(text, XML_ILLEGAL_PATTERN, '')
+    for character, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')):
+        text = pc.replace_substring(text, character, entity)
+    return _wrap(text, '<c t="inlineStr"><is><t xml:space="preserve">', '</t></is></c>')
+
+
+def _xlsx_rows(batch):
+    # The rows of a record batch as one block of sheet XML
+    rows = pc.binary_join_element_wise('<row>', *[_xlsx_cells(column) for column in batch.columns], '</row>', '')
+    # The string values sit back to back in the array's data buffer
+    rows = pa.concat_arrays([rows]) if rows.offset else rows
+    offsets = rows.buffers()[1]
+    first, last = np.frombuffer(offsets, dtype=np.int32)[[0, len(rows)]]
+    return rows.buffers()[2][first:last]
+
+
+def iter_xlsx(table, sheet_name='Report'):
+    sink = _ChunkSink()
+    header = f"<row>{''.join(_text_cells(table.column_names))}</row>"
+    sheets = 0
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=GZIP_LEVEL) as package:
+        sheet, room = None, 0
+        for batch in table.to_batches(max_chunksize=EXPORT_BATCH_ROWS):
+            while len(batch):
+                if not room:
+                    if sheet is not None:
+                        sheet.write(_SHEET_END.encode('utf-8'))
+                        sheet.close()
+                    sheets += 1
+                    sheet = package.open(f"xl/worksheets/sheet{sheets}.xml", 'w', force_zip64=True)
+                    sheet.write((_SHEET_START + header).encode('utf-8'))
+                    room = XLSX_MAX_ROWS - 1
+                part, batch = batch.slice(0, room), batch.slice(room)
+                sheet.write(_xlsx_rows(part))
+                room -= len(part)
+                yield sink.drain()
+        if sheet is None:
+            sheets = 1
+            sheet = package.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+            sheet.write((_SHEET_START + header).encode('utf-8'))
+        sheet.write(_SHEET_END.encode('utf-8'))
+        sheet.close()
+
+        numbers = range(1, sheets + 1)
+        names = [sheet_name if n == 1 else f"{sheet_name} {n}" for n in numbers]
+        package.writestr('[Content_Types].xml', _CONTENT_TYPES.format(
+            sheets=''.join(_SHEET_CONTENT_TYPE.format(n=n) for n in numbers)))
+        package.writestr('_rels/.rels', _ROOT_RELS)
+        package.writestr('xl/workbook.xml', _WORKBOOK.format(
+            sheets=''.join(_WORKBOOK_SHEET.format(name=escape(name), n=n) for n, name in zip(numbers, names))))
+        package.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS.format(
+            sheets=''.join(_WORKBOOK_SHEET_REL.format(n=n) for n in numbers)))
+        package.writestr('xl/styles.xml', _STYLES)
+    yield sink.drain()
+
+
+def iter_export(table, fmt, sheet_name='Report'):
+    # Bytes of the table in one of EXPORT_FORMATS, produced batch by batch
+    if fmt == 'csv':
+        return iter_csv(table)
+    if fmt == 'csv.gz':
+        return iter_gzip(iter_csv(table))
+    if fmt == 'xlsx':
+        return iter_xlsx(table, sheet_name=sheet_name)
+    raise ValueError(f"Unknown export format: {fmt}")
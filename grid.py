@@ -0,0 +1,350 @@
+# grid.py
+
+import hashlib
+import json
+import math
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, JsCode
+
+import perf
+
+# ---------------------- Configuration ---------------------- #
+
+# Rows in each block the grid requests from the data source
+BLOCK_SIZE = 200
+
+# Blocks loaded ahead of the one in view
+PREFETCH_BLOCKS = 2
+
+# Blocks the browser keeps before dropping the least recently used
+MAX_BLOCKS_IN_CACHE = 25
+
+# Rows rendered above and below the viewport
+ROW_BUFFER = 50
+
+# Column filter options per filter type: exactly the ones DATASOURCE_JS translates into
+# backend filters, one condition per column
+TEXT_FILTER_OPTIONS = ['startsWith', 'equals']
+NUMBER_FILTER_OPTIONS = ['equals', 'lessThan', 'lessThanOrEqual', 'greaterThan', 'greaterThanOrEqual', 'inRange']
+DATE_FILTER_OPTIONS = ['equals', 'lessThan', 'greaterThan', 'inRange']
+
+# Columns offered for the amount range filter, in order of preference
+AMOUNT_COLUMNS = ['Difference', 'Amount', 'Amount_API', 'Amount_Dashboard']
+
+# ---------------------- Infinite Row Model Data Source ---------------------- #
+# AG Grid calls getRows for each block as the user scrolls. Blocks map 1:1 onto
+# the backend's page endpoints (page = block + 1, page_size = block size), and
+# the next PREFETCH_BLOCKS blocks are requested as soon as one arrives so they
+# are ready before they scroll into view. The grid's sort and column filters
+# are translated to the backend's sort/filters parameters and combined with
+# the filters chosen under "Filter, sort & columns"; a filter it cannot translate
+# fails the request rather than showing unfiltered rows as filtered. Requests in flight are
+# shared by URL and forgotten once they settle; prefetched blocks wait in a
+# small map, bounded and emptied as the grid takes them, so neither grows
+# however long the grid is scrolled.
+DATASOURCE_JS = """
+({
+    url: %(url)s,
+    sessionId: %(session_id)s,
+    blockSize: %(block_size)s,
+    prefetch: %(prefetch)s,
+    baseQuery: %(query)s,
+    pending: {},
+    ready: new Map(),
+    predicates: function (filterModel) {
+        const out = [];
+        Object.keys(filterModel || {}).forEach(function (column) {
+            const f = filterModel[column];
+            if (f.operator || f.conditions) {
+                throw new Error('Filter ' + column + ' on one condition only.');
+            }
+            // The date filter picks whole days; sent as bare dates, the backend covers each day
+            const low = f.filterType === 'date' ? (f.dateFrom || '').slice(0, 10) || null : f.filter;
+            const high = f.filterType === 'date' ? (f.dateTo || '').slice(0, 10) || null : f.filterTo;
+            if (f.type === 'startsWith') {
+                out.push({column: column, op: 'prefix', value: f.filter});
+            } else if (f.type === 'equals' && f.filterType === 'text') {
+                out.push({column: column, op: 'in', value: [f.filter]});
+            } else if (f.type === 'equals') {
+                out.push({column: column, op: 'between', value: [low, low]});
+            } else if (f.type === 'inRange') {
+                out.push({column: column, op: 'between', value: [low, high]});
+            } else if (f.type === 'greaterThan') {
+                out.push({column: column, op: 'gt', value: low});
+            } else if (f.type === 'greaterThanOrEqual') {
+                out.push({column: column, op: 'between', value: [low, null]});
+            } else if (f.type === 'lessThan') {
+                out.push({column: column, op: 'lt', value: low});
+            } else if (f.type === 'lessThanOrEqual') {
+                out.push({column: column, op: 'between', value: [null, low]});
+            } else {
+                throw new Error('The ' + f.type + ' filter on ' + column + ' is not supported.');
+            }
+        });
+        return out;
+    },
+    query: function (page, params) {
+        const sort = (params.sortModel || []).map(function (s) { return {column: s.colId, direction: s.sort}; });
+        const filters = (this.baseQuery.filters || []).concat(this.predicates(params.filterModel));
+        const search = new URLSearchParams({session_id: this.sessionId, page: page, page_size: this.blockSize});
+        const effectiveSort = sort.length ? sort : (this.baseQuery.sort || []);
+        if (effectiveSort.length) { search.set('sort', JSON.stringify(effectiveSort)); }
+        if (filters.length) { search.set('filters', JSON.stringify(filters)); }
+        if ((this.baseQuery.columns || []).length) { search.set('columns', this.baseQuery.columns.join(',')); }
+        return this.url + '?' + search.toString();
+    },
+    load: function (url, prefetch) {
+        const self = this;
+        if (self.ready.has(url)) {
+            const body = self.ready.get(url);
+            if (!prefetch) { self.ready.delete(url); }
+            return Promise.resolve(body);
+        }
+        if (!self.pending[url]) {
+            self.pending[url] = fetch(url, {headers: {Accept: 'application/json'}}).then(function (response) {
+                if (!response.ok) {
+                    return response.json().catch(function () { return {}; }).then(function (body) {
+                        const error = new Error(body.detail || response.statusText);
+                        error.status = response.status;
+                        throw error;
+                    });
+                }
+                return response.json();
+            }).finally(function () { delete self.pending[url]; });
+            if (prefetch) {
+                self.pending[url].then(function (body) {
+                    self.ready.set(url, body);
+                    while (self.ready.size > 2 * self.prefetch) { self.ready.delete(self.ready.keys().next().value); }
+                }, function () {});
+            }
+        }
+        return self.pending[url];
+    },
+    showError: function (params, message) {
+        params.failCallback();
+        if (params.api) {
+            const note = document.createElement('span');
+            note.textContent = message;
+            params.api.setGridOption('overlayNoRowsTemplate', note.outerHTML);
+            params.api.showNoRowsOverlay();
+        }
+    },
+    getRows: function (params) {
+        const self = this;
+        const page = Math.floor(params.startRow / self.blockSize) + 1;
+        let url;
+        try {
+            url = self.query(page, params);
+        } catch (error) {
+            self.showError(params, error.message);
+            return;
+        }
+        self.load(url, false).then(function (body) {
+            // Taken while its prefetch was still in flight
+            self.ready.delete(url);
+            params.successCallback(body.data, body.total_records);
+            const lastPage = Math.ceil(body.total_records / self.blockSize);
+            for (let ahead = 1; ahead <= self.prefetch && page + ahead <= lastPage; ahead++) {
+                self.load(self.query(page + ahead, params), true);
+            }
+        }).catch(function (error) {
+            if (error.status === 404) {
+                // The session ended on the server (expired or ended elsewhere); the page
+                // starts over on its next rerun, so say so instead of leaving blank rows
+                self.showError(params, error.message + ' Reload the page to start over.');
+            } else if (error.status === 400) {
+                // A filter value the backend cannot compare with the column
+                self.showError(params, error.message);
+            } else {
+                params.failCallback();
+            }
+        });
+    },
+    destroy: function () { this.pending = {}; this.ready.clear(); },
+})
+"""
+
+
+def query_key(query):
+    # Hashable form of a {'sort', 'filters', 'columns'} query
+    return json.dumps(query or {}, sort_keys=True, default=str)
+
+
+def infinite_grid_options(columns, page_url, session_id, query=None, block_size=BLOCK_SIZE):
+    gb = GridOptionsBuilder.from_dataframe(columns)
+    gb.configure_default_column(resizable=True, filterable=True, sortable=True)
+    for column in columns.columns:
+        # Only the filters the backend can run; AG Grid's ranges exclude their bounds unless told
+        dtype = columns[column].dtype
+        if pd.api.types.is_bool_dtype(dtype) or not (pd.api.types.is_numeric_dtype(dtype)
+                                                     or pd.api.types.is_datetime64_any_dtype(dtype)):
+            gb.configure_column(column, filter='agTextColumnFilter',
+                                filterParams={'filterOptions': TEXT_FILTER_OPTIONS, 'maxNumConditions': 1})
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            gb.configure_column(column, filter='agDateColumnFilter',
+                                filterParams={'filterOptions': DATE_FILTER_OPTIONS, 'maxNumConditions': 1,
+                                              'inRangeInclusive': True})
+        else:
+            gb.configure_column(column, filter='agNumberColumnFilter',
+                                filterParams={'filterOptions': NUMBER_FILTER_OPTIONS, 'maxNumConditions': 1,
+                                              'inRangeInclusive': True})
+    gb.configure_grid_options(
+        rowModelType='infinite',
+        datasource=JsCode(DATASOURCE_JS % {
+            'url': json.dumps(page_url),
+            'session_id': json.dumps(session_id),
+            'block_size': block_size,
+            'prefetch': PREFETCH_BLOCKS,
+            'query': json.dumps(query or {}, default=str),
+        }),
+        cacheBlockSize=block_size,
+        maxBlocksInCache=MAX_BLOCKS_IN_CACHE,
+        cacheOverflowSize=2,
+        maxConcurrentDatasourceRequests=PREFETCH_BLOCKS + 1,
+        infiniteInitialRowCount=block_size,
+        rowBuffer=ROW_BUFFER,
+    )
+    return gb.build()
+
+
+# ---------------------- Virtual Scrolling Grid ---------------------- #
+def render_virtual_grid(session_id, endpoint, state_key, fetch_page, prefetch_page, page_url=None,
+                        height=500, status_options=()):
+    # fetch_page(page, page_size, query) returns a page response or None on error;
+    # prefetch_page(page, page_size, query) warms the cache without waiting.
+    # With a page_url the browser streams blocks straight from the backend;
+    # otherwise the grid shows a block window fetched here and prefetches ahead.
+    state = st.session_state[state_key]
+    block = state['block']
+    query = state.get('query', {})
+    data_response = fetch_page(block if page_url is None else 1, BLOCK_SIZE, query)
+    if not data_response:
+        return
+    total_records = data_response.get('total_records', 0)
+    df = pd.DataFrame(data_response['data'])
+    if not query.get('columns') and not df.empty:
+        state['all_columns'] = list(df.columns)
+    if df.empty:
+        st.warning("No data available.")
+        render_query_controls(state_key, status_options)
+        return
+
+    if page_url is not None:
+        AgGrid(
+            df.head(0),
+            gridOptions=infinite_grid_options(df.head(0), page_url, session_id, query),
+            height=height,
+            width='100%',
+            theme='balham',
+            update_mode=GridUpdateMode.NO_UPDATE,
+            allow_unsafe_jscode=True,
+            # A new query needs a new data source, so it gets a fresh grid
+            key=f"{state_key}_grid_{hashlib.md5(query_key(query).encode()).hexdigest()[:8]}",
+        )
+        st.caption(f"{total_records:,} rows")
+        render_query_controls(state_key, status_options)
+        return
+
+    total_blocks = max(math.ceil(total_records / BLOCK_SIZE), 1)
+    for ahead in range(block + 1, min(block + PREFETCH_BLOCKS, total_blocks) + 1):
+        prefetch_page(ahead, BLOCK_SIZE, query)
+
+    with perf.span('grid options', rows=len(df)):
+        gb = GridOptionsBuilder.from_dataframe(df)
+        # Sorting and filtering one block in the browser would be misleading; both
+        # run on the full dataset through the controls below instead
+        gb.configure_default_column(resizable=True, filterable=False, sortable=False)
+        gb.configure_grid_options(rowBuffer=ROW_BUFFER)
+        grid_options = gb.build()
+    with perf.span('grid render', rows=len(df)):
+        AgGrid(
+            df,
+            gridOptions=grid_options,
+            height=height,
+            width='100%',
+            theme='balham',
+            update_mode=GridUpdateMode.NO_UPDATE,
+            key=f"{state_key}_grid",
+        )
+
+    first_row = (block - 1) * BLOCK_SIZE + 1
+    last_row = min(block * BLOCK_SIZE, total_records)
+    col_rows, col_block = st.columns([2, 1])
+    with col_rows:
+        st.caption(f"Rows {first_row:,}–{last_row:,} of {total_records:,}")
+    with col_block:
+        if total_blocks > 1:
+            st.number_input("Block", min_value=1, max_value=total_blocks, step=1,
+                            key=f"{state_key}_block", on_change=_sync_block, args=(state_key,),
+                            value=block, label_visibility='collapsed')
+    render_query_controls(state_key, status_options)
+
+
+def _sync_block(state_key):
+    st.session_state[state_key]['block'] = st.session_state[f"{state_key}_block"]
+
+
+# ---------------------- Pushed-down Sort, Filter and Columns ---------------------- #
+def render_query_controls(state_key, status_options=()):
+    # Builds the {'sort', 'filters', 'columns'} query the backend runs on the full dataset
+    state = st.session_state[state_key]
+    all_columns = state.get('all_columns', [])
+    if not all_columns:
+        return
+    query = state.get('query', {})
+
+    with st.expander("Filter, sort & columns"):
+        with st.form(f"{state_key}_query"):
+            orderid_prefix = st.text_input("OrderID starts with") if 'OrderID' in all_columns else ''
+            status_filters = {}
+            for column in [c for c in all_columns if c.startswith('Status')]:
+                status_filters[column] = st.multiselect(f"{column} is any of", options=list(status_options))
+            amount_column = next((c for c in AMOUNT_COLUMNS if c in all_columns), None)
+            amount_min = amount_max = None
+            if amount_column:
+                col_min, col_max = st.columns(2)
+                with col_min:
+                    amount_min = st.number_input(f"{amount_column} from", value=None)
+                with col_max:
+                    amount_max = st.number_input(f"{amount_column} to", value=None)
+            date_from = date_to = None
+            if 'Date' in all_columns:
+                col_from, col_to = st.columns(2)
+                with col_from:
+                    date_from = st.date_input("Date from", value=None)
+                with col_to:
+                    date_to = st.date_input("Date to", value=None)
+            col_sort, col_direction = st.columns([2, 1])
+            with col_sort:
+                sort_column = st.selectbox("Sort by", options=['(as stored)'] + all_columns)
+            with col_direction:
+                descending = st.checkbox("Descending")
+            columns = st.multiselect("Columns", options=all_columns, default=query.get('columns') or all_columns)
+
+            if st.form_submit_button("Apply"):
+                filters = []
+                if orderid_prefix:
+                    filters.append({'column': 'OrderID', 'op': 'prefix', 'value': orderid_prefix.strip()})
+                for column, statuses in status_filters.items():
+                    if statuses:
+                        filters.append({'column': column, 'op': 'in', 'value': statuses})
+                if amount_min is not None or amount_max is not None:
+                    filters.append({'column': amount_column, 'op': 'between', 'value': [amount_min, amount_max]})
+                if date_from or date_to:
+                    filters.append({'column': 'Date', 'op': 'between', 'value': [
+                        date_from.isoformat() if date_from else None,
+                        date_to.isoformat() if date_to else None,
+                    ]})
+                state['query'] = {
+                    'sort': [] if sort_column == '(as stored)' else [
+                        {'column': sort_column, 'direction': 'desc' if descending else 'asc'}
+                    ],
+                    'filters': filters,
+                    'columns': [] if len(columns) == len(all_columns) else columns,
+                }
+                # A new query starts from the top; the grid is drawn in its own fragment, so only it reruns
+                state['block'] = 1
+                st.session_state.pop(f"{state_key}_block", None)
+                st.rerun(scope='fragment')
@@ -0,0 +1,104 @@
+# index.py
+
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---------------------- Configuration ---------------------- #
+
+# Rows returned per side for a prefix or range search; exact lookups are never cut short
+SEARCH_MAX_MATCHES = 10000
+
+# OrderIDs accepted in one batch search
+BATCH_MAX_ORDERIDS = 100000
+
+# Largest code point: every key with a prefix sorts between prefix and prefix + this
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+# Separators between OrderIDs in a pasted list or uploaded file
+ORDERID_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+def parse_orderids(text):
+    # OrderIDs from pasted text or a one-column file, in order, without repeats.
+    # A leading 'OrderID' header line is skipped.
+    values = [value.strip('"\'') for value in ORDERID_SEPARATORS.split(text or '')]
+    values = [value for value in values if value]
+    if values and values[0].lower() == 'orderid':
+        values = values[1:]
+    return list(dict.fromkeys(values))
+
+
+# ---------------------- OrderID Index ---------------------- #
+class OrderIDIndex:
+    # Row positions of every OrderID in one frame, built once and reused by every search.
+    # Exact lookups go through a hash table of the distinct OrderIDs; prefix and range
+    # queries binary-search a sorted copy of them, which is only built when first needed.
+    # Either way the cost depends on the number of matches, not on the size of the frame.
+
+    def __init__(self, orderids):
+        codes, keys = pd.factorize(pd.Series(orderids).astype('string'))
+        # Rows grouped by OrderID; rows with a missing OrderID are left out
+        order = np.argsort(codes, kind='stable')
+        order = order[codes[order] >= 0]
+        counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+        self._positions = order
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._keys = pd.Index(keys)
+        # Builds the Index's hash table now rather than on the first lookup
+        self._keys.is_unique
+        self._sorted = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def nbytes(self):
+        size = self._positions.nbytes + self._offsets.nbytes + self._keys.memory_usage(deep=True)
+        if self._sorted is not None:
+            size += self._sorted[0].nbytes + self._sorted[1].nbytes
+        return int(size)
+
+    def _rows(self, codes):
+        # Row positions of every OrderID code, grouped by code in the order given
+        starts = self._offsets[codes]
+        lengths = self._offsets[codes + 1] - starts
+        if not lengths.sum():
+            return np.empty(0, dtype=np.intp)
+        # Each row's offset into its group, added to where that group starts
+        group_starts = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return self._positions[group_starts + np.arange(lengths.sum())]
+
+    def lookup(self, orderids):
+        # Returns (row positions grouped in the order the OrderIDs were given, OrderIDs not present)
+        orderids = pd.Index([str(orderid).strip() for orderid in orderids], dtype='string')
+        codes = self._keys.get_indexer(orderids)
+        found = codes >= 0
+        return self._rows(codes[found]), orderids[~found].tolist()
+
+    def _sorted_keys(self):
+        if self._sorted is None:
+            keys = pa.array(self._keys.to_numpy(dtype=object), type=pa.string())
+            order = pc.sort_indices(keys).to_numpy()
+            self._sorted = (keys.take(order).to_numpy(zero_copy_only=False), order)
+        return self._sorted
+
+    def range(self, low=None, high=None, limit=None):
+        # Rows whose OrderID sorts between low and high (inclusive), in row order
+        keys, codes = self._sorted_keys()
+        start = 0 if low is None else np.searchsorted(keys, low, side='left')
+        stop = len(keys) if high is None else np.searchsorted(keys, high, side='right')
+        return self._limited(codes[start:stop], limit)
+
+    def prefix(self, prefix, limit=None):
+        # Rows whose OrderID starts with prefix, in row order
+        keys, codes = self._sorted_keys()
+        start = np.searchsorted(keys, prefix, side='left')
+        stop = np.searchsorted(keys, prefix + PREFIX_UPPER_BOUND, side='left')
+        return self._limited(codes[start:stop], limit)
+
+    def _limited(self, codes, limit):
+        rows = np.sort(self._rows(codes))
+        return rows if limit is None else rows[:limit]
@@ -0,0 +1,499 @@
+# ingest.py
+
+import csv
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ---------------------- Configuration ---------------------- #
+
+# Canonical column names and the headers we accept for them (compared lower-cased)
+COLUMN_ALIASES = {
+    'OrderID': ['orderid', 'order id', 'order_id', 'order no', 'order number', 'order_no'],
+    'Amount': ['amount', 'txn amount', 'transaction amount', 'total amount', 'order amount'],
+    'Status': ['status', 'txn status', 'transaction status', 'payment status', 'order status'],
+    'Date': ['date', 'transaction date', 'txn date', 'order date', 'created at', 'created_at'],
+    'PaymentMethod': ['paymentmethod', 'payment method', 'payment_method', 'payment mode', 'payment type'],
+}
+
+# Columns read as text, never inferred (keeps leading zeros in OrderIDs)
+TEXT_COLUMNS = ('OrderID', 'Status')
+
+# Bytes of CSV each reader thread parses at a time
+CSV_BLOCK_SIZE = 4 * 1024 * 1024
+
+# Processes used to parse the sheets of a workbook side by side
+INGEST_WORKERS = min(os.cpu_count() or 1, 8)
+
+# Files of one upload parsed at the same time (Arrow's CSV reader releases the GIL)
+FILE_WORKERS = min(os.cpu_count() or 1, 8)
+
+# Workbooks smaller than this parse in-process; starting sheet workers costs more than it saves
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+# Every sheet with an OrderID header is read and stacked; False reads only the first sheet
+READ_ALL_SHEETS = True
+
+# Rows parsed at a time when a file is streamed (out-of-core uploads)
+STREAM_BATCH_ROWS = 200000
+
+# Seconds between resident memory samples while a file is parsed
+MEMORY_SAMPLE_INTERVAL = 0.05
+
+# Day zero of Excel's serial dates (1900 date system)
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+
+_LOOKUP = {alias: canonical for canonical, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+
+class IngestError(ValueError):
+    # Raised for files that cannot be parsed
+    pass
+
+
+def canonical_name(header):
+    # Canonical column name for a header, or None when it is not one we know
+    return _LOOKUP.get(str(header).strip().lower())
+
+
+# ---------------------- Peak Memory ---------------------- #
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _worker_peak_bytes():
+    # Lifetime peak of a worker process (ru_maxrss is in KB on Linux)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemory:
+    # Samples resident memory in the background while the block runs
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = _rss_bytes()
+        if rss is not None:
+            self.peak = max(self.peak or 0, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = _rss_bytes()
+        self._sample()
+        if self.start is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+
+    def megabytes(self):
+        if self.peak is None:
+            return None
+        return round(self.peak / 1024 / 1024, 1)
+
+
+# ---------------------- Column Helpers ---------------------- #
+def _unique_headers(header):
+    # Blank headers become "Unnamed: i" and repeats get a ".n" suffix, as pandas does
+    seen = {}
+    names = []
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None or str(name).strip() == '' else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _text(values):
+    # Excel stores every number as a float; OrderID 12345 must not become "12345.0"
+    return [
+        str(int(v)) if isinstance(v, float) and v.is_integer() else (None if v is None else str(v))
+        for v in values
+    ]
+
+
+def _serial_dates(values):
+    # Excel serial day numbers to timestamps; text dates are left for the schema to parse
+    values = pd.Series(values, dtype=object)
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.notna().sum() == 0 or numeric.notna().sum() != values.notna().sum():
+        return values
+    return EXCEL_EPOCH + pd.to_timedelta(numeric, unit='D')
+
+
+def _frame(header, columns, serial_dates=False):
+    # header and column value lists to a DataFrame, with text and date hints applied
+    names = _unique_headers(header)
+    data = {}
+    for name, values in zip(names, columns):
+        canonical = canonical_name(name)
+        if canonical in TEXT_COLUMNS:
+            values = _text(values)
+        elif canonical == 'Date' and serial_dates:
+            values = _serial_dates(values)
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def _rows_to_frame(header, rows, serial_dates=False):
+    # Blank rows are dropped; short rows are padded to the header width
+    width = len(header)
+    rows = [
+        tuple(row[:width]) + (None,) * (width - len(row))
+        for row in rows if any(v is not None and v != '' for v in row)
+    ]
+    columns = [list(values) for values in zip(*rows)] if rows else [[] for _ in range(width)]
+    return _frame(header, columns, serial_dates)
+
+
+def _has_orderid(header):
+    return any(canonical_name(h) == 'OrderID' for h in header if h is not None)
+
+
+def _data_sheets(headers):
+    # headers: [(sheet, header row)] in workbook order
+    if READ_ALL_SHEETS:
+        matching = [sheet for sheet, header in headers if header and _has_orderid(header)]
+        if matching:
+            return matching
+    return [headers[0][0]] if headers else []
+
+
+# ---------------------- CSV ---------------------- #
+def _csv_source(file_obj):
+    if hasattr(file_obj, 'getbuffer'):
+        # Parse the upload buffer in place
+        return pa.BufferReader(pa.py_buffer(file_obj.getbuffer()))
+    return file_obj
+
+
+def read_csv(file_obj):
+    # Multithreaded Arrow reader: the file is split into blocks parsed on every core
+    file_obj.seek(0)
+    first_line = file_obj.readline().decode('utf-8-sig', errors='replace')
+    file_obj.seek(0)
+    header = next(csv.reader([first_line]), [])
+    text_types = {h: pa.string() for h in header if canonical_name(h) in TEXT_COLUMNS}
+    try:
+        if len(set(header)) != len(header):
+            raise pa.ArrowInvalid("duplicate column names")
+        table = pa_csv.read_csv(
+            _csv_source(file_obj),
+            read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(column_types=text_types, strings_can_be_null=True),
+        )
+        return table.to_pandas(date_as_object=False), 1
+    except pa.ArrowInvalid:
+        # Ragged rows, duplicate headers and similar: the slower, more forgiving reader
+        file_obj.seek(0)
+        return pd.read_csv(file_obj, dtype={h: 'string' for h in text_types}), 1
+
+
+# ---------------------- Workbooks ---------------------- #
+def _xlsx_sheet(workbook, sheet):
+    rows = workbook[sheet].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    return _rows_to_frame(header, rows)
+
+
+def _xlsx_headers(workbook):
+    return [(ws.title, next(ws.iter_rows(max_row=1, values_only=True), None)) for ws in workbook.worksheets]
+
+
+def _open_xlsx(source):
+    import openpyxl
+    # Read-only mode streams rows from the sheet XML instead of building every cell
+    return openpyxl.load_workbook(source, read_only=True, data_only=True)
+
+
+def _xlsb_sheet(workbook, sheet):
+    with workbook.get_sheet(sheet) as ws:
+        rows = ([cell.v for cell in row] for row in ws.rows())
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        return _rows_to_frame(header, rows, serial_dates=True)
+
+
+def _xlsb_headers(workbook):
+    headers = []
+    for sheet in workbook.sheets:
+        with workbook.get_sheet(sheet) as ws:
+            headers.append((sheet, next(([cell.v for cell in row] for row in ws.rows()), None)))
+    return headers
+
+
+def _open_xlsb(source):
+    from pyxlsb import open_workbook
+    return open_workbook(source)
+
+
+def _xls_sheet(workbook, sheet):
+    # xlrd hands out whole columns, so no per-row work is needed
+    ws = workbook.sheet_by_name(sheet)
+    if ws.nrows == 0:
+        return pd.DataFrame()
+    header = ws.row_values(0)
+    columns = [ws.col_values(c, start_rowx=1) for c in range(ws.ncols)]
+    columns = [[None if v == '' else v for v in values] for values in columns]
+    return _frame(header, columns, serial_dates=True)
+
+
+def _xls_headers(workbook):
+    headers = []
+    for sheet in workbook.sheet_names():
+        ws = workbook.sheet_by_name(sheet)
+        headers.append((sheet, ws.row_values(0) if ws.nrows else None))
+        workbook.unload_sheet(sheet)
+    return headers
+
+
+def _open_xls(source):
+    import xlrd
+    if isinstance(source, str):
+        return xlrd.open_workbook(source, on_demand=True)
+    return xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+
+
+WORKBOOK_READERS = {
+    '.xlsx': (_open_xlsx, _xlsx_headers, _xlsx_sheet),
+    '.xlsm': (_open_xlsx, _xlsx_headers, _xlsx_sheet),
+    '.xlsb': (_open_xlsb, _xlsb_headers, _xlsb_sheet),
+    '.xls': (_open_xls, _xls_headers, _xls_sheet),
+}
+
+
+def _read_sheet(path, extension, sheet):
+    # Runs in a worker process: open the workbook and parse one sheet
+    open_workbook, _, read_sheet = WORKBOOK_READERS[extension]
+    df = read_sheet(open_workbook(path), sheet)
+    return df, _worker_peak_bytes()
+
+
+_sheet_executor = None
+_executor_lock = threading.Lock()
+
+
+def _executor():
+    global _sheet_executor
+    with _executor_lock:
+        if _sheet_executor is None:
+            _sheet_executor = ProcessPoolExecutor(
+                max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _sheet_executor
+
+
+def _reset_executor():
+    global _sheet_executor
+    with _executor_lock:
+        if _sheet_executor is not None:
+            _sheet_executor.shutdown(wait=False, cancel_futures=True)
+        _sheet_executor = None
+
+
+def _size(file_obj):
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    return size
+
+
+def read_workbook(extension, file_obj):
+    # Returns (frame, sheets read, peak bytes of the sheet workers or None)
+    open_workbook, read_headers, read_sheet = WORKBOOK_READERS[extension]
+    file_obj.seek(0)
+    workbook = open_workbook(file_obj)
+    sheets = _data_sheets(read_headers(workbook))
+    if not sheets:
+        return pd.DataFrame(), 0, None
+    if len(sheets) == 1 or INGEST_WORKERS == 1 or _size(file_obj) < PARALLEL_MIN_BYTES:
+        frames = [read_sheet(workbook, sheet) for sheet in sheets]
+        return pd.concat(frames, ignore_index=True), len(sheets), None
+
+    # Workers open the workbook from a file of their own, one sheet each
+    fd, path = tempfile.mkstemp(suffix=extension)
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            file_obj.seek(0)
+            shutil.copyfileobj(file_obj, target)
+        try:
+            results = list(_executor().map(_read_sheet, [path] * len(sheets), [extension] * len(sheets), sheets))
+        except BrokenProcessPool:
+            # Workers could not start here; read the sheets one after another instead
+            _reset_executor()
+            results = [_read_sheet(path, extension, sheet) for sheet in sheets]
+    finally:
+        os.remove(path)
+    frames = [df for df, _ in results]
+    peaks = [peak for _, peak in results if peak is not None]
+    return pd.concat(frames, ignore_index=True), len(sheets), max(peaks) if peaks else None
+
+
+# ---------------------- Entry Point ---------------------- #
+def ingest(filename, file_obj):
+    # Parse an uploaded csv/xls/xlsx/xlsb buffer; returns (DataFrame, stats)
+    extension = os.path.splitext(filename)[1].lower()
+    if extension != '.csv' and extension not in WORKBOOK_READERS:
+        raise IngestError(f"Unsupported file type: {extension}")
+    started = time.perf_counter()
+    worker_peak = None
+    with PeakMemory() as memory:
+        try:
+            if extension == '.csv':
+                df, sheets = read_csv(file_obj)
+            else:
+                df, sheets, worker_peak = read_workbook(extension, file_obj)
+        except IngestError:
+            raise
+        except Exception as e:
+            raise IngestError(f"Could not read {filename}: {e}") from e
+    return df, {
+        'format': extension.lstrip('.'),
+        'rows': int(len(df)),
+        'columns': int(len(df.columns)),
+        'sheets': sheets,
+        'seconds': round(time.perf_counter() - started, 3),
+        'peak_memory_mb': memory.megabytes(),
+        'worker_peak_memory_mb': round(worker_peak / 1024 / 1024, 1) if worker_peak else None,
+    }
+
+
+def ingest_files(files, workers=FILE_WORKERS):
+    # Parse several (filename, file_obj) uploads side by side; returns [(DataFrame, stats)] in the order given
+    if len(files) == 1 or workers == 1:
+        return [ingest(filename, file_obj) for filename, file_obj in files]
+    with ThreadPoolExecutor(max_workers=min(workers, len(files)), thread_name_prefix='ingest') as pool:
+        return list(pool.map(lambda file: ingest(*file), files))
+
+
+# ---------------------- Streaming Batches ---------------------- #
+# For uploads too large to parse whole: the file is read a batch of rows at a
+# time, so only one batch is ever held as a DataFrame. Every CSV column is read
+# as text (block-wise type inference could disagree between blocks); the schema
+# types are applied to each batch afterwards.
+
+def _csv_batches(file_obj, names):
+    reader = pa_csv.open_csv(
+        _csv_source(file_obj),
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE, column_names=names, skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in names},
+                                              strings_can_be_null=True),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _xlsx_rows(workbook, sheet):
+    yield from workbook[sheet].iter_rows(values_only=True)
+
+
+def _xlsb_rows(workbook, sheet):
+    with workbook.get_sheet(sheet) as ws:
+        for row in ws.rows():
+            yield [cell.v for cell in row]
+
+
+# Row iterators per workbook format, and whether its dates are serial numbers
+STREAMED_WORKBOOKS = {
+    '.xlsx': (_xlsx_rows, False),
+    '.xlsm': (_xlsx_rows, False),
+    '.xlsb': (_xlsb_rows, True),
+}
+
+
+def _sheet_batches(rows, batch_rows, serial_dates):
+    header = next(rows, None)
+    if header is None:
+        return
+    while True:
+        chunk = list(itertools.islice(rows, batch_rows))
+        if not chunk:
+            return
+        df = _rows_to_frame(header, chunk, serial_dates)
+        if len(df):
+            yield df
+
+
+def _workbook_batches(extension, workbook, sheets, batch_rows):
+    _, _, read_sheet = WORKBOOK_READERS[extension]
+    for sheet in sheets:
+        if extension in STREAMED_WORKBOOKS:
+            read_rows, serial_dates = STREAMED_WORKBOOKS[extension]
+            yield from _sheet_batches(read_rows(workbook, sheet), batch_rows, serial_dates)
+        else:
+            # .xls sheets hold at most 65,536 rows and xlrd reads them whole anyway
+            df = read_sheet(workbook, sheet)
+            for start in range(0, len(df), batch_rows):
+                yield df.iloc[start:start + batch_rows]
+
+
+def _reported(filename, batches):
+    # Parse errors surface while iterating, so they are raised as IngestError there too
+    try:
+        yield from batches
+    except Exception as e:
+        raise IngestError(f"Could not read {filename}: {e}") from e
+
+
+def stream(filename, file_obj, batch_rows=STREAM_BATCH_ROWS):
+    # Returns (headers, batches): the headers of every sheet that will be read, in
+    # order, and a generator of DataFrames of at most batch_rows rows each
+    extension = os.path.splitext(filename)[1].lower()
+    if extension != '.csv' and extension not in WORKBOOK_READERS:
+        raise IngestError(f"Unsupported file type: {extension}")
+    try:
+        file_obj.seek(0)
+        if extension == '.csv':
+            first_line = file_obj.readline().decode('utf-8-sig', errors='replace')
+            file_obj.seek(0)
+            names = _unique_headers(next(csv.reader([first_line]), []))
+            return [names], _reported(filename, _csv_batches(file_obj, names))
+        open_workbook, read_headers, _ = WORKBOOK_READERS[extension]
+        workbook = open_workbook(file_obj)
+        headers = read_headers(workbook)
+        sheets = _data_sheets(headers)
+        names = [_unique_headers(header) for sheet, header in headers if sheet in sheets and header]
+        return names, _reported(filename, _workbook_batches(extension, workbook, sheets, batch_rows))
+    except Exception as e:
+        raise IngestError(f"Could not read {filename}: {e}") from e
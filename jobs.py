@@ -0,0 +1,284 @@
+# jobs.py
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import perf
+
+# ---------------------- Configuration ---------------------- #
+
+# Stages a processing job reports, in the order they run ('index' only does work on the first run)
+STAGES = ('index', 'parse', 'normalize', 'join', 'diff', 'aggregate', 'write')
+
+# Jobs that may run at the same time, across all users
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+
+# Jobs one user (a job's owner, which the engine records per session) may have running at
+# the same time; the rest of the pool stays free for others
+JOB_WORKERS_PER_USER = 1
+
+# Jobs one user may have waiting; past it, new jobs are refused until some finish
+JOB_QUEUE_PER_USER = 4
+
+# Scheduling priority of job threads (Linux nice value), so request threads serving
+# pages and searches get the CPU first while a large job runs
+JOB_NICE = 10
+
+# Finished jobs kept so a late poll still sees the outcome
+JOB_RETENTION = 100
+
+# Job states; the last three are final
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    # Raised inside a job at the next stage boundary after cancel() was called
+    pass
+
+
+class JobQueueFull(Exception):
+    # Raised by submit() when the user already has JOB_QUEUE_PER_USER jobs waiting
+    pass
+
+
+# ---------------------- Stage Progress ---------------------- #
+class NullProgress:
+    # Stand-in for a Job when work runs outside the job model
+
+    @contextmanager
+    def stage(self, name):
+        # Still timed as a span, so synchronous processing shows its stages too
+        with perf.span(f"process.{name}") as counters:
+            yield counters
+
+    def check_cancelled(self):
+        pass
+
+
+NO_PROGRESS = NullProgress()
+
+
+class Job:
+    # One background run; stages record status, row counts and timings as they go
+
+    def __init__(self, session_id, params=None, owner=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.owner = owner or session_id
+        self.params = params or {}
+        self.state = QUEUED
+        self.stages = OrderedDict((name, {'status': 'pending', 'rows': None, 'seconds': None}) for name in STAGES)
+        self.result = None
+        self.error = None
+        # What the work raised, for a caller waiting on the job to raise in turn
+        self.exception = None
+        self.created = time.time()
+        self.queue_position = None
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        # with job.stage('join') as stage: ...; stage['rows'] = len(merged)
+        self.check_cancelled()
+        counters = {}
+        with self._lock:
+            self.stages[name]['status'] = 'running'
+        started = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.stages[name].update(status='done', rows=counters.get('rows'), seconds=round(seconds, 3))
+            perf.record(f"process.{name}", seconds, rows=counters.get('rows'))
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout=None):
+        # True once the job has finished, however it ended
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            now = self.finished or time.time()
+            return {
+                'job_id': self.id,
+                'session_id': self.session_id,
+                'params': dict(self.params),
+                'state': self.state,
+                'stages': [{'stage': name, **info} for name, info in self.stages.items()],
+                'result': self.result,
+                'error': self.error,
+                'elapsed': round(now - (self.started or now), 3),
+                'queue_position': self.queue_position,
+            }
+
+
+# ---------------------- Job Manager ---------------------- #
+class JobManager:
+    # Runs jobs on a fixed pool of worker threads, fairly across users: each user
+    # (owner) has a queue, workers take the next job from the queues in turn, and
+    # no user runs more than JOB_WORKERS_PER_USER jobs at once. One user's large
+    # job therefore waits behind nobody and holds up nobody but that user. A new
+    # job for a session cancels the one before it. owner is the user the engine
+    # recorded for the session at upload, never a per-request value, or anyone could
+    # take a fresh queue by asking for it.
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION, per_user=JOB_WORKERS_PER_USER,
+                 queue_per_user=JOB_QUEUE_PER_USER, nice=JOB_NICE):
+        self.retention = retention
+        self.per_user = per_user
+        self.queue_per_user = queue_per_user
+        self.nice = nice
+        self._jobs = OrderedDict()
+        # owner -> deque of (job, function), in the order owners are served
+        self._queues = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._workers = [threading.Thread(target=self._work, name=f"job-{i}", daemon=True)
+                         for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, session_id, function, params=None, owner=None):
+        # function(job) does the work and returns the job's result
+        job = Job(session_id, params, owner)
+        with self._lock:
+            # Refused before anything is cancelled, so a rejected job leaves the current one
+            # running; the session's own waiting job does not count, as this one replaces it
+            waiting = [entry for entry in self._queues.get(job.owner, ()) if entry[0].session_id != session_id]
+            if len(waiting) >= self.queue_per_user:
+                raise JobQueueFull(f"{len(waiting)} jobs are already waiting; try again when one has finished")
+            for other in self._jobs.values():
+                if other.session_id == session_id and other.state not in FINISHED:
+                    self._cancel(other)
+            self._jobs[job.id] = job
+            self._prune()
+            self._queues.setdefault(job.owner, deque()).append((job, function))
+            self._update_positions()
+            self._ready.notify()
+        return job
+
+    def _next(self):
+        # The first owner in turn with a job waiting and a worker to spare; that owner
+        # moves to the back of the line. Called with the lock held.
+        for owner, queue in self._queues.items():
+            if self._running.get(owner, 0) < self.per_user:
+                job, function = queue.popleft()
+                del self._queues[owner]
+                if queue:
+                    self._queues[owner] = queue
+                self._running[owner] = self._running.get(owner, 0) + 1
+                self._update_positions()
+                return job, function
+        return None
+
+    def _update_positions(self):
+        # Jobs that would start before each waiting job if workers were free, counted
+        # as the queues are served: one job per owner per turn
+        position = 0
+        queues = [list(queue) for queue in self._queues.values()]
+        for turn in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if turn < len(queue):
+                    queue[turn][0].queue_position = position
+                    position += 1
+
+    def _work(self):
+        try:
+            # Lower the priority of this thread only; request threads keep theirs
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self._lock:
+                task = self._next()
+                while task is None:
+                    self._ready.wait()
+                    task = self._next()
+            job, function = task
+            try:
+                self._run(job, function)
+            finally:
+                with self._lock:
+                    self._running[job.owner] -= 1
+                    if not self._running[job.owner]:
+                        del self._running[job.owner]
+                    # The owner may have more jobs waiting for this worker
+                    self._ready.notify_all()
+
+    def _run(self, job, function):
+        job.queue_position = None
+        job.started = time.time()
+        job.state = RUNNING
+        try:
+            job.check_cancelled()
+            job.result = function(job)
+            job.state = SUCCEEDED
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception as e:
+            job.error = getattr(e, 'detail', None) or str(e)
+            job.exception = e
+            job.state = FAILED
+        finally:
+            job.finished = time.time()
+            job._done.set()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED]
+        for job_id in finished[:max(len(self._jobs) - self.retention, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state not in FINISHED:
+                self._cancel(job)
+        return job
+
+    def cancel_session(self, session_id):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.session_id == session_id and job.state not in FINISHED:
+                    self._cancel(job)
+
+    def _cancel(self, job):
+        # A running job stops at its next stage; a waiting one leaves its queue right away.
+        # Called with the lock held.
+        job.cancel()
+        queue = self._queues.get(job.owner)
+        entry = next((entry for entry in queue if entry[0] is job), None) if queue else None
+        if entry is None:
+            return
+        queue.remove(entry)
+        if not queue:
+            del self._queues[job.owner]
+        job.state = CANCELLED
+        job.queue_position = None
+        job.finished = time.time()
+        job._done.set()
+        self._update_positions()
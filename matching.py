@@ -0,0 +1,209 @@
+# matching.py
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# ---------------------- Configuration ---------------------- #
+
+# Tolerant matching rules; leaving every rule at its default means exact matching.
+#   strip_leading_zeros:  '000123' and '123' are the same OrderID
+#   ignore_case:          'ord1' and 'ORD1' are the same OrderID
+#   ignore_characters:    characters removed from OrderIDs before comparing, e.g. '-_ /'
+#   strip_prefixes/_suffixes: system-specific affixes removed before comparing, e.g. ['PAY-']
+#   amount_tolerance:     largest difference still treated as equal amounts
+#   amount_tolerance_mode: 'absolute' (in currency units) or 'percent' (of the larger amount)
+#   time_window_seconds:  rows only match when their Dates are at most this far apart;
+#                         repeated OrderIDs are then paired with the nearest row in time
+DEFAULT_MATCHING = {
+    'strip_leading_zeros': False,
+    'ignore_case': False,
+    'ignore_characters': '',
+    'strip_prefixes': [],
+    'strip_suffixes': [],
+    'amount_tolerance': 0.0,
+    'amount_tolerance_mode': 'absolute',
+    'time_window_seconds': None,
+}
+AMOUNT_TOLERANCE_MODES = ('absolute', 'percent')
+
+# Relative tolerance below which two amounts are always treated as equal (float noise)
+AMOUNT_EPSILON = 1e-9
+
+
+class MatchingError(ValueError):
+    # Raised for matching rules that cannot be applied
+    pass
+
+
+def parse_matching(options=None):
+    # Validated rules with defaults filled in, or None when they add up to exact matching
+    rules = dict(DEFAULT_MATCHING)
+    for name, value in (options or {}).items():
+        if name not in DEFAULT_MATCHING:
+            raise MatchingError(f"Unknown matching rule: {name}")
+        rules[name] = value
+    try:
+        rules['strip_leading_zeros'] = bool(rules['strip_leading_zeros'])
+        rules['ignore_case'] = bool(rules['ignore_case'])
+        rules['ignore_characters'] = str(rules['ignore_characters'] or '')
+        rules['strip_prefixes'] = [str(p) for p in rules['strip_prefixes'] or [] if str(p)]
+        rules['strip_suffixes'] = [str(s) for s in rules['strip_suffixes'] or [] if str(s)]
+        rules['amount_tolerance'] = float(rules['amount_tolerance'] or 0)
+        if rules['time_window_seconds'] is not None:
+            rules['time_window_seconds'] = float(rules['time_window_seconds'])
+    except (TypeError, ValueError) as e:
+        raise MatchingError(f"Invalid matching rules: {e}") from e
+    if rules['amount_tolerance'] < 0:
+        raise MatchingError("amount_tolerance cannot be negative")
+    if rules['amount_tolerance_mode'] not in AMOUNT_TOLERANCE_MODES:
+        raise MatchingError(f"amount_tolerance_mode must be one of: {', '.join(AMOUNT_TOLERANCE_MODES)}")
+    if rules['time_window_seconds'] is not None and rules['time_window_seconds'] < 0:
+        raise MatchingError("time_window_seconds cannot be negative")
+    return None if rules == DEFAULT_MATCHING else rules
+
+
+# ---------------------- OrderID Normalization ---------------------- #
+def _alternatives(values, ignore_case):
+    # Longest first, so 'PAY-X' is stripped before 'PAY-'
+    values = sorted({v.upper() if ignore_case else v for v in values}, key=len, reverse=True)
+    return '|'.join(re.escape(v) for v in values)
+
+
+def match_keys(orderids, rules):
+    # The key each OrderID is matched on, computed column-wise (no per-row Python)
+    keys = orderids.astype('string').str.strip()
+    if rules is None:
+        return keys
+    if rules['ignore_case']:
+        keys = keys.str.upper()
+    if rules['ignore_characters']:
+        keys = keys.str.replace(f"[{re.escape(rules['ignore_characters'])}]", '', regex=True)
+    if rules['strip_prefixes']:
+        keys = keys.str.replace(f"^(?:{_alternatives(rules['strip_prefixes'], rules['ignore_case'])})", '', regex=True)
+    if rules['strip_suffixes']:
+        keys = keys.str.replace(f"(?:{_alternatives(rules['strip_suffixes'], rules['ignore_case'])})$", '', regex=True)
+    if rules['strip_leading_zeros']:
+        keys = keys.str.replace(r'^0+(?=.)', '', regex=True)
+    # An OrderID that normalizes to nothing cannot be matched
+    return keys.mask(keys == '')
+
+
+# ---------------------- Amount Tolerance ---------------------- #
+def amount_mismatch(amount_api, amount_dashboard, rules=None):
+    # True where two amounts differ by more than the tolerance; two missing amounts match
+    difference = np.abs(amount_api - amount_dashboard)
+    scale = np.maximum(np.abs(amount_api), np.abs(amount_dashboard))
+    tolerance = AMOUNT_EPSILON * scale
+    if rules is not None and rules['amount_tolerance']:
+        if rules['amount_tolerance_mode'] == 'percent':
+            tolerance = np.maximum(tolerance, rules['amount_tolerance'] / 100 * scale)
+        else:
+            tolerance = np.maximum(tolerance, rules['amount_tolerance'])
+    with np.errstate(invalid='ignore'):
+        equal = difference <= tolerance
+    both_missing = np.isnan(amount_api) & np.isnan(amount_dashboard)
+    return ~(equal | both_missing)
+
+
+# ---------------------- Blocked Join ---------------------- #
+def match_sides(api, dashboard, rules):
+    # Pairs the rows of both sides and returns a frame shaped like an outer join with
+    # indicator=True: OrderID (the API's, else the Dashboard's), OrderID_Dashboard,
+    # Amount_/Status_ (and SourceFile_) per side and _merge. Only rows sharing a match
+    # key are ever compared (the key is the block), so the cost grows with the rows,
+    # not their product. Rows whose OrderID normalizes to nothing match no row and are
+    # reported as found on their side only, as exact matching does.
+    columns = ['OrderID', 'Amount', 'Status']
+    if 'SourceFile' in api.columns and 'SourceFile' in dashboard.columns:
+        columns.append('SourceFile')
+    window = rules['time_window_seconds']
+    if window is not None and 'Date' in api.columns and 'Date' in dashboard.columns:
+        columns.append('Date')
+    left = api[columns].assign(_key=match_keys(api['OrderID'], rules))
+    right = dashboard[columns].assign(_key=match_keys(dashboard['OrderID'], rules))
+    # OrderIDs of the two sides are combined below; categories differ per side
+    left['OrderID'] = left['OrderID'].astype('string')
+    right['OrderID'] = right['OrderID'].astype('string')
+    keyed_left = left['_key'].notna().to_numpy()
+    keyed_right = right['_key'].notna().to_numpy()
+    unkeyed_left, unkeyed_right = left[~keyed_left], right[~keyed_right]
+    left, right = left[keyed_left], right[keyed_right]
+
+    if 'Date' not in columns:
+        # One row per key, as exact matching keeps the first row per OrderID
+        merged = left.drop_duplicates('_key').merge(right.drop_duplicates('_key'), on='_key', how='outer',
+                                                    suffixes=('_API', '_Dashboard'), indicator=True)
+        merged['_merge'] = merged['_merge'].astype(str)
+        unkeyed_left = unkeyed_left.drop_duplicates('OrderID')
+        unkeyed_right = unkeyed_right.drop_duplicates('OrderID')
+    else:
+        merged = _match_in_window(left, right, pd.Timedelta(seconds=window))
+    merged = pd.concat([
+        merged,
+        unkeyed_left.drop(columns=['_key']).add_suffix('_API').assign(_merge='left_only'),
+        unkeyed_right.drop(columns=['_key']).add_suffix('_Dashboard').assign(_merge='right_only'),
+    ], ignore_index=True)
+
+    merged['OrderID'] = merged['OrderID_API'].fillna(merged['OrderID_Dashboard'])
+    return merged.drop(columns=['_key', 'OrderID_API'] + [c for c in merged.columns if c.startswith('Date_')])
+
+
+def _match_in_window(left, right, window):
+    # Within each key, rows are paired nearest first: every unpaired API row proposes
+    # the nearest unpaired Dashboard row no more than window apart (merge_asof 'by'
+    # the key), each Dashboard row accepts the closest proposal (the earlier API row
+    # on a tie), and rounds repeat until no proposal is left. An API row whose nearest
+    # row went to a closer one thus still pairs with the next nearest in the window.
+    # Rows repeated at one time are ranked within their (key, time) and also proposed
+    # to by rank, so n copies on each side pair in one round rather than n; a ranked
+    # proposal is only taken when it is as near as the row's nearest. Rows without a
+    # Date cannot satisfy the window.
+    left = left.reset_index(drop=True)
+    right = right.reset_index(drop=True)
+    dated_left = left[left['Date'].notna()].sort_values('Date', kind='stable')
+    dated_right = right[right['Date'].notna()].sort_values('Date', kind='stable')
+    # merge_asof needs matching key dtypes and one time unit on both sides
+    free_left = pd.DataFrame({'_time': dated_left['Date'].astype('datetime64[ns]'),
+                              '_key': dated_left['_key'].astype(object), '_left': dated_left.index})
+    free_right = pd.DataFrame({'_right_time': dated_right['Date'].astype('datetime64[ns]'),
+                               '_key': dated_right['_key'].astype(object), '_right': dated_right.index})
+    rounds = []
+    while len(free_left) and len(free_right):
+        free_left = free_left.assign(_rank=free_left.groupby(['_key', '_time'], sort=False).cumcount())
+        free_right = free_right.assign(_rank=free_right.groupby(['_key', '_right_time'], sort=False).cumcount())
+        nearest = _proposals(free_left, free_right, ['_key'], window)
+        ranked = _proposals(free_left, free_right, ['_key', '_rank'], window)
+        ranked = ranked[ranked['_gap'].to_numpy() == nearest.loc[ranked.index, '_gap'].to_numpy()]
+        pairs = pd.concat([ranked, nearest.drop(index=ranked.index)]).dropna(subset=['_right'])
+        if not len(pairs):
+            break
+        pairs = pairs.assign(_right=pairs['_right'].astype(np.int64))
+        pairs = pairs.sort_values(['_gap', '_left'], kind='stable').drop_duplicates('_right')
+        rounds.append(pairs[['_left', '_right']])
+        free_left = free_left[~free_left['_left'].isin(pairs['_left'])]
+        free_right = free_right[~free_right['_right'].isin(pairs['_right'])]
+    pairs = (pd.concat(rounds, ignore_index=True) if rounds
+             else pd.DataFrame({'_left': [], '_right': []}, dtype=np.int64))
+    pairs = pairs.sort_values('_left', kind='stable')
+
+    matched = pd.concat([
+        left.iloc[pairs['_left'].to_numpy()].add_suffix('_API').reset_index(drop=True),
+        right.iloc[pairs['_right'].to_numpy()].add_suffix('_Dashboard').reset_index(drop=True),
+    ], axis=1).assign(_merge='both')
+    left_only = left.drop(index=pairs['_left'].to_numpy()).add_suffix('_API').assign(_merge='left_only')
+    right_only = right.drop(index=pairs['_right'].to_numpy()).add_suffix('_Dashboard').assign(_merge='right_only')
+    merged = pd.concat([matched, left_only, right_only], ignore_index=True)
+    merged = merged.assign(_key=merged['_key_API'].fillna(merged['_key_Dashboard']))
+    return merged.drop(columns=['_key_API', '_key_Dashboard']).sort_values('_key', kind='stable', ignore_index=True)
+
+
+def _proposals(free_left, free_right, by, window):
+    # Each free API row's nearest free Dashboard row with the same by-values, indexed like
+    # free_left; _right is NaN where none is within the window
+    proposals = pd.merge_asof(free_left, free_right.drop(columns=[c for c in ['_rank'] if c not in by]),
+                              left_on='_time', right_on='_right_time', by=by, tolerance=window,
+                              direction='nearest')
+    proposals.index = free_left.index
+    return proposals.assign(_gap=(proposals['_time'] - proposals['_right_time']).abs())[['_left', '_right', '_gap']]
@@ -0,0 +1,329 @@
+# outofcore.py
+
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# ---------------------- Configuration ---------------------- #
+
+# Where out-of-core sessions keep their partition files, one directory per session
+SPILL_DIR = os.environ.get('SPILL_DIR', os.path.join(tempfile.gettempdir(), 'excelcompare_spill'))
+
+# Memory one out-of-core run may use, the coordinating process and its workers together
+MEMORY_LIMIT_MB = int(os.environ.get('MEMORY_LIMIT_MB', 2048))
+
+# Uploads whose estimated working memory exceeds this share of the limit go out of core
+OUT_OF_CORE_SHARE = 0.5
+
+# Working memory of a partition while it is joined and diffed, per byte of its data
+MEMORY_EXPANSION = 4
+
+# Bytes of data per byte of file for zipped workbooks (xlsx, xlsm, xlsb)
+WORKBOOK_INFLATION = 8
+
+# Processes that join partitions side by side; fewer run when partitions are large
+OUT_OF_CORE_WORKERS = min(os.cpu_count() or 1, 8)
+
+# Upper bound on partitions; each is one open file per side while spilling
+MAX_PARTITIONS = 512
+
+# Rows taken from all partitions together per step when their outputs are merged in order
+MERGE_BATCH_ROWS = 100000
+
+# Internal columns of spilled rows: position in upload order, and the file the row came from
+ROW = '_row'
+FILE = '_file'
+
+
+# ---------------------- Sizing ---------------------- #
+def memory_limit():
+    return MEMORY_LIMIT_MB * 1024 * 1024
+
+
+def estimated_bytes(files):
+    # files: [(filename, file_obj)]; rough in-memory size of the data they hold
+    total = 0
+    for filename, file_obj in files:
+        position = file_obj.tell()
+        size = file_obj.seek(0, os.SEEK_END)
+        file_obj.seek(position)
+        zipped = os.path.splitext(filename)[1].lower() in ('.xlsx', '.xlsm', '.xlsb')
+        total += size * (WORKBOOK_INFLATION if zipped else 1)
+    return total
+
+
+def needs_out_of_core(estimate):
+    return estimate * MEMORY_EXPANSION > memory_limit() * OUT_OF_CORE_SHARE
+
+
+def partition_count(estimate):
+    # Enough partitions that every worker, plus the coordinator, fits in the limit at once
+    budget = memory_limit() / (OUT_OF_CORE_WORKERS + 1)
+    wanted = math.ceil(estimate * MEMORY_EXPANSION / budget)
+    return int(min(max(wanted, OUT_OF_CORE_WORKERS), MAX_PARTITIONS))
+
+
+def worker_count(partition_bytes):
+    # Workers that fit in the limit when each holds the largest partition
+    largest = max(partition_bytes, default=0) * MEMORY_EXPANSION
+    if not largest:
+        return 1
+    return int(min(max(memory_limit() // largest - 1, 1), OUT_OF_CORE_WORKERS))
+
+
+def partition_of(orderids, partitions):
+    # Partition of each row: a hash of its OrderID, so equal OrderIDs always meet.
+    # Rows without an OrderID join each other too, so they share partition 0.
+    values = pd.Series(orderids).astype('string')
+    missing = values.isna().to_numpy()
+    # Hashed value by value: factorizing first does not pay off on mostly unique OrderIDs
+    hashes = pd.util.hash_array(values.fillna('').to_numpy(dtype=object), categorize=False)
+    parts = (hashes % np.uint64(partitions)).astype(np.int64)
+    parts[missing] = 0
+    return parts
+
+
+# ---------------------- Spill Files ---------------------- #
+def spill_schema(columns):
+    # Arrow schema of a side's partition files; columns are the normalized column names.
+    # Columns other than Amount and Date are kept as text.
+    fields = []
+    for column in columns:
+        if column == 'Amount':
+            fields.append(pa.field(column, pa.float64()))
+        elif column == 'Date':
+            fields.append(pa.field(column, pa.timestamp('us')))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields + [pa.field(ROW, pa.int64()), pa.field(FILE, pa.int32())])
+
+
+def conform(df, schema, rows=0, file_index=0):
+    # A normalized frame as an Arrow table of the spill schema. Rows are numbered from
+    # rows and labelled with file_index unless the frame already has those columns.
+    arrays = []
+    for field in schema:
+        if field.name == ROW and ROW not in df.columns:
+            arrays.append(pa.array(np.arange(rows, rows + len(df), dtype=np.int64)))
+        elif field.name == FILE and FILE not in df.columns:
+            arrays.append(pa.array(np.full(len(df), file_index, dtype=np.int32)))
+        elif field.name in (ROW, FILE):
+            arrays.append(pa.array(df[field.name].to_numpy(dtype=field.type.to_pandas_dtype())))
+        elif field.name not in df.columns:
+            arrays.append(pa.nulls(len(df), field.type))
+        elif pa.types.is_string(field.type):
+            arrays.append(pa.Array.from_pandas(df[field.name].astype('string'), type=pa.string()))
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.Array.from_pandas(df[field.name].astype('datetime64[us]')))
+        else:
+            arrays.append(pa.Array.from_pandas(df[field.name].to_numpy(dtype=float, na_value=np.nan)))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def read_arrow(path):
+    # Memory-mapped, zero-copy view of a partition or output file
+    return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+
+def write_arrow(path, table):
+    # Written beside the target and renamed over it: a file may be rewritten from a
+    # memory-mapped read of itself, and truncating it would pull the data from under that read
+    partial = f"{path}.partial"
+    with pa.OSFile(partial, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(partial, path)
+
+
+class Spill:
+    # The partition files of one out-of-core session. Each row of a side is written
+    # to partition hash(OrderID) % partitions, so every partition can be joined and
+    # diffed without looking at any other.
+
+    def __init__(self, directory, partitions):
+        self.directory = directory
+        self.partitions = partitions
+        # side -> {'schema', 'rows', 'min_date', 'max_date'}
+        self.sides = {}
+        # Labels of a multi-file session's files, the categories of its SourceFile column
+        self.source_files = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, side, partition):
+        return os.path.join(self.directory, f"{side}-{partition:04d}.arrow")
+
+    def read(self, side, partition):
+        return read_arrow(self.path(side, partition))
+
+    def partition_bytes(self, partition):
+        return sum(os.path.getsize(self.path(side, partition)) for side in self.sides)
+
+    def nbytes(self):
+        return sum(self.partition_bytes(p) for p in range(self.partitions))
+
+    def output_dir(self):
+        # A fresh directory for one run's partition outputs
+        return tempfile.mkdtemp(dir=self.directory, prefix='run-')
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SpillWriter:
+    # Appends normalized batches of one side to its partition files, numbering rows
+    # in upload order; the row number restores that order when results are merged
+
+    def __init__(self, spill, side, columns):
+        self.spill = spill
+        self.side = side
+        self.schema = spill_schema(columns)
+        self.rows = 0
+        self.min_date = None
+        self.max_date = None
+        self._sinks = []
+        self._writers = []
+        for partition in range(spill.partitions):
+            sink = pa.OSFile(spill.path(side, partition), 'wb')
+            self._sinks.append(sink)
+            self._writers.append(pa.ipc.new_file(sink, self.schema))
+
+    def write(self, df, file_index):
+        table = conform(df, self.schema, self.rows, file_index)
+        self.rows += len(df)
+        if 'Date' in df.columns and df['Date'].notna().any():
+            low, high = df['Date'].min(), df['Date'].max()
+            self.min_date = low if self.min_date is None else min(self.min_date, low)
+            self.max_date = high if self.max_date is None else max(self.max_date, high)
+        parts = partition_of(df['OrderID'], self.spill.partitions)
+        # Grouped by partition, keeping upload order within each
+        order = np.argsort(parts, kind='stable')
+        table = table.take(pa.array(order))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(parts, minlength=self.spill.partitions))])
+        for partition in np.flatnonzero(np.diff(offsets)):
+            start = int(offsets[partition])
+            self._writers[partition].write_table(table.slice(start, int(offsets[partition + 1]) - start))
+
+    def close(self):
+        for writer, sink in zip(self._writers, self._sinks):
+            writer.close()
+            sink.close()
+        self.spill.sides[self.side] = {'schema': self.schema, 'rows': self.rows,
+                                       'min_date': self.min_date, 'max_date': self.max_date}
+
+
+# ---------------------- Partition Workers ---------------------- #
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OUT_OF_CORE_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_executor():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def run_partitions(function, tasks, workers, check_cancelled=None):
+    # function(task) for every task, at most workers at a time in worker processes
+    # (in this process when only one may run); results come back in task order.
+    # check_cancelled() is called as each task finishes.
+    results = [None] * len(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for i, task in enumerate(tasks):
+            results[i] = function(task)
+            if check_cancelled:
+                check_cancelled()
+        return results
+
+    pending = list(enumerate(tasks))[::-1]
+    running = {}
+    try:
+        executor = _executor()
+        while pending or running:
+            while pending and len(running) < workers:
+                i, task = pending.pop()
+                running[executor.submit(function, task)] = i
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+            if check_cancelled:
+                check_cancelled()
+    except BrokenProcessPool:
+        # Workers could not start here; run what is left one after another instead
+        _reset_executor()
+        for i, task in enumerate(tasks):
+            if results[i] is None:
+                results[i] = function(task)
+                if check_cancelled:
+                    check_cancelled()
+    finally:
+        for future in running:
+            future.cancel()
+    return results
+
+
+# ---------------------- Ordered Merge ---------------------- #
+def unified(tables):
+    # The tables cast to one schema (a column that is all null in one partition is typed there)
+    schema = pa.unify_schemas([t.schema.remove_metadata() for t in tables], promote_options='permissive')
+    return [t.select(schema.names).cast(schema) for t in tables], schema
+
+
+def with_pandas_metadata(schema, source):
+    # schema carrying source's pandas metadata (for the columns schema has), so a frame
+    # merged from partitions reads back with the dtypes the partitions had in pandas
+    metadata = (source.metadata or {}).get(b'pandas')
+    if metadata is None:
+        return schema
+    pandas = json.loads(metadata)
+    pandas['columns'] = [column for column in pandas['columns'] if column['name'] in schema.names]
+    return schema.with_metadata({b'pandas': json.dumps(pandas).encode()})
+
+
+def merge_sorted(tables, key, batch_rows=MERGE_BATCH_ROWS):
+    # tables: Arrow tables each sorted by key, nulls last. Yields tables that together
+    # hold every row in key order, reading a bounded slice of each table per step:
+    # everything up to the smallest last key of the slices taken is final.
+    step = max(batch_rows // max(len(tables), 1), 1000)
+    valid = [t.num_rows - t[key].null_count for t in tables]
+    positions = [0] * len(tables)
+    while True:
+        live = [i for i in range(len(tables)) if positions[i] < valid[i]]
+        if not live:
+            break
+        chunks = {i: tables[i].slice(positions[i], min(step, valid[i] - positions[i])) for i in live}
+        keys = {i: chunk[key].to_numpy(zero_copy_only=False) for i, chunk in chunks.items()}
+        bounds = [keys[i][-1] for i in live if positions[i] + len(keys[i]) < valid[i]]
+        taken = []
+        for i in live:
+            count = len(keys[i]) if not bounds else int(np.searchsorted(keys[i], min(bounds), side='right'))
+            if count:
+                taken.append(chunks[i].slice(0, count))
+                positions[i] += count
+        merged = pa.concat_tables(taken)
+        yield merged.take(pc.sort_indices(merged, sort_keys=[(key, 'ascending')]))
+    # Rows without a key come last, partition by partition
+    for table, start in zip(tables, valid):
+        if start < table.num_rows:
+            yield table.slice(start)
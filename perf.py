@@ -0,0 +1,233 @@
+# perf.py
+
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+# ---------------------- Configuration ---------------------- #
+
+# Record spans in this process; the app can also turn recording on per browser session
+PERF_ENABLED = os.environ.get('PERF_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+# Finished runs are appended here as JSON lines (one span per line) when set
+PERF_JSONL_PATH = os.environ.get('PERF_JSONL_PATH')
+
+# Upper bounds (seconds) of the Prometheus span duration histogram
+PERF_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans kept per run; a run that makes more keeps counting them in the metrics only
+PERF_MAX_SPANS = 2000
+
+# Prefix of every exported metric name
+METRIC_PREFIX = 'excelcompare'
+
+# ---------------------- Spans ---------------------- #
+# Hot paths wrap their work in a span and fill in what they moved:
+#   with perf.span('decode', format='arrow') as span:
+#       df = decode_frame(body)
+#       span['rows'] = len(df); span['bytes'] = len(body)
+# With nothing recording, span() returns one shared no-op context manager, so
+# the cost is a context variable lookup.
+
+_current = contextvars.ContextVar('perf_run', default=None)
+
+
+class _NullSpan:
+    # Stands in for a span when nothing records; what callers write is discarded
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, run, name, fields):
+        self.run = run
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.run.add(self.name, time.perf_counter() - self.started, started=self.started,
+                     ok=exc_type is None, **self.fields)
+        return False
+
+
+def span(name, **fields):
+    run = _current.get()
+    if run is None:
+        if not PERF_ENABLED:
+            return NULL_SPAN
+        run = PROCESS_RUN
+    return _Span(run, name, fields)
+
+
+def record(name, seconds, count=True, **fields):
+    # A span timed elsewhere, e.g. a stage time the backend reported. count=False keeps
+    # it out of METRICS when the process that did the work already counted it.
+    run = _current.get() or (PROCESS_RUN if PERF_ENABLED else None)
+    if run is not None:
+        run.add(name, seconds, count=count, **fields)
+
+
+def activate(run):
+    # Spans made by this thread, and by work it hands to backend.fetch_concurrently,
+    # go to run from now on; None stops recording. Returns a token for deactivate().
+    return _current.set(run)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def active():
+    # The run spans go to, or None
+    return _current.get()
+
+
+# ---------------------- Runs ---------------------- #
+class Run:
+    # The spans of one unit of work (one Streamlit rerun); every span also counts in METRICS
+
+    def __init__(self, label=None, metrics=None):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.metrics = metrics if metrics is not None else METRICS
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, started=None, ok=True, count=True, **fields):
+        entry = {
+            'name': name,
+            'start': round((started if started is not None else time.perf_counter() - seconds) - self.started, 6),
+            'seconds': round(seconds, 6),
+            'ok': ok,
+            'thread': threading.current_thread().name,
+            **{key: value for key, value in fields.items() if value is not None},
+        }
+        with self._lock:
+            if len(self.spans) < PERF_MAX_SPANS:
+                self.spans.append(entry)
+            else:
+                self.dropped += 1
+        if count:
+            self.metrics.observe(name, seconds, bytes_moved=fields.get('bytes'), rows=fields.get('rows'), ok=ok)
+
+    def summary(self):
+        # One row per span name: calls, total and slowest time, bytes and rows
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for entry in spans:
+            row = rows.setdefault(entry['name'], {'Span': entry['name'], 'Calls': 0, 'Total (ms)': 0.0,
+                                                  'Max (ms)': 0.0, 'Bytes': 0, 'Rows': 0})
+            row['Calls'] += 1
+            row['Total (ms)'] += entry['seconds'] * 1000
+            row['Max (ms)'] = max(row['Max (ms)'], entry['seconds'] * 1000)
+            row['Bytes'] += entry.get('bytes') or 0
+            row['Rows'] += entry.get('rows') or 0
+        for row in rows.values():
+            row['Total (ms)'] = round(row['Total (ms)'], 1)
+            row['Max (ms)'] = round(row['Max (ms)'], 1)
+        return sorted(rows.values(), key=lambda row: -row['Total (ms)'])
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def jsonl(self):
+        # The run as JSON lines, one span per line
+        with self._lock:
+            spans = list(self.spans)
+        lines = [json.dumps({'run': self.id, 'label': self.label, 'time': round(self.wall_started, 3), **entry},
+                            default=str) for entry in spans]
+        return ''.join(line + '\n' for line in lines)
+
+    def export(self, path=PERF_JSONL_PATH):
+        if path:
+            with open(path, 'a', encoding='utf-8') as target:
+                target.write(self.jsonl())
+
+
+# ---------------------- Metrics ---------------------- #
+class Metrics:
+    # Totals per span name since the process started, in Prometheus text format
+
+    def __init__(self, buckets=PERF_BUCKETS):
+        self.buckets = buckets
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._seconds = defaultdict(float)
+        self._bytes = defaultdict(int)
+        self._rows = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, bytes_moved=None, rows=None, ok=True):
+        bucket = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            self._counts[name][bucket] += 1
+            self._seconds[name] += seconds
+            if bytes_moved:
+                self._bytes[name] += int(bytes_moved)
+            if rows:
+                self._rows[name] += int(rows)
+            if not ok:
+                self._errors[name] += 1
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            names = sorted(self._counts)
+            counts = {name: list(self._counts[name]) for name in names}
+            seconds = dict(self._seconds)
+            totals = {'bytes': dict(self._bytes), 'rows': dict(self._rows), 'errors': dict(self._errors)}
+        metric = f"{METRIC_PREFIX}_span_seconds"
+        lines += [f"# HELP {metric} Time spent in each instrumented stage or call.",
+                  f"# TYPE {metric} histogram"]
+        for name in names:
+            label = _label(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts[name]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{span="{label}",le="+Inf"}} {sum(counts[name])}')
+            lines.append(f'{metric}_sum{{span="{label}"}} {seconds[name]:.6f}')
+            lines.append(f'{metric}_count{{span="{label}"}} {sum(counts[name])}')
+        for kind, help_text in (('bytes', 'Bytes moved'), ('rows', 'Rows handled'), ('errors', 'Spans that raised')):
+            metric = f"{METRIC_PREFIX}_span_{kind}_total"
+            lines += [f"# HELP {metric} {help_text} by each instrumented stage or call.", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{span="{_label(name)}"}} {value}' for name, value in sorted(totals[kind].items())]
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = Metrics()
+
+
+class _MetricsOnly:
+    # Where spans go outside any run (backend jobs, server requests) when PERF_ENABLED
+    # is set: nothing is kept per span, they only count in METRICS
+
+    def add(self, name, seconds, started=None, ok=True, count=True, **fields):
+        if count:
+            METRICS.observe(name, seconds, bytes_moved=fields.get('bytes'), rows=fields.get('rows'), ok=ok)
+
+
+PROCESS_RUN = _MetricsOnly()
@@ -0,0 +1,474 @@
+# server.py
+
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from fastapi import Body, FastAPI, File, Header, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from blobs import BlobStore
+from engine import EngineError, ReconciliationEngine, to_records
+import perf
+from export import EXPORT_FORMATS
+from transport import ARROW_STREAM, CLIENT_ID_HEADER, TOTAL_RECORDS_HEADER, encode_search, encode_table, wants_arrow
+from upload import decompressor
+
+# ---------------------- Configuration ---------------------- #
+
+# Origins allowed to call the API from the browser (the virtual grid fetches pages directly)
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
+
+# Files of resumable uploads while they arrive, one data and one metadata file per upload
+RESUMABLE_DIR = os.environ.get('RESUMABLE_DIR', os.path.join(tempfile.gettempdir(), 'excelcompare_resumable'))
+
+# Required in the X-Admin-Token header of /admin endpoints; they are disabled while it is unset,
+# as the session IDs they list grant full access to those sessions
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# ---------------------- Reference Backend ---------------------- #
+# Serves the in-process engine over the same endpoints app.py calls, so the
+# HTTP mode can be run and tested without the production backend:
+#   uvicorn server:app --port 8000
+
+app = FastAPI(title="ExcelCompare backend")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=CORS_ORIGINS,
+    allow_methods=['*'],
+    allow_headers=['*'],
+    expose_headers=[TOTAL_RECORDS_HEADER],
+)
+
+
+if perf.PERF_ENABLED:
+    @app.middleware('http')
+    async def time_requests(request: Request, call_next):
+        # Timed per route template, so /jobs/{job_id} is one series rather than one per job
+        started = time.perf_counter()
+        ok = False
+        try:
+            response = await call_next(request)
+            ok = response.status_code < 500
+            return response
+        finally:
+            route = request.scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            perf.record(f"server {request.method} {path}", time.perf_counter() - started, ok=ok)
+
+engine = ReconciliationEngine()
+blobs = BlobStore()
+
+
+class ProcessRequest(BaseModel):
+    session_id: str
+    start_date: str | None = None
+    end_date: str | None = None
+    matching: dict | None = None
+
+
+class BatchSearchRequest(BaseModel):
+    session_id: str
+    orderids: list[str]
+
+
+class ResumableStart(BaseModel):
+    field: str
+    filename: str
+    size: int
+    chunk_size: int | None = None
+
+
+class ResumableComplete(BaseModel):
+    # One upload ID per side, or a list of them
+    api_file: str | list[str]
+    dashboard_file: str | list[str]
+
+
+class BlobQuery(BaseModel):
+    hashes: list[str]
+
+
+class BlobRef(BaseModel):
+    hash: str
+    filename: str
+
+
+class BlobUpload(BaseModel):
+    # One file per side, or a list of them
+    api_file: BlobRef | list[BlobRef]
+    dashboard_file: BlobRef | list[BlobRef]
+
+
+def _run(method, *args, **kwargs):
+    try:
+        return method(*args, **kwargs)
+    except EngineError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail) from e
+
+
+def _json_param(value, name):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {e}") from e
+
+
+@app.post('/upload')
+def upload(api_file: list[UploadFile] = File(...), dashboard_file: list[UploadFile] = File(...),
+           schema: str | None = None, out_of_core: bool | None = None,
+           client_id: str | None = Header(default=None, alias=CLIENT_ID_HEADER)):
+    # Each field may be repeated to send several files for that side.
+    # out_of_core forces either mode; left out, the engine decides from the upload's size.
+    # The client's identity, when sent, owns the session's jobs (see engine.upload_files).
+    return _run(engine.upload_files, [(f.filename, f.file) for f in api_file],
+                [(f.filename, f.file) for f in dashboard_file], schema=_json_param(schema, 'schema'),
+                out_of_core=out_of_core, owner=client_id)
+
+
+# ---------------------- Resumable Uploads ---------------------- #
+# POST /upload/resumable announces a file and returns its upload ID; chunks are
+# PUT at the offset the server holds (GET reports it after a dropped
+# connection), and POST /upload/resumable/complete starts the session once
+# every file is whole.
+
+def _resumable_paths(upload_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        raise HTTPException(status_code=400, detail="Invalid upload ID")
+    data_path = os.path.join(RESUMABLE_DIR, upload_id)
+    if not os.path.exists(f"{data_path}.json"):
+        raise HTTPException(status_code=404, detail="Upload not found; start it again")
+    return data_path, f"{data_path}.json"
+
+
+def _resumable_offset(upload_id):
+    data_path, meta_path = _resumable_paths(upload_id)
+    with open(meta_path, encoding='utf-8') as source:
+        meta = json.load(source)
+    return meta, os.path.getsize(data_path)
+
+
+@app.post('/upload/resumable')
+def start_resumable(body: ResumableStart):
+    if body.size < 0:
+        raise HTTPException(status_code=400, detail="File size cannot be negative")
+    os.makedirs(RESUMABLE_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    data_path = os.path.join(RESUMABLE_DIR, upload_id)
+    open(data_path, 'wb').close()
+    with open(f"{data_path}.json", 'w', encoding='utf-8') as target:
+        json.dump({'field': body.field, 'filename': body.filename, 'size': body.size}, target)
+    return {'upload_id': upload_id}
+
+
+@app.get('/upload/resumable/{upload_id}')
+def resumable_offset(upload_id: str):
+    meta, offset = _resumable_offset(upload_id)
+    return {'offset': offset, 'size': meta['size']}
+
+
+# One lock per upload, held from the offset check to the append, so two PUTs of the
+# same chunk (a client retrying while the first is still in flight) cannot both append
+_resumable_locks = {}
+
+
+@app.put('/upload/resumable/{upload_id}')
+def put_resumable_chunk(upload_id: str, offset: int,
+                        chunk: bytes = Body(default=b'', media_type='application/octet-stream')):
+    # A chunk sent for any other offset than the one held is not kept; the reply
+    # carries the held offset so the client carries on from there. A plain def, so
+    # the file IO runs in the thread pool; a chunk is at most the client's CHUNK_SIZE.
+    data_path, _ = _resumable_paths(upload_id)
+    with _resumable_locks.setdefault(upload_id, threading.Lock()):
+        meta, held = _resumable_offset(upload_id)
+        if offset != held:
+            return {'offset': held}
+        if held + len(chunk) > meta['size']:
+            raise HTTPException(status_code=400, detail="Chunk runs past the announced file size")
+        with open(data_path, 'ab') as target:
+            target.write(chunk)
+        return {'offset': held + len(chunk)}
+
+
+@app.post('/upload/resumable/complete')
+def complete_resumable(body: ResumableComplete, schema: str | None = None, out_of_core: bool | None = None,
+                       client_id: str | None = Header(default=None, alias=CLIENT_ID_HEADER)):
+    ids = {field: value if isinstance(value, list) else [value]
+           for field, value in (('api', body.api_file), ('dashboard', body.dashboard_file))}
+    metas = {}
+    for field, field_ids in ids.items():
+        for upload_id in field_ids:
+            meta, held = _resumable_offset(upload_id)
+            if held != meta['size']:
+                raise HTTPException(status_code=409, detail=f"The {field} file {meta['filename']} is incomplete: "
+                                                            f"{held:,} of {meta['size']:,} bytes")
+            metas[upload_id] = meta
+    with ExitStack() as stack:
+        files = {field: [(metas[upload_id]['filename'],
+                          stack.enter_context(open(_resumable_paths(upload_id)[0], 'rb'))) for upload_id in field_ids]
+                 for field, field_ids in ids.items()}
+        result = _run(engine.upload_files, files['api'], files['dashboard'], schema=_json_param(schema, 'schema'),
+                      out_of_core=out_of_core, owner=client_id)
+    for upload_id in metas:
+        for path in _resumable_paths(upload_id):
+            os.remove(path)
+        _resumable_locks.pop(upload_id, None)
+    return result
+
+
+# ---------------------- Content-addressed Uploads ---------------------- #
+# Blobs are scoped to the client that sent them (the X-Client-Id header): asking
+# whether a hash is held, or starting a session from it, works only for content
+# that client uploaded itself. See blobs.py for their eviction.
+
+def _blob_owner(client_id):
+    if not client_id:
+        raise HTTPException(status_code=400, detail=f"Blob uploads need the {CLIENT_ID_HEADER} header")
+    return client_id
+
+
+@app.post('/blobs/exists')
+def blobs_exist(body: BlobQuery, client_id: str | None = Header(default=None, alias=CLIENT_ID_HEADER)):
+    return {'present': blobs.present(_blob_owner(client_id), body.hashes)}
+
+
+@app.put('/blobs/{digest}')
+async def put_blob(digest: str, request: Request,
+                   client_id: str | None = Header(default=None, alias=CLIENT_ID_HEADER)):
+    # Decompresses as it reads and keeps the file only if it matches its hash. The body
+    # is too large to take whole, so the route stays async and the decompression and
+    # disk work of each chunk run in the thread pool.
+    owner = _blob_owner(client_id)
+    try:
+        blobs.path(digest)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    try:
+        decoder = decompressor(request.headers.get('content-encoding', 'identity'))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e)) from e
+    fd, tmp_path = await run_in_threadpool(blobs.temporary)
+    sha256 = hashlib.sha256()
+
+    def write(data):
+        sha256.update(data)
+        target.write(data)
+
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            async for chunk in request.stream():
+                if not chunk:
+                    continue
+                if decoder:
+                    await run_in_threadpool(lambda: write(decoder.decompress(chunk)))
+                else:
+                    await run_in_threadpool(write, chunk)
+            if decoder:
+                await run_in_threadpool(lambda: write(decoder.flush()))
+        if sha256.hexdigest() != digest:
+            raise HTTPException(status_code=400, detail="Upload does not match its content hash")
+        size = await run_in_threadpool(blobs.add, owner, digest, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return {'hash': digest, 'size': size}
+
+
+def _open_blob(stack, owner, field, ref):
+    try:
+        return stack.enter_context(blobs.open(owner, ref.hash))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except (KeyError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=f"The {field} file {ref.filename} has not been uploaded") from e
+
+
+@app.post('/upload/blobs')
+def upload_blobs(body: BlobUpload, schema: str | None = None, out_of_core: bool | None = None,
+                 client_id: str | None = Header(default=None, alias=CLIENT_ID_HEADER)):
+    # Starts a session from files this client already sent (or already held) as blobs
+    owner = _blob_owner(client_id)
+    refs = {field: value if isinstance(value, list) else [value]
+            for field, value in (('api', body.api_file), ('dashboard', body.dashboard_file))}
+    with ExitStack() as stack:
+        files = {field: [(ref.filename, _open_blob(stack, owner, field, ref)) for ref in field_refs]
+                 for field, field_refs in refs.items()}
+        return _run(engine.upload_files, files['api'], files['dashboard'], schema=_json_param(schema, 'schema'),
+                    out_of_core=out_of_core, owner=owner)
+
+
+@app.get('/get_date_range')
+def get_date_range(session_id: str):
+    return _run(engine.get_date_range, session_id)
+
+
+@app.post('/process')
+def process(body: ProcessRequest):
+    return _run(engine.process, body.session_id, body.start_date, body.end_date, matching=body.matching)
+
+
+# ---------------------- Background Jobs ---------------------- #
+# POST /jobs/process returns a job snapshot right away; clients poll
+# GET /jobs/{job_id} for stage progress and DELETE it to cancel.
+
+@app.post('/jobs/process')
+def start_process(body: ProcessRequest):
+    return _run(engine.start_process, body.session_id, body.start_date, body.end_date, matching=body.matching)
+
+
+@app.get('/jobs/{job_id}')
+def job_status(job_id: str):
+    return _run(engine.job, job_id)
+
+
+@app.delete('/jobs/{job_id}')
+def cancel_job(job_id: str):
+    return _run(engine.cancel_job, job_id)
+
+
+@app.get('/cube')
+def cube(session_id: str):
+    # Every metric and chart of the session in one response; see cube.py
+    return _run(engine.cube, session_id)
+
+
+@app.get('/charts/{name}')
+def chart(name: str, session_id: str, start_date: str | None = None, end_date: str | None = None,
+          points: int | None = None):
+    # Plotly figure JSON, already downsampled; see charts.py
+    figure = _run(engine.chart, session_id, name, start_date=start_date, end_date=end_date, points=points)
+    return Response(content=figure, media_type='application/json')
+
+
+@app.get('/summary')
+def summary(session_id: str):
+    return _run(engine.summary, session_id)
+
+
+@app.get('/status_counts')
+def status_counts(session_id: str):
+    return _run(engine.status_counts, session_id)
+
+
+@app.get('/total_amount_per_status')
+def total_amount_per_status(session_id: str):
+    return _run(engine.total_amount_per_status, session_id)
+
+
+# ---------------------- Tables: Arrow or JSON ---------------------- #
+# Clients that accept application/vnd.apache.arrow.stream get the page as an
+# Arrow IPC stream with the row count in X-Total-Records; everyone else (the
+# browser grid included) gets the JSON records body.
+
+def _page(request, endpoint, session_id, page, page_size, sort, filters, columns):
+    table, total_records = _run(
+        engine.get_page_table, session_id, endpoint, page, page_size,
+        sort=_json_param(sort, 'sort'),
+        filters=_json_param(filters, 'filters'),
+        columns=[c for c in columns.split(',') if c] if columns else None,
+    )
+    if wants_arrow(request.headers.get('accept')):
+        return Response(content=encode_table(table).to_pybytes(), media_type=ARROW_STREAM,
+                        headers={TOTAL_RECORDS_HEADER: str(total_records)})
+    return {
+        'data': to_records(table.to_pandas()),
+        'total_records': total_records,
+        'page': page,
+        'page_size': page_size,
+    }
+
+
+def _register_page_endpoint(endpoint):
+    def page_endpoint(request: Request, session_id: str, page: int = 1, page_size: int = 100,
+                      sort: str | None = None, filters: str | None = None, columns: str | None = None):
+        return _page(request, endpoint, session_id, page, page_size, sort, filters, columns)
+    app.add_api_route(f"/{endpoint}", page_endpoint, methods=['GET'], name=endpoint)
+
+
+for _endpoint in ReconciliationEngine.PAGE_ENDPOINTS:
+    _register_page_endpoint(_endpoint)
+
+
+@app.get('/search')
+def search(request: Request, session_id: str, orderid: str, match: str = 'exact', orderid_end: str | None = None):
+    results = _run(engine.search, session_id, orderid, match=match, orderid_end=orderid_end)
+    if wants_arrow(request.headers.get('accept')):
+        return Response(content=encode_search(results['api_matches'], results['dashboard_matches']).to_pybytes(),
+                        media_type=ARROW_STREAM)
+    return {side: to_records(df) for side, df in results.items()}
+
+
+@app.post('/search/batch')
+def search_batch(request: Request, body: BatchSearchRequest):
+    results = _run(engine.search_batch, body.session_id, body.orderids)
+    if wants_arrow(request.headers.get('accept')):
+        return Response(content=encode_search(results['api_matches'], results['dashboard_matches'],
+                                              not_found=results['not_found']).to_pybytes(),
+                        media_type=ARROW_STREAM)
+    return {
+        'api_matches': to_records(results['api_matches']),
+        'dashboard_matches': to_records(results['dashboard_matches']),
+        'not_found': results['not_found'],
+    }
+
+
+@app.get('/download/{report}')
+def download(report: str, session_id: str, format: str = 'csv'):
+    # Streamed with chunked transfer encoding as the rows are converted
+    chunks = _run(engine.export, session_id, report, format)
+    extension, media_type = EXPORT_FORMATS[format]
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{report}.{extension}"'})
+
+
+@app.delete('/session/{session_id}')
+def end_session(session_id: str):
+    return _run(engine.end_session, session_id)
+
+
+@app.get('/session/{session_id}/version')
+def results_version(session_id: str):
+    return _run(engine.results_version, session_id)
+
+
+# ---------------------- Shared Sessions ---------------------- #
+# POST /session/{session_id}/share returns a token that opens the processed
+# session read-only; GET /share/{token} attaches to it.
+
+@app.post('/session/{session_id}/share')
+def share_session(session_id: str):
+    return _run(engine.share_session, session_id)
+
+
+@app.get('/share/{token}')
+def open_share(token: str):
+    return _run(engine.open_share, token)
+
+
+# ---------------------- Admin ---------------------- #
+@app.get('/admin/sessions')
+def admin_sessions(x_admin_token: str | None = Header(default=None)):
+    # Live sessions, least recently used first, with the memory and disk each holds
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(x_admin_token or '', ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    return engine.sessions_report()
+
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text format; populated when the server runs with PERF_ENABLED=1
+    return PlainTextResponse(perf.METRICS.prometheus(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,184 @@
+# sessions.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------------- Configuration ---------------------- #
+
+# Sessions not used for this long are ended and their files deleted
+SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 2 * 60 * 60))
+
+# Memory all sessions may hold together; past it, the least recently used are spilled to disk
+SESSION_MEMORY_BUDGET_MB = int(os.environ.get('SESSION_MEMORY_BUDGET_MB', 4096))
+
+# Disk all sessions may use together; past it, the least recently used are ended
+SESSION_DISK_BUDGET_MB = int(os.environ.get('SESSION_DISK_BUDGET_MB', 50 * 1024))
+
+# Seconds between checks for idle sessions (budgets are also checked as sessions grow)
+SESSION_SWEEP_SECONDS = 60
+
+# Ended sessions remembered, so a late request is told its session expired
+EXPIRED_SESSIONS_KEPT = 10000
+
+
+# ---------------------- Session Registry ---------------------- #
+class SessionRegistry:
+    # Every live session, in least-recently-used order, with the bytes it holds in
+    # memory and on disk. A background sweep ends sessions idle past the TTL; when
+    # the memory budget is exceeded the least recently used sessions are spilled
+    # (their memory moved to disk), and only the disk budget ends sessions early.
+    #   measure(session_id, session) -> (memory bytes, disk bytes)
+    #   spill(session_id, session) -> True if the session's memory was released
+    #   evict(session_id, session) frees everything the session holds
+    #   in_use(session) -> True while the session must not be ended or spilled
+
+    def __init__(self, measure, spill, evict, in_use, ttl=SESSION_TTL_SECONDS,
+                 memory_budget=SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+                 disk_budget=SESSION_DISK_BUDGET_MB * 1024 * 1024, sweep_seconds=SESSION_SWEEP_SECONDS):
+        self.measure = measure
+        self.spill = spill
+        self.evict = evict
+        self.in_use = in_use
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._entries = OrderedDict()
+        self._expired = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_forever, args=(sweep_seconds,),
+                                         name='session-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def add(self, session_id, session):
+        now = time.time()
+        memory, disk = self.measure(session_id, session)
+        with self._lock:
+            self._entries[session_id] = {'session': session, 'created': now, 'last_used': now,
+                                         'memory': memory, 'disk': disk}
+        self._wake.set()
+
+    def get(self, session_id):
+        # The session, marked as just used; None if it does not exist (any more)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            entry['last_used'] = time.time()
+            self._entries.move_to_end(session_id)
+            return entry['session']
+
+    def peek(self, session_id):
+        # The session without marking it used
+        with self._lock:
+            entry = self._entries.get(session_id)
+        return entry['session'] if entry else None
+
+    def expired(self, session_id):
+        # Whether the session was ended by the registry rather than never existing
+        with self._lock:
+            return session_id in self._expired
+
+    def pop(self, session_id):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+        return entry['session'] if entry else None
+
+    def resize(self, session_id):
+        # Measures the session again after it grew or shrank; budgets are enforced in the background
+        with self._lock:
+            entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        memory, disk = self.measure(session_id, entry['session'])
+        with self._lock:
+            entry['memory'], entry['disk'] = memory, disk
+            over = self._total('memory') > self.memory_budget or self._total('disk') > self.disk_budget
+        if over:
+            self._wake.set()
+
+    def _total(self, key):
+        return sum(entry[key] for entry in self._entries.values())
+
+    def report(self):
+        # Live sessions, least recently used first, and the totals against the budgets
+        now = time.time()
+        with self._lock:
+            sessions = [{
+                'session_id': session_id,
+                'created': round(entry['created'], 3),
+                'last_used': round(entry['last_used'], 3),
+                'idle_seconds': round(now - entry['last_used'], 1),
+                'memory_bytes': entry['memory'],
+                'disk_bytes': entry['disk'],
+            } for session_id, entry in self._entries.items()]
+        return {
+            'sessions': sessions,
+            'memory_bytes': sum(s['memory_bytes'] for s in sessions),
+            'disk_bytes': sum(s['disk_bytes'] for s in sessions),
+            'memory_budget_bytes': self.memory_budget,
+            'disk_budget_bytes': self.disk_budget,
+            'ttl_seconds': self.ttl,
+        }
+
+    # ---------------------- Eviction ---------------------- #
+    def sweep(self):
+        # Ends idle sessions, then spills and (past the disk budget) ends the least recently used
+        now = time.time()
+        with self._lock:
+            idle = [session_id for session_id, entry in self._entries.items()
+                    if now - entry['last_used'] > self.ttl]
+        for session_id in idle:
+            self._end(session_id, lambda entry: time.time() - entry['last_used'] > self.ttl)
+        self._spill_over_budget()
+        self._end_over_budget()
+
+    def _candidates(self, key, budget):
+        # Least recently used sessions, oldest first, whose bytes bring the total under budget.
+        # The most recently used session is left alone: it is the one being worked on.
+        with self._lock:
+            excess = self._total(key) - budget
+            entries = list(self._entries.items())[:-1]
+        chosen = []
+        for session_id, entry in entries:
+            if excess <= 0:
+                break
+            if entry[key] and not self.in_use(entry['session']):
+                chosen.append(session_id)
+                excess -= entry[key]
+        return chosen
+
+    def _spill_over_budget(self):
+        for session_id in self._candidates('memory', self.memory_budget):
+            with self._lock:
+                entry = self._entries.get(session_id)
+            if entry is not None and self.spill(session_id, entry['session']):
+                self.resize(session_id)
+
+    def _end_over_budget(self):
+        for session_id in self._candidates('disk', self.disk_budget):
+            self._end(session_id, lambda entry: True)
+
+    def _end(self, session_id, still_due):
+        # Unregisters the session first, so no request picks it up while it is freed
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or not still_due(entry) or self.in_use(entry['session']):
+                return
+            del self._entries[session_id]
+            self._expired[session_id] = time.time()
+            while len(self._expired) > EXPIRED_SESSIONS_KEPT:
+                self._expired.popitem(last=False)
+        self.evict(session_id, entry['session'])
+
+    def _sweep_forever(self, interval):
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.sweep()
+            except Exception:
+                # A failed sweep is retried on the next one
+                pass
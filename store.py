@@ -0,0 +1,293 @@
+# store.py
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from index import OrderIDIndex
+
+# ---------------------- Configuration ---------------------- #
+
+# Where processed frames are written, one directory per session
+SESSION_STORE_DIR = os.environ.get(
+    'SESSION_STORE_DIR', os.path.join(tempfile.gettempdir(), 'excelcompare_sessions')
+)
+
+# Filter operations SessionStore.query understands
+FILTER_OPS = ('prefix', 'in', 'between', 'gt', 'lt')
+
+# Filtered/sorted row orders kept so paging through a query does not recompute it
+QUERY_CACHE_SIZE = 64
+
+
+class QueryError(ValueError):
+    # Raised for a sort key, filter or column the stored frame cannot satisfy
+    pass
+
+
+def _scalar(value, arrow_type):
+    # Convert a JSON filter value to something comparable with the column
+    if value is None:
+        return None
+    if pa.types.is_timestamp(arrow_type):
+        return pa.scalar(pd.Timestamp(value), type=pa.timestamp('ns')).cast(arrow_type, safe=False)
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        return pa.scalar(float(value)).cast(pa.float64())
+    return pa.scalar(value).cast(arrow_type)
+
+
+def _day_end(value, arrow_type):
+    # A bare date bounding a timestamp column from above covers the whole day
+    if pa.types.is_timestamp(arrow_type) and isinstance(value, str) and len(value) == 10:
+        return (pd.Timestamp(value) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')).isoformat()
+    return value
+
+
+def _condition(values, op, value):
+    # The boolean mask of one filter predicate, or None when it does not restrict anything
+    if op == 'prefix':
+        return pc.starts_with(pc.cast(values, pa.string()), str(value))
+    if op == 'in':
+        # Categorical columns are stored dictionary-encoded; match on their values
+        value_type = values.type.value_type if pa.types.is_dictionary(values.type) else values.type
+        return pc.is_in(values, value_set=pa.array(list(value)).cast(value_type))
+    if op == 'between':
+        low, high = value
+        condition = None
+        if low is not None:
+            condition = pc.greater_equal(values, _scalar(low, values.type))
+        if high is not None:
+            upper = pc.less_equal(values, _scalar(_day_end(high, values.type), values.type))
+            condition = upper if condition is None else pc.and_kleene(condition, upper)
+        return condition
+    if value is None:
+        return None
+    if op == 'gt':
+        # After a bare date means after the whole day, as 'between' ends with it
+        return pc.greater(values, _scalar(_day_end(value, values.type), values.type))
+    return pc.less(values, _scalar(value, values.type))
+
+
+# ---------------------- Columnar Session Store ---------------------- #
+class SessionStore:
+    # Keeps each processed frame as an uncompressed Arrow IPC file. Reads
+    # memory-map the file, so slicing a page touches only the rows on it and
+    # nothing is parsed again.
+
+    def __init__(self, root=SESSION_STORE_DIR):
+        self.root = root
+        self._tables = {}
+        self._orderid_indexes = {}
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _forget(self, path):
+        # Drop the mapped table and everything derived from it
+        self._tables.pop(path, None)
+        self._orderid_indexes.pop(path, None)
+        for key in [k for k in self._queries if k[0] == path]:
+            del self._queries[key]
+
+    def _session_dir(self, session_id):
+        return os.path.join(self.root, session_id)
+
+    def _path(self, session_id, name):
+        return os.path.join(self._session_dir(session_id), f"{name}.arrow")
+
+    def write(self, session_id, name, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        path = self._path(session_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write next to the target and swap in, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        with self._lock:
+            self._forget(path)
+            os.replace(tmp_path, path)
+        return table.num_rows
+
+    def write_batches(self, session_id, name, schema, batches):
+        # Same as write() for a frame too large to hold: Arrow tables of the given
+        # schema are appended as they arrive
+        path = self._path(session_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        rows = 0
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, schema) as writer:
+                    for batch in batches:
+                        writer.write_table(batch.cast(schema))
+                        rows += batch.num_rows
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._forget(path)
+            os.replace(tmp_path, path)
+        return rows
+
+    def exists(self, session_id, name):
+        return os.path.exists(self._path(session_id, name))
+
+    def table(self, session_id, name):
+        # Memory-mapped, zero-copy view of the stored frame
+        path = self._path(session_id, name)
+        with self._lock:
+            table = self._tables.get(path)
+            if table is None:
+                source = pa.memory_map(path, 'r')
+                table = pa.ipc.open_file(source).read_all()
+                self._tables[path] = table
+        return table
+
+    def num_rows(self, session_id, name):
+        return self.table(session_id, name).num_rows
+
+    def read(self, session_id, name):
+        return self.table(session_id, name).to_pandas()
+
+    def read_slice(self, session_id, name, offset, length):
+        return self.table(session_id, name).slice(offset, length).to_pandas()
+
+    def remove(self, session_id, name):
+        # Tables already mapped from the file stay readable after it is gone
+        path = self._path(session_id, name)
+        with self._lock:
+            self._forget(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def nbytes(self, session_id):
+        session_dir = self._session_dir(session_id)
+        if not os.path.isdir(session_dir):
+            return 0
+        return sum(os.path.getsize(os.path.join(session_dir, f)) for f in os.listdir(session_dir))
+
+    def delete(self, session_id):
+        session_dir = self._session_dir(session_id)
+        with self._lock:
+            for path in [p for p in self._tables if p.startswith(session_dir + os.sep)]:
+                self._forget(path)
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    # ---------------------- Pushed-down Queries ---------------------- #
+    # sort:    [{'column': 'Amount', 'direction': 'desc'}, ...]
+    # filters: [{'column': 'Status', 'op': 'in', 'value': ['FAILED']},
+    #           {'column': 'Amount', 'op': 'between', 'value': [100, None]},
+    #           {'column': 'Date', 'op': 'between', 'value': ['2024-01-01', '2024-01-31']},
+    #           {'column': 'Amount', 'op': 'gt', 'value': 100},   (strict; 'lt' likewise)
+    #           {'column': 'OrderID', 'op': 'prefix', 'value': 'ORD12'}]
+    # columns: ['OrderID', 'Amount'] to return only those columns
+
+    def query(self, session_id, name, offset, length, sort=None, filters=None, columns=None):
+        # One page (an Arrow table) of the frame after filtering and sorting the full dataset
+        path = self._path(session_id, name)
+        table = self.table(session_id, name)
+        if columns:
+            unknown = [c for c in columns if c not in table.column_names]
+            if unknown:
+                raise QueryError(f"Unknown columns: {', '.join(unknown)}")
+            projected = table.select(columns)
+        else:
+            projected = table
+        rows = self._row_order(path, table, sort or [], filters or [])
+        if rows is None:
+            return projected.slice(offset, length), table.num_rows
+        return projected.take(pa.array(rows[offset:offset + length])), int(len(rows))
+
+    def _row_order(self, path, table, sort, filters):
+        # Row positions matching the filters in sort order; None means every row, as stored
+        if not sort and not filters:
+            return None
+        key = (path, json.dumps(sort, sort_keys=True), json.dumps(filters, sort_keys=True, default=str))
+        with self._lock:
+            rows = self._queries.get(key)
+            if rows is not None:
+                self._queries.move_to_end(key)
+                return rows
+
+        rows = self._filter(path, table, filters)
+        if sort:
+            for key_spec in sort:
+                if key_spec.get('column') not in table.column_names:
+                    raise QueryError(f"Unknown sort column: {key_spec.get('column')}")
+            sort_keys = [
+                (key_spec['column'], 'descending' if key_spec.get('direction') == 'desc' else 'ascending')
+                for key_spec in sort
+            ]
+            subset = table if rows is None else table.take(pa.array(rows))
+            keys = subset.select([c for c, _ in sort_keys])
+            # Dictionary-encoded (categorical) columns sort by their values
+            keys = pa.Table.from_arrays([
+                pc.cast(column, column.type.value_type) if pa.types.is_dictionary(column.type) else column
+                for column in keys.columns
+            ], names=keys.column_names)
+            order = pc.sort_indices(keys, sort_keys=sort_keys).to_numpy()
+            rows = order if rows is None else rows[order]
+        if rows is None:
+            rows = np.arange(table.num_rows)
+
+        with self._lock:
+            self._queries[key] = rows
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return rows
+
+    def _filter(self, path, table, filters):
+        mask = None
+        candidates = None
+        for predicate in filters:
+            column, op, value = predicate.get('column'), predicate.get('op'), predicate.get('value')
+            if column not in table.column_names:
+                raise QueryError(f"Unknown filter column: {column}")
+            values = table[column]
+            if op == 'prefix' and column == 'OrderID':
+                # Served from the sorted index instead of scanning every OrderID
+                matches = self._orderid_prefix(path, table, str(value))
+                candidates = matches if candidates is None else np.intersect1d(candidates, matches)
+                continue
+            if op not in FILTER_OPS:
+                raise QueryError(f"Unsupported filter operation: {op}")
+            try:
+                condition = _condition(values, op, value)
+            except (ValueError, TypeError, pa.ArrowException) as e:
+                # Values the client sent that do not convert to the column's type
+                raise QueryError(f"Invalid filter value for {column}: {e}") from e
+            if condition is None:
+                continue
+            condition = pc.fill_null(condition, False)
+            mask = condition if mask is None else pc.and_(mask, condition)
+
+        if mask is None:
+            return candidates
+        rows = np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+        return rows if candidates is None else np.intersect1d(rows, candidates, assume_unique=True)
+
+    def _orderid_index(self, path, table):
+        # Built once per stored frame
+        with self._lock:
+            index = self._orderid_indexes.get(path)
+        if index is None:
+            index = OrderIDIndex(table['OrderID'].to_pandas())
+            with self._lock:
+                self._orderid_indexes[path] = index
+        return index
+
+    def _orderid_prefix(self, path, table, prefix):
+        return self._orderid_index(path, table).prefix(prefix)
@@ -0,0 +1,51 @@
+# conftest.py
+
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import engine as engine_module  # noqa: E402
+from engine import ReconciliationEngine  # noqa: E402
+from store import SessionStore  # noqa: E402
+
+
+# ---------------------- Engines ---------------------- #
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # An engine whose stored frames and spill files go under the test's directory
+    monkeypatch.setattr(engine_module, 'SPILL_DIR', str(tmp_path / 'spill'))
+    return ReconciliationEngine(store=SessionStore(str(tmp_path / 'store')))
+
+
+# ---------------------- Uploads ---------------------- #
+def csv_file(df, filename='data.csv'):
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return filename, buffer
+
+
+def transactions(rows=600, seed=0, start='2024-01-01'):
+    # One side's raw export: unique OrderIDs, amounts, statuses and hourly dates
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Order ID': [f"ORD{i:05d}" for i in range(rows)],
+        'Amount': np.round(rng.random(rows) * 100, 2),
+        'Status': rng.choice(['SUCCESS', 'FAILED'], rows),
+        'Date': pd.date_range(start, periods=rows, freq='h'),
+    })
+
+
+def dashboard_of(api):
+    # The Dashboard side of api: a few rows missing, some amounts and statuses changed
+    dashboard = api.drop(index=api.index[::40]).copy()
+    dashboard.loc[dashboard.index[:15], 'Amount'] += 1
+    dashboard.loc[dashboard.index[20:30], 'Status'] = 'PENDING'
+    return dashboard
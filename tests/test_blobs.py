@@ -0,0 +1,63 @@
+# test_blobs.py
+
+import hashlib
+import os
+import time
+
+import pytest
+
+from blobs import BlobStore
+
+
+def send(store, owner, content):
+    digest = hashlib.sha256(content).hexdigest()
+    fd, tmp_path = store.temporary()
+    with os.fdopen(fd, 'wb') as target:
+        target.write(content)
+    store.add(owner, digest, tmp_path)
+    return digest
+
+
+# ---------------------- Ownership ---------------------- #
+def test_blobs_are_visible_only_to_their_owners(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest = send(store, 'alice', b'orders')
+    assert store.present('alice', [digest]) == [digest]
+    assert store.present('bob', [digest]) == []
+    with pytest.raises(KeyError):
+        store.open('bob', digest)
+    with store.open('alice', digest) as source:
+        assert source.read() == b'orders'
+
+
+def test_sending_the_content_proves_possession(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest = send(store, 'alice', b'orders')
+    assert send(store, 'bob', b'orders') == digest
+    assert store.present('bob', [digest]) == [digest]
+
+
+def test_files_of_an_earlier_process_are_removed(tmp_path):
+    digest = send(BlobStore(str(tmp_path)), 'alice', b'orders')
+    (tmp_path / 'notes.txt').write_text('kept')
+    store = BlobStore(str(tmp_path))
+    assert store.present('alice', [digest]) == []
+    assert sorted(os.listdir(tmp_path)) == ['notes.txt']
+
+
+# ---------------------- Eviction ---------------------- #
+def test_blobs_idle_past_the_ttl_are_deleted(tmp_path):
+    store = BlobStore(str(tmp_path), ttl=60)
+    digest = send(store, 'alice', b'orders')
+    store._owners[digest]['alice'] = time.time() - 61
+    store.sweep()
+    assert store.present('alice', [digest]) == []
+    assert not os.path.exists(store.path(digest))
+
+
+def test_least_recently_used_blobs_go_past_the_disk_budget(tmp_path):
+    store = BlobStore(str(tmp_path), disk_budget=10)
+    old = send(store, 'alice', b'123456')
+    store._owners[old]['alice'] -= 10
+    new = send(store, 'alice', b'abcdef')
+    assert store.present('alice', [old, new]) == [new]
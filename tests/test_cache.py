@@ -0,0 +1,85 @@
+# test_cache.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend import BackendError, LocalBackend
+from cache import CachedBackend, ResponseCache
+from conftest import csv_file, dashboard_of, transactions
+
+
+@pytest.fixture
+def browsers(engine):
+    # The owner of a processed session and a viewer of its share link, each with its own cache
+    api = transactions(rows=100)
+    local = LocalBackend(engine)
+    owner = CachedBackend(local, ResponseCache(version_interval=0))
+    viewer = CachedBackend(local, ResponseCache(version_interval=0))
+    session_id = engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard_of(api), 'dashboard.csv'))['session_id']
+    owner.process(session_id)
+    token = owner.share_session(session_id)['share_token']
+    viewer.open_share(token)
+    return owner, viewer, session_id, token
+
+
+# ---------------------- Results Version ---------------------- #
+def test_viewer_sees_results_the_owner_replaced(browsers):
+    owner, viewer, session_id, token = browsers
+    before = viewer.get_page(token, 'get_dataframe_api', 1, 500)['total_records']
+    owner.process(session_id, '2024-01-02', '2024-01-02')
+    after = viewer.get_page(token, 'get_dataframe_api', 1, 500)['total_records']
+    assert (before, after) == (100, 24)
+
+
+def test_reads_are_cached_while_the_version_holds(browsers):
+    owner, viewer, session_id, token = browsers
+    viewer.cube(token)
+    hits = viewer.cache.hits
+    viewer.cube(token)
+    assert viewer.cache.hits == hits + 1
+
+
+def test_version_is_checked_at_most_once_per_interval(engine, browsers, monkeypatch):
+    owner, viewer, session_id, token = browsers
+    viewer.cache.version_interval = 60
+    viewer.cube(token)
+    calls = []
+    monkeypatch.setattr(engine, 'results_version', lambda session_id: calls.append(session_id))
+    viewer.cube(token)
+    viewer.get_page(token, 'get_dataframe_api', 1, 10)
+    assert calls == []
+
+
+def test_own_sessions_send_no_version_checks(engine, browsers, monkeypatch):
+    owner, viewer, session_id, token = browsers
+    calls = []
+    monkeypatch.setattr(engine, 'results_version', lambda session_id: calls.append(session_id))
+    owner.cube(session_id)
+    owner.cube(session_id)
+    assert calls == [] and owner.cache.hits == 1
+
+
+def test_missing_version_endpoint_is_not_asked_again(browsers, monkeypatch):
+    owner, viewer, session_id, token = browsers
+    calls = []
+
+    def missing(session_id):
+        calls.append(session_id)
+        raise BackendError("Not Found", 404)
+    monkeypatch.setattr(viewer.backend, 'results_version', missing)
+    viewer.cache.invalidate(token)
+    for _ in range(3):
+        viewer.cube(token)
+    assert len(calls) == 1 and viewer.cache.hits == 2
+
+
+def test_parallel_reads_send_one_version_check(browsers, monkeypatch):
+    owner, viewer, session_id, token = browsers
+    viewer.cache.version_interval = 60
+    viewer.cache.invalidate(token)
+    calls = []
+    monkeypatch.setattr(viewer.backend, 'results_version', lambda session_id: calls.append(session_id) or {'version': 1})
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda page: viewer.get_page(token, 'get_dataframe_api', page, 10), range(1, 9)))
+    assert len(calls) == 1
@@ -0,0 +1,133 @@
+# test_jobs.py
+
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, FINISHED, QUEUED, RUNNING, SUCCEEDED, JobManager, JobQueueFull
+
+TIMEOUT = 5
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class Work:
+    # Jobs that record when they start and run until released
+    def __init__(self):
+        self.started = []
+        self.release = threading.Event()
+
+    def __call__(self, name):
+        def run(job):
+            self.started.append(name)
+            while not self.release.wait(0.01):
+                job.check_cancelled()
+            return name
+        return run
+
+
+@pytest.fixture
+def work():
+    work = Work()
+    yield work
+    work.release.set()
+
+
+# ---------------------- Queue Limits ---------------------- #
+def test_full_queue_is_refused_without_cancelling_the_running_job(work):
+    manager = JobManager(max_workers=1, per_user=1, queue_per_user=1)
+    running = manager.submit('s1', work('s1'), owner='alice')
+    _wait_for(lambda: running.state == RUNNING)
+    manager.submit('s2', work('s2'), owner='alice')
+    with pytest.raises(JobQueueFull):
+        manager.submit('s1', work('s1 again'), owner='alice')
+    # The refused job replaced nothing
+    assert running.state == RUNNING and not running.cancel_requested
+
+
+def test_a_sessions_waiting_job_is_replaced_even_when_the_queue_is_full(work):
+    manager = JobManager(max_workers=1, per_user=1, queue_per_user=1)
+    running = manager.submit('s1', work('s1'), owner='alice')
+    _wait_for(lambda: running.state == RUNNING)
+    waiting = manager.submit('s2', work('s2'), owner='alice')
+    replacement = manager.submit('s2', work('s2 again'), owner='alice')
+    assert waiting.state == CANCELLED
+    assert replacement.state == QUEUED
+
+
+def test_a_new_job_cancels_the_sessions_running_job(work):
+    manager = JobManager(max_workers=2, per_user=2)
+    first = manager.submit('s1', work('first'), owner='alice')
+    _wait_for(lambda: first.state == RUNNING)
+    second = manager.submit('s1', work('second'), owner='alice')
+    _wait_for(lambda: first.state == CANCELLED)
+    work.release.set()
+    _wait_for(lambda: second.state in FINISHED)
+    assert second.state == SUCCEEDED and second.result == 'second'
+
+
+# ---------------------- Fairness ---------------------- #
+def test_owners_take_turns_and_run_one_job_each(work):
+    manager = JobManager(max_workers=2, per_user=1, queue_per_user=4)
+    jobs = [manager.submit(f"a{i}", work(f"a{i}"), owner='alice') for i in range(3)]
+    jobs.append(manager.submit('b0', work('b0'), owner='bob'))
+    _wait_for(lambda: len(work.started) == 2)
+    time.sleep(0.05)
+    # Alice's later jobs wait for her first, however many she queued first
+    assert sorted(work.started) == ['a0', 'b0']
+    assert [job.queue_position for job in jobs[1:3]] == [0, 1]
+    work.release.set()
+    _wait_for(lambda: all(job.state in FINISHED for job in jobs))
+    assert work.started[2:] == ['a1', 'a2']
+
+
+def test_cancelling_a_waiting_job_takes_it_off_the_queue(work):
+    manager = JobManager(max_workers=1, per_user=1)
+    manager.submit('s1', work('s1'), owner='alice')
+    waiting = manager.submit('s2', work('s2'), owner='bob')
+    manager.cancel(waiting.id)
+    assert waiting.state == CANCELLED
+    work.release.set()
+    time.sleep(0.1)
+    assert work.started == ['s1']
+
+
+# ---------------------- Engine ---------------------- #
+def _upload(engine, owner=None, out_of_core=None):
+    from conftest import csv_file, transactions
+    api = transactions(rows=20)
+    return engine.upload_files([csv_file(api)], [csv_file(api)], owner=owner, out_of_core=out_of_core)['session_id']
+
+
+def test_engine_queues_jobs_under_the_uploading_user(engine):
+    # Every session a user uploads counts against that user's limits; a session
+    # uploaded without a user is its own owner
+    first, second, anonymous = _upload(engine, 'alice'), _upload(engine, 'alice'), _upload(engine)
+    owners = [engine.jobs.get(engine.start_process(session_id)['job_id']).owner
+              for session_id in (first, second, anonymous)]
+    assert owners == ['alice', 'alice', anonymous]
+
+
+def test_blocking_process_waits_its_turn_behind_the_users_jobs(engine, work):
+    session_id = _upload(engine, 'alice')
+    engine.jobs.submit('other', work('running'), owner='alice')
+    _wait_for(lambda: work.started == ['running'])
+    done = threading.Event()
+    threading.Thread(target=lambda: engine.process(session_id) and done.set(), daemon=True).start()
+    time.sleep(0.2)
+    assert not done.is_set()
+    work.release.set()
+    assert done.wait(TIMEOUT)
+
+
+def test_blocking_process_raises_what_its_job_raised(engine):
+    from engine import EngineError
+    session_id = _upload(engine, out_of_core=True)
+    with pytest.raises(EngineError, match="not available for out-of-core"):
+        engine.process(session_id, matching={'time_window_seconds': 60})
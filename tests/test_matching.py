@@ -0,0 +1,106 @@
+# test_matching.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import csv_file, dashboard_of, transactions
+from matching import match_sides, parse_matching
+
+
+def _upload(engine, api, dashboard, schema=None):
+    return engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard, 'dashboard.csv'), schema=schema)['session_id']
+
+
+def _uncommon(engine, session_id):
+    return engine.frame(session_id, 'uncommon_orderids')
+
+
+# ---------------------- Tolerant vs Exact ---------------------- #
+@pytest.mark.parametrize('schema', [None, {'OrderID': 'category', 'Status': 'category'}])
+def test_tolerant_rules_that_change_nothing_match_exact(engine, schema):
+    # Every OrderID is upper case already, so ignore_case pairs the same rows exact matching does
+    api = transactions()
+    dashboard = dashboard_of(api)
+    # Rows on each side only: 15 API rows (dashboard_of drops them) and 12 Dashboard rows
+    api = api.drop(index=api.index[5::50])
+    session_id = _upload(engine, api, dashboard, schema)
+    exact = engine.process(session_id)
+    tolerant = engine.process(session_id, matching={'ignore_case': True})
+    assert tolerant == exact
+    assert exact['num_uncommon_orderids'] == 27
+
+
+def test_tolerant_matching_pairs_normalized_orderids(engine):
+    api = transactions(rows=100)
+    dashboard = api.copy()
+    dashboard['Order ID'] = 'pay-' + dashboard['Order ID'].str.lower().str.replace('ORD', 'ORD-')
+    session_id = _upload(engine, api, dashboard, {'OrderID': 'category'})
+    rules = {'ignore_case': True, 'ignore_characters': '-', 'strip_prefixes': ['PAY']}
+    summary = engine.process(session_id, matching=rules)
+    assert summary['num_common_orderids'] == 100
+    assert summary['num_uncommon_orderids'] == 0
+
+
+# ---------------------- Keys That Normalize to Nothing ---------------------- #
+def test_missing_and_empty_keys_are_reported_as_uncommon(engine):
+    api = transactions(rows=50)
+    dashboard = api.copy()
+    # 'PAY-' is nothing once the prefix is stripped; the last API row has no OrderID
+    api.loc[0, 'Order ID'] = 'PAY-'
+    api.loc[49, 'Order ID'] = None
+    session_id = _upload(engine, api, dashboard)
+    summary = engine.process(session_id, matching={'strip_prefixes': ['PAY-']})
+    uncommon = _uncommon(engine, session_id)
+    assert summary['num_common_orderids'] == 48
+    assert sorted(uncommon.loc[uncommon['Source'] == 'API', 'OrderID'].fillna('<missing>')) == ['<missing>', 'PAY-']
+    assert sorted(uncommon.loc[uncommon['Source'] == 'Dashboard', 'OrderID']) == ['ORD00000', 'ORD00049']
+
+
+def test_empty_keys_are_kept_with_a_time_window(engine):
+    api = transactions(rows=20)
+    api.loc[3, 'Order ID'] = 'PAY-'
+    session_id = _upload(engine, api, transactions(rows=20))
+    engine.process(session_id, matching={'strip_prefixes': ['PAY-'], 'time_window_seconds': 60})
+    uncommon = _uncommon(engine, session_id)
+    assert list(uncommon.loc[uncommon['Source'] == 'API', 'OrderID']) == ['PAY-']
+
+
+# ---------------------- Time Window Pairing ---------------------- #
+def _side(times, orderid='ORD1'):
+    return pd.DataFrame({
+        'OrderID': pd.Series([orderid] * len(times), dtype='string'),
+        'Amount': np.arange(len(times), dtype=float),
+        'Status': pd.Series(['SUCCESS'] * len(times), dtype='string'),
+        'Date': pd.to_datetime('2024-01-01') + pd.to_timedelta(times, unit='s'),
+    })
+
+
+def test_time_window_pairs_the_next_nearest_row_when_the_nearest_is_taken():
+    # Both API rows are nearest to the Dashboard row at 3s; the one at 4s is closer and
+    # takes it, and the API row at 0s still pairs with the row at 9s, inside the window
+    api = _side([0, 4])
+    dashboard = _side([3, 9])
+    merged = match_sides(api, dashboard, parse_matching({'time_window_seconds': 10}))
+    both = merged[merged['_merge'] == 'both'].sort_values('Amount_API')
+    assert len(both) == 2
+    assert list(both['Amount_Dashboard']) == [1.0, 0.0]
+
+
+def test_time_window_leaves_rows_outside_the_window_unpaired():
+    api = _side([0, 4])
+    dashboard = _side([3, 30])
+    merged = match_sides(api, dashboard, parse_matching({'time_window_seconds': 10}))
+    assert sorted(merged['_merge']) == ['both', 'left_only', 'right_only']
+    assert merged.loc[merged['_merge'] == 'both', 'Amount_API'].tolist() == [1.0]
+
+
+def test_time_window_pairs_a_heavily_repeated_key_in_few_rounds(monkeypatch):
+    # 2000 rows per side share one key and one time; ranking them pairs all in one
+    # merge_asof round instead of one pair per round
+    calls = []
+    merge_asof = pd.merge_asof
+    monkeypatch.setattr(pd, 'merge_asof', lambda *args, **kwargs: calls.append(1) or merge_asof(*args, **kwargs))
+    merged = match_sides(_side([0] * 2000), _side([0] * 2000), parse_matching({'time_window_seconds': 10}))
+    assert (merged['_merge'] == 'both').sum() == 2000
+    assert len(calls) <= 6
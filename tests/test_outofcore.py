@@ -0,0 +1,53 @@
+# test_outofcore.py
+
+import pandas as pd
+import pytest
+
+import engine as engine_module
+from conftest import csv_file, dashboard_of, transactions
+from engine import STORED_FRAMES
+
+
+# ---------------------- Out-of-core vs In-memory ---------------------- #
+def _upload(engine, api_parts, dashboard_parts, out_of_core):
+    api_files = [csv_file(part, f"api_{i}.csv") for i, part in enumerate(api_parts)]
+    dashboard_files = [csv_file(part, f"dashboard_{i}.csv") for i, part in enumerate(dashboard_parts)]
+    return engine.upload_files(api_files, dashboard_files, out_of_core=out_of_core)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('window', [(None, None), ('2024-01-05', '2024-01-12')])
+def test_multi_file_out_of_core_matches_in_memory(engine, monkeypatch, workers, window):
+    monkeypatch.setattr(engine_module, 'partition_count', lambda estimate: 4)
+    monkeypatch.setattr(engine_module, 'worker_count', lambda partition_bytes: workers)
+    api = transactions()
+    # Two API exports overlapping by 50 rows, one Dashboard export
+    api_parts = [api.iloc[:350], api.iloc[300:]]
+    dashboard_parts = [dashboard_of(api)]
+
+    spilled = _upload(engine, api_parts, dashboard_parts, out_of_core=True)
+    in_memory = _upload(engine, api_parts, dashboard_parts, out_of_core=False)
+    assert spilled['ingest']['out_of_core']['partitions'] > 1
+    assert spilled['ingest']['api_file']['duplicates_dropped'] == 50
+    assert in_memory['ingest']['api_file']['duplicates_dropped'] == 50
+
+    summary = engine.process(spilled['session_id'], *window)
+    expected = engine.process(in_memory['session_id'], *window)
+    assert summary.pop('out_of_core')['partitions'] > 1
+    assert summary == expected
+    for name in STORED_FRAMES:
+        pd.testing.assert_frame_equal(engine.frame(spilled['session_id'], name),
+                                      engine.frame(in_memory['session_id'], name))
+
+
+def test_multi_file_out_of_core_keeps_spill_schema(engine, monkeypatch):
+    monkeypatch.setattr(engine_module, 'partition_count', lambda estimate: 4)
+    api = transactions(rows=200)
+    spilled = _upload(engine, [api.iloc[:120], api.iloc[100:]], [api], out_of_core=True)
+    spill = engine._session(spilled['session_id'])['spill']
+    for side in ('api', 'dashboard'):
+        for partition in range(spill.partitions):
+            schema = spill.read(side, partition).schema
+            assert str(schema.field('OrderID').type) == 'string'
+            assert str(schema.field('SourceFile').type) == 'string'
+            assert '_file' in schema.names
@@ -0,0 +1,94 @@
+# test_partitions.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import csv_file, dashboard_of, transactions
+from engine import DEFAULT_SCHEMA, DatePartitions, filter_by_date, normalize_columns, parse_schema, reconcile
+
+WINDOWS = [
+    (None, None),
+    ('2024-01-05', None),
+    (None, '2024-01-20'),
+    ('2024-01-10', '2024-01-16'),
+    ('2024-01-07', '2024-01-07'),
+    ('2024-02-20', '2024-03-01'),
+]
+FRAMES = ['api', 'dashboard', 'amount_differences', 'status_differences', 'uncommon_orderids']
+
+
+def messy_side(rng, rows, schema):
+    # Repeated and missing OrderIDs, missing Statuses, Dates and Amounts, whole days only
+    ids = np.array([f"O{i:04d}" for i in range(rows)])
+    df = pd.DataFrame({
+        'OrderID': rng.choice(ids, rows).astype(object),
+        'Amount': np.round(rng.random(rows) * 100, 2),
+        'Status': rng.choice(['A', 'B', 'C', None], rows),
+        'Date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 40, rows), unit='D'),
+    })
+    df.loc[rng.random(rows) < 0.03, 'Date'] = pd.NaT
+    df.loc[rng.random(rows) < 0.01, 'OrderID'] = None
+    df.loc[rng.random(rows) < 0.02, 'Amount'] = np.nan
+    return normalize_columns(df, 'side', schema)
+
+
+# ---------------------- Partitioned vs Full Reprocessing ---------------------- #
+@pytest.mark.parametrize('schema', [DEFAULT_SCHEMA, parse_schema({'OrderID': 'category', 'Status': 'category'})],
+                         ids=['default', 'categorical'])
+def test_partitions_match_a_full_recompute(schema):
+    rng = np.random.default_rng(5)
+    api, dashboard = messy_side(rng, 1200, schema), messy_side(rng, 1100, schema)
+    partitions = DatePartitions(api, dashboard)
+    for start_date, end_date in WINDOWS:
+        full = reconcile(filter_by_date(api, start_date, end_date), filter_by_date(dashboard, start_date, end_date))
+        reused = partitions.reconcile(start_date, end_date)
+        for name in FRAMES:
+            pd.testing.assert_frame_equal(reused[name], full[name], obj=f"{name} {start_date}..{end_date}")
+        assert reused['cube'] == full['cube']
+
+
+def test_engine_reprocessing_matches_a_fresh_session(engine):
+    # A window reprocessed from the partitions a full run built gives what a session
+    # processed for that window alone does
+    api = transactions(rows=600)
+    dashboard = dashboard_of(api)
+    reused = engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard, 'dashboard.csv'))['session_id']
+    engine.process(reused)
+    engine.process(reused, '2024-01-05', '2024-01-12')
+    fresh = engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard, 'dashboard.csv'))['session_id']
+    engine.process(fresh, '2024-01-05', '2024-01-12')
+    assert engine.cube(reused) == engine.cube(fresh)
+    for endpoint in engine.PAGE_ENDPOINTS:
+        reused_page, fresh_page = engine.get_page(reused, endpoint, 1, 1000), engine.get_page(fresh, endpoint, 1, 1000)
+        assert reused_page['total_records'] == fresh_page['total_records']
+        pd.testing.assert_frame_equal(reused_page['data'], fresh_page['data'], obj=endpoint)
+
+
+# ---------------------- Replacing Results ---------------------- #
+def test_reads_during_a_rerun_see_only_the_previous_frames(engine):
+    # Pages read while a rerun writes its frames all come from the previous run, then
+    # all from the new one; the run before the previous one is removed
+    api = transactions(rows=600)
+    session_id = engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard_of(api), 'dashboard.csv'))['session_id']
+    engine.process(session_id)
+    full = {endpoint: engine.get_page(session_id, endpoint, 1, 1000)['total_records']
+            for endpoint in engine.PAGE_ENDPOINTS}
+    seen = []
+    write = engine.store.write
+
+    def write_and_read(*args):
+        rows = write(*args)
+        seen.append({endpoint: engine.get_page(session_id, endpoint, 1, 1000)['total_records']
+                     for endpoint in engine.PAGE_ENDPOINTS})
+        return rows
+
+    engine.store.write = write_and_read
+    engine.process(session_id, '2024-01-05', '2024-01-12')
+    assert seen and all(pages == full for pages in seen)
+    assert engine.results_version(session_id) == {'version': 2}
+    assert engine.get_page(session_id, 'get_dataframe_api', 1, 1000)['total_records'] == 8 * 24
+    engine.store.write = write
+    engine.process(session_id)
+    assert not engine.store.exists(session_id, 'api.v1')
+    assert engine.store.exists(session_id, 'api.v2')
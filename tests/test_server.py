@@ -0,0 +1,37 @@
+# test_server.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+# ---------------------- Admin Endpoints ---------------------- #
+def test_admin_sessions_is_disabled_without_a_configured_token(monkeypatch):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', None)
+    for token in (None, '', 'anything'):
+        with pytest.raises(HTTPException) as raised:
+            server.admin_sessions(x_admin_token=token)
+        assert raised.value.status_code == 403
+
+
+def test_admin_sessions_requires_the_configured_token(monkeypatch):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', 'secret')
+    for token in (None, '', 'wrong'):
+        with pytest.raises(HTTPException) as raised:
+            server.admin_sessions(x_admin_token=token)
+        assert raised.value.status_code == 403
+    assert 'sessions' in server.admin_sessions(x_admin_token='secret')
+
+
+# ---------------------- Resumable Uploads ---------------------- #
+def test_concurrent_puts_at_one_offset_append_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'RESUMABLE_DIR', str(tmp_path))
+    upload_id = server.start_resumable(server.ResumableStart(field='api', filename='a.csv', size=6))['upload_id']
+    with ThreadPoolExecutor(8) as pool:
+        replies = list(pool.map(lambda _: server.put_resumable_chunk(upload_id, 0, b'abc'), range(8)))
+    assert replies == [{'offset': 3}] * 8
+    assert server.put_resumable_chunk(upload_id, 3, b'def') == {'offset': 6}
+    assert (tmp_path / upload_id).read_bytes() == b'abcdef'
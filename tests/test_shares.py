@@ -0,0 +1,63 @@
+# test_shares.py
+
+import pandas as pd
+import pytest
+
+from conftest import csv_file, dashboard_of, transactions
+from engine import SESSION_NOT_FOUND, SHARE_NOT_FOUND, SHARE_READ_ONLY, EngineError
+
+
+@pytest.fixture
+def shared(engine):
+    # A processed session and a share token for it
+    api = transactions(rows=100)
+    session_id = engine.upload(*csv_file(api, 'api.csv'), *csv_file(dashboard_of(api), 'dashboard.csv'))['session_id']
+    engine.process(session_id)
+    return session_id, engine.share_session(session_id)['share_token']
+
+
+# ---------------------- Read-only Share Tokens ---------------------- #
+def test_a_session_must_be_processed_to_be_shared(engine):
+    api = transactions(rows=10)
+    session_id = engine.upload(*csv_file(api), *csv_file(api))['session_id']
+    with pytest.raises(EngineError) as raised:
+        engine.share_session(session_id)
+    assert raised.value.status_code == 400
+
+
+def test_the_token_reads_the_owners_results(engine, shared):
+    session_id, token = shared
+    assert engine.share_session(session_id)['share_token'] == token
+    opened = engine.open_share(token)
+    assert opened['read_only'] and opened['session_id'] == token
+    assert engine.cube(token) == engine.cube(session_id)
+    page, expected = (engine.get_page(sid, 'get_dataframe_api', 1, 10) for sid in (token, session_id))
+    assert page['total_records'] == expected['total_records']
+    pd.testing.assert_frame_equal(page['data'], expected['data'])
+    pd.testing.assert_frame_equal(engine.frame(token, 'uncommon_orderids'),
+                                  engine.frame(session_id, 'uncommon_orderids'))
+
+
+@pytest.mark.parametrize('call', [
+    lambda engine, token: engine.process(token),
+    lambda engine, token: engine.start_process(token),
+    lambda engine, token: engine.share_session(token),
+    lambda engine, token: engine.end_session(token),
+])
+def test_the_token_cannot_change_the_session(engine, shared, call):
+    session_id, token = shared
+    with pytest.raises(EngineError) as raised:
+        call(engine, token)
+    assert (raised.value.status_code, raised.value.detail) == (403, SHARE_READ_ONLY)
+    assert engine.cube(session_id)
+
+
+def test_the_token_ends_with_the_session(engine, shared):
+    session_id, token = shared
+    engine.end_session(session_id)
+    with pytest.raises(EngineError) as raised:
+        engine.open_share(token)
+    assert (raised.value.status_code, raised.value.detail) == (404, SHARE_NOT_FOUND)
+    with pytest.raises(EngineError) as raised:
+        engine.cube(token)
+    assert (raised.value.status_code, raised.value.detail) == (404, SESSION_NOT_FOUND)
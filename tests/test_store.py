@@ -0,0 +1,64 @@
+# test_store.py
+
+import pandas as pd
+import pytest
+
+from store import QueryError, SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    # One stored frame with amounts 10..50, a row every six hours and date-like OrderIDs
+    store = SessionStore(str(tmp_path))
+    store.write('s', 'frame', pd.DataFrame({
+        'OrderID': ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05'],
+        'Amount': [10.0, 20.0, 30.0, 40.0, 50.0],
+        'Date': pd.date_range('2024-01-01', periods=5, freq='6h'),
+    }))
+    return store
+
+
+def amounts(store, *filters):
+    table, _ = store.query('s', 'frame', 0, 100, filters=list(filters))
+    return table['Amount'].to_pylist()
+
+
+# ---------------------- Filters at Their Bounds ---------------------- #
+def test_between_includes_both_bounds(store):
+    assert amounts(store, {'column': 'Amount', 'op': 'between', 'value': [20, 40]}) == [20.0, 30.0, 40.0]
+
+
+def test_gt_and_lt_exclude_the_bound(store):
+    assert amounts(store, {'column': 'Amount', 'op': 'gt', 'value': 20}) == [30.0, 40.0, 50.0]
+    assert amounts(store, {'column': 'Amount', 'op': 'lt', 'value': 20}) == [10.0]
+
+
+def test_open_bounds_are_ignored(store):
+    assert len(amounts(store, {'column': 'Amount', 'op': 'between', 'value': [None, None]},
+                       {'column': 'Amount', 'op': 'gt', 'value': None})) == 5
+
+
+def test_bare_date_covers_the_whole_day_on_timestamps(store):
+    # Rows at 00:00, 06:00, 12:00 and 18:00 on Jan 1, then 00:00 on Jan 2
+    assert amounts(store, {'column': 'Date', 'op': 'between', 'value': ['2024-01-01', '2024-01-01']}) == [
+        10.0, 20.0, 30.0, 40.0]
+    assert amounts(store, {'column': 'Date', 'op': 'gt', 'value': '2024-01-01'}) == [50.0]
+    assert amounts(store, {'column': 'Date', 'op': 'lt', 'value': '2024-01-02'}) == [10.0, 20.0, 30.0, 40.0]
+
+
+def test_bare_date_bound_on_strings_is_compared_as_is(store):
+    assert amounts(store, {'column': 'OrderID', 'op': 'between', 'value': [None, '2024-01-02']}) == [10.0, 20.0]
+    assert amounts(store, {'column': 'OrderID', 'op': 'gt', 'value': '2024-01-04'}) == [50.0]
+
+
+# ---------------------- Invalid Filters ---------------------- #
+@pytest.mark.parametrize('predicate', [
+    {'column': 'Amount', 'op': 'gt', 'value': 'abc'},
+    {'column': 'Date', 'op': 'in', 'value': ['05/01/2024']},
+    {'column': 'Date', 'op': 'between', 'value': ['garbage', None]},
+    {'column': 'Amount', 'op': 'between', 'value': 5},
+    {'column': 'Amount', 'op': 'notEqual', 'value': 5},
+])
+def test_bad_filters_are_query_errors(store, predicate):
+    with pytest.raises(QueryError):
+        amounts(store, predicate)
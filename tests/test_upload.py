@@ -0,0 +1,62 @@
+# test_upload.py
+
+import io
+
+import pytest
+
+import upload
+from backend import create_http_session
+from upload import UploadProgress, UploadStalled, _send_file
+
+
+class StuckBackend:
+    # Answers the resumable endpoints but never keeps a byte past held
+    def __init__(self, held=0):
+        self.held = held
+        self.puts = 0
+
+    def get(self, url, timeout=None):
+        return Reply({'offset': self.held})
+
+    def put(self, url, params=None, data=None, headers=None, timeout=None):
+        self.puts += 1
+        return Reply({'offset': self.held})
+
+
+class Reply:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+# ---------------------- Resumable Upload ---------------------- #
+def test_send_gives_up_when_the_offset_never_advances(monkeypatch):
+    monkeypatch.setattr(upload, 'RESUME_BACKOFF', 0)
+    backend = StuckBackend(held=4)
+    progress = UploadProgress('api_file', 'api.csv', 10)
+    with pytest.raises(UploadStalled):
+        _send_file(backend, 'http://backend', 'id', io.BytesIO(b'0123456789'), progress, 3, None)
+    # One chunk per pass: the first reply shows the backend kept nothing
+    assert backend.puts == upload.MAX_RESUMES + 1
+    assert progress.bytes_sent == 4
+
+
+def test_send_gives_up_when_the_file_is_shorter_than_announced(monkeypatch):
+    monkeypatch.setattr(upload, 'RESUME_BACKOFF', 0)
+    backend = StuckBackend(held=10)
+    with pytest.raises(UploadStalled):
+        _send_file(backend, 'http://backend', 'id', io.BytesIO(b'0123456789'),
+                   UploadProgress('api_file', 'api.csv', 12), 3, None)
+    assert backend.puts == 0
+
+
+# ---------------------- Retries ---------------------- #
+def test_streamed_puts_are_not_replayed_by_the_session():
+    retry = create_http_session().get_adapter('http://backend').max_retries
+    assert not retry.is_retry('PUT', 503)
+    assert retry.is_retry('GET', 503)
@@ -0,0 +1,78 @@
+# transport.py
+
+import json
+
+import pandas as pd
+import pyarrow as pa
+
+# ---------------------- Content Types ---------------------- #
+
+# Binary page format; JSON records stay available as a fallback
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+JSON = 'application/json'
+
+# What the client asks for: Arrow first, JSON for backends that do not speak it
+ACCEPT_TABLES = f"{ARROW_STREAM}, {JSON};q=0.9"
+
+# Response headers carrying what the JSON body would have had next to 'data'
+TOTAL_RECORDS_HEADER = 'X-Total-Records'
+
+# Request header naming the user a request is made for (see backend.identify)
+CLIENT_ID_HEADER = 'X-Client-Id'
+
+# Column that tells the two sides apart in a combined search result
+SIDE_COLUMN = '_side'
+
+
+def wants_arrow(accept_header):
+    return ARROW_STREAM in (accept_header or '')
+
+
+def is_arrow(response):
+    return response.headers.get('Content-Type', '').startswith(ARROW_STREAM)
+
+
+# ---------------------- Encoding ---------------------- #
+def encode_table(table):
+    # Arrow IPC stream with the schema up front, so dtypes survive the trip
+    if isinstance(table, pd.DataFrame):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def decode_frame(payload):
+    # Reads straight from the response buffer; numeric columns are not copied
+    table = pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    return table.to_pandas()
+
+
+def encode_search(api_matches, dashboard_matches, not_found=None):
+    # Both sides in one stream, tagged with SIDE_COLUMN; each side's own columns
+    # are listed in the schema metadata so the client can split them apart again.
+    # A batch search also lists the OrderIDs found on neither side there.
+    tables = []
+    metadata = {} if not_found is None else {'not_found': json.dumps(not_found)}
+    for side, df in (('api', api_matches), ('dashboard', dashboard_matches)):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata[f"{side}_columns"] = json.dumps(table.column_names)
+        tables.append(table.append_column(SIDE_COLUMN, pa.array([side] * table.num_rows, pa.string())))
+    # Permissive so the sides may differ in type details (e.g. timestamp units per file format)
+    combined = pa.concat_tables(tables, promote_options='permissive')
+    return encode_table(combined.replace_schema_metadata(metadata))
+
+
+def decode_search(payload):
+    table = pa.ipc.open_stream(pa.py_buffer(payload)).read_all()
+    metadata = table.schema.metadata or {}
+    combined = table.to_pandas()
+    results = {}
+    for side in ('api', 'dashboard'):
+        columns = json.loads(metadata.get(f"{side}_columns".encode(), b'[]'))
+        df = combined[combined[SIDE_COLUMN] == side]
+        results[f"{side}_matches"] = df[columns].reset_index(drop=True)
+    if b'not_found' in metadata:
+        results['not_found'] = json.loads(metadata[b'not_found'])
+    return results
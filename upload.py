@@ -0,0 +1,447 @@
+# upload.py
+
+import hashlib
+import os
+import time
+import uuid
+import zlib
+
+import requests
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ---------------------- Configuration ---------------------- #
+
+# Size of each chunk read from the uploaded buffer and sent to the backend
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# How many times a dropped connection, or a pass the backend acknowledged no new bytes
+# of, is resumed before giving up
+MAX_RESUMES = 5
+
+# Seconds to wait between resume attempts (multiplied by the attempt number)
+RESUME_BACKOFF = 1.0
+
+# Formats worth compressing; xlsx/xlsb are already zip containers
+COMPRESSIBLE_EXTENSIONS = ('.csv', '.xls')
+
+# Compression levels: fast enough to keep ahead of the network
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+
+# ---------------------- Progress Tracking ---------------------- #
+class UploadProgress:
+    # Tracks bytes sent and throughput for a single file
+
+    def __init__(self, field, name, total_bytes, callback=None):
+        self.field = field
+        self.name = name
+        self.total_bytes = total_bytes
+        self.bytes_sent = 0
+        self.started_at = time.perf_counter()
+        self.callback = callback
+
+    def advance(self, num_bytes):
+        self.bytes_sent += num_bytes
+        if self.callback:
+            self.callback(self)
+
+    def reset_to(self, offset):
+        self.bytes_sent = offset
+        if self.callback:
+            self.callback(self)
+
+    @property
+    def fraction(self):
+        if not self.total_bytes:
+            return 1.0
+        return min(self.bytes_sent / self.total_bytes, 1.0)
+
+    @property
+    def throughput(self):
+        # Bytes per second since the upload started
+        elapsed = time.perf_counter() - self.started_at
+        return self.bytes_sent / elapsed if elapsed > 0 else 0.0
+
+
+def file_size(file_obj):
+    # Streamlit's UploadedFile exposes .size; fall back to seeking for other buffers
+    size = getattr(file_obj, 'size', None)
+    if size is not None:
+        return size
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(position)
+    return size
+
+
+def file_entries(files):
+    # files: {field_name: (filename, file_obj)}, or {field_name: [(filename, file_obj), ...]}
+    # to send several files for one field. Returns [(field_name, filename, file_obj)] in order.
+    entries = []
+    for field, value in files.items():
+        for filename, file_obj in (value if isinstance(value, list) else [value]):
+            entries.append((field, filename, file_obj))
+    return entries
+
+
+def _field_values(files, values):
+    # values (one per file_entries(files) item) grouped back by field: a single value
+    # (as backends without multi-file sessions expect), or a list for several files
+    grouped = {}
+    for (field, _, _), value in zip(file_entries(files), values):
+        grouped.setdefault(field, []).append(value)
+    return {field: value if len(value) > 1 else value[0] for field, value in grouped.items()}
+
+
+def iter_chunks(file_obj, start=0, chunk_size=CHUNK_SIZE):
+    # Read the buffer in fixed-size chunks without copying the whole file
+    file_obj.seek(start)
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+# ---------------------- Streaming Multipart Body ---------------------- #
+class MultipartStream:
+    # File-like multipart/form-data body that reads each file lazily.
+    # requests sends it with a Content-Length taken from __len__, so the
+    # whole body is never materialized in memory.
+
+    def __init__(self, fields, progress=None, chunk_size=CHUNK_SIZE):
+        # fields: as file_entries() takes them; a field with several files is repeated.
+        # progress: one UploadProgress per file, in file_entries() order
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts = []
+        self._length = 0
+        for field_name, filename, file_obj in file_entries(fields):
+            header = (
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'
+            ).encode('utf-8')
+            size = file_size(file_obj)
+            self._parts.append((header, file_obj))
+            self._length += len(header) + size + 2
+        self._footer = f'--{self.boundary}--\r\n'.encode('utf-8')
+        self._length += len(self._footer)
+        self.progress = progress or [None] * len(self._parts)
+        self._iterator = self._generate()
+        self._buffer = b''
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def _generate(self):
+        for (header, file_obj), progress in zip(self._parts, self.progress):
+            yield header
+            for chunk in iter_chunks(file_obj, chunk_size=self.chunk_size):
+                yield chunk
+                if progress is not None:
+                    progress.advance(len(chunk))
+            yield b'\r\n'
+        yield self._footer
+
+    def read(self, size=-1):
+        # Serve exactly what the transport asks for, pulling chunks on demand
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._iterator)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def stream_upload(base_url, files, on_progress=None, timeout=None, http=None, params=None):
+    # Single request upload to /upload with a streamed multipart body.
+    # files: as file_entries() takes them; params go in the query string
+    http = http or requests
+    progress = [UploadProgress(field, filename, file_size(file_obj), on_progress)
+                for field, filename, file_obj in file_entries(files)]
+    body = MultipartStream(files, progress=progress)
+    response = http.post(
+        f"{base_url}/upload",
+        params=params,
+        data=body,
+        headers={'Content-Type': body.content_type},
+        timeout=timeout,
+    )
+    return response, progress
+
+
+# ---------------------- Resumable Chunked Upload ---------------------- #
+class ResumableNotSupported(Exception):
+    # Raised when the backend does not expose the resumable upload endpoints
+    pass
+
+
+class UploadStalled(Exception):
+    # Raised when the backend keeps acknowledging no new bytes of a file
+    pass
+
+
+def _start_resumable(http, base_url, field, filename, size, chunk_size, timeout):
+    response = http.post(
+        f"{base_url}/upload/resumable",
+        json={'field': field, 'filename': filename, 'size': size, 'chunk_size': chunk_size},
+        timeout=timeout,
+    )
+    if response.status_code in (404, 405):
+        raise ResumableNotSupported()
+    response.raise_for_status()
+    return response.json()['upload_id']
+
+
+def _acknowledged_offset(http, base_url, upload_id, timeout):
+    response = http.get(f"{base_url}/upload/resumable/{upload_id}", timeout=timeout)
+    response.raise_for_status()
+    return response.json().get('offset', 0)
+
+
+def _send_file(http, base_url, upload_id, file_obj, progress, chunk_size, timeout):
+    # Send chunks from the last acknowledged offset, resuming after dropped connections
+    offset = _acknowledged_offset(http, base_url, upload_id, timeout)
+    progress.reset_to(offset)
+    attempt = 0
+    while offset < progress.total_bytes:
+        start = offset
+        try:
+            for chunk in iter_chunks(file_obj, start=offset, chunk_size=chunk_size):
+                response = http.put(
+                    f"{base_url}/upload/resumable/{upload_id}",
+                    params={'offset': offset},
+                    data=chunk,
+                    headers={'Content-Type': 'application/octet-stream'},
+                    timeout=timeout,
+                )
+                response.raise_for_status()
+                expected = offset + len(chunk)
+                offset = response.json().get('offset', expected)
+                progress.reset_to(offset)
+                if offset != expected:
+                    # The backend holds a different amount; carry on from there
+                    break
+        except (requests.ConnectionError, requests.Timeout):
+            attempt += 1
+            if attempt > MAX_RESUMES:
+                raise
+            time.sleep(RESUME_BACKOFF * attempt)
+            offset = _acknowledged_offset(http, base_url, upload_id, timeout)
+            progress.reset_to(offset)
+            continue
+        if offset <= start:
+            # Nothing new was kept (or the file ran out before its size); retrying
+            # forever would never finish
+            attempt += 1
+            if attempt > MAX_RESUMES:
+                raise UploadStalled(f"The backend stopped accepting {progress.name} at byte {offset:,} "
+                                    f"of {progress.total_bytes:,}")
+            time.sleep(RESUME_BACKOFF * attempt)
+
+
+def resumable_upload(base_url, files, on_progress=None, upload_ids=None, timeout=None,
+                     chunk_size=CHUNK_SIZE, http=None, params=None):
+    # Chunked upload that survives dropped connections.
+    # upload_ids is an optional dict that keeps upload IDs across reruns so a
+    # second click on "Upload Files" resumes instead of starting over.
+    http = http or requests
+    upload_ids = upload_ids if upload_ids is not None else {}
+    progress = []
+    keys = []
+    for field, filename, file_obj in file_entries(files):
+        size = file_size(file_obj)
+        progress.append(UploadProgress(field, filename, size, on_progress))
+        key = f"{field}:{filename}:{size}"
+        if key not in upload_ids:
+            upload_ids[key] = _start_resumable(http, base_url, field, filename, size, chunk_size, timeout)
+        _send_file(http, base_url, upload_ids[key], file_obj, progress[-1], chunk_size, timeout)
+        keys.append(key)
+
+    response = http.post(
+        f"{base_url}/upload/resumable/complete",
+        params=params,
+        json=_field_values(files, [upload_ids[key] for key in keys]),
+        timeout=timeout,
+    )
+    if response.status_code == 200:
+        upload_ids.clear()
+    return response, progress
+
+
+# ---------------------- Compressed, Deduplicated Upload ---------------------- #
+# Files are addressed by their SHA-256. The backend is asked which hashes it
+# already holds; only the others are sent (PUT /blobs/{hash}), compressed with
+# zstd or gzip, and the session is then created from hashes alone.
+
+class BlobsNotSupported(Exception):
+    # Raised when the backend does not expose the blob endpoints
+    pass
+
+
+def content_hash(file_obj):
+    digest = hashlib.sha256()
+    for chunk in iter_chunks(file_obj):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def content_encoding(filename):
+    # zstd when the zstandard package is installed, gzip otherwise, nothing for zip containers
+    if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return 'identity'
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def compressed_chunks(file_obj, encoding, progress=None, counter=None, chunk_size=CHUNK_SIZE):
+    # Compress while reading; progress counts raw bytes, counter['sent'] compressed ones
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    else:
+        compressor = None
+    for chunk in iter_chunks(file_obj, chunk_size=chunk_size):
+        data = compressor.compress(chunk) if compressor else chunk
+        if progress is not None:
+            progress.advance(len(chunk))
+        if data:
+            if counter is not None:
+                counter['sent'] += len(data)
+            yield data
+    if compressor:
+        data = compressor.flush()
+        if counter is not None:
+            counter['sent'] += len(data)
+        yield data
+
+
+def _present_blobs(http, base_url, hashes, timeout):
+    response = http.post(f"{base_url}/blobs/exists", json={'hashes': hashes}, timeout=timeout)
+    if response.status_code in (404, 405):
+        raise BlobsNotSupported()
+    response.raise_for_status()
+    return set(response.json().get('present', []))
+
+
+def blob_upload(base_url, files, on_progress=None, timeout=None, http=None, params=None):
+    # Returns (response, transfer) where transfer reports what was actually sent
+    http = http or requests
+    started = time.perf_counter()
+    entries = file_entries(files)
+    blobs = []
+    for field, filename, file_obj in entries:
+        blobs.append({
+            'field': field,
+            'name': filename,
+            'hash': content_hash(file_obj),
+            'encoding': content_encoding(filename),
+            'bytes_original': file_size(file_obj),
+            'bytes_sent': 0,
+            'deduplicated': False,
+        })
+    present = _present_blobs(http, base_url, sorted({blob['hash'] for blob in blobs}), timeout)
+    send_seconds = 0.0
+
+    for (field, filename, file_obj), blob in zip(entries, blobs):
+        progress = UploadProgress(field, filename, blob['bytes_original'], on_progress)
+        if blob['hash'] in present:
+            blob['deduplicated'] = True
+            progress.reset_to(blob['bytes_original'])
+            continue
+        counter = {'sent': 0}
+        headers = {'Content-Type': 'application/octet-stream'}
+        if blob['encoding'] != 'identity':
+            headers['Content-Encoding'] = blob['encoding']
+        sending = time.perf_counter()
+        response = http.put(
+            f"{base_url}/blobs/{blob['hash']}",
+            data=compressed_chunks(file_obj, blob['encoding'], progress, counter),
+            headers=headers,
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        send_seconds += time.perf_counter() - sending
+        blob['bytes_sent'] = counter['sent']
+        # The same file on both sides (or twice on one side) goes up once
+        present.add(blob['hash'])
+
+    response = http.post(
+        f"{base_url}/upload/blobs",
+        params=params,
+        json=_field_values(files, [{'hash': blob['hash'], 'filename': blob['name']} for blob in blobs]),
+        timeout=timeout,
+    )
+    return response, {
+        'bytes_original': sum(blob['bytes_original'] for blob in blobs),
+        'bytes_sent': sum(blob['bytes_sent'] for blob in blobs),
+        'seconds': round(time.perf_counter() - started, 3),
+        'send_seconds': round(send_seconds, 3),
+        'files': blobs,
+    }
+
+
+def decompressor(encoding):
+    # Streaming decoder for a Content-Encoding sent by blob_upload
+    if encoding == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd bodies need the zstandard package")
+        return zstandard.ZstdDecompressor().decompressobj()
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding in ('', 'identity'):
+        return None
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def _plain_transfer(progress, started):
+    total = sum(p.total_bytes for p in progress)
+    seconds = round(time.perf_counter() - started, 3)
+    return {'bytes_original': total, 'bytes_sent': total, 'seconds': seconds, 'send_seconds': seconds, 'files': []}
+
+
+def upload_files(base_url, files, on_progress=None, upload_ids=None, timeout=None, http=None, params=None):
+    # Prefer compressed, deduplicated blobs, then the resumable protocol, then a
+    # single streamed request. Returns (response, transfer stats).
+    try:
+        return blob_upload(base_url, files, on_progress=on_progress, timeout=timeout, http=http, params=params)
+    except BlobsNotSupported:
+        pass
+    started = time.perf_counter()
+    try:
+        response, progress = resumable_upload(base_url, files, on_progress=on_progress, upload_ids=upload_ids,
+                                              timeout=timeout, http=http, params=params)
+    except ResumableNotSupported:
+        response, progress = stream_upload(base_url, files, on_progress=on_progress, timeout=timeout,
+                                           http=http, params=params)
+    return response, _plain_transfer(progress, started)
+
+
+def format_bytes(num_bytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num_bytes < 1024 or unit == 'GB':
+            return f"{num_bytes:,.1f} {unit}"
+        num_bytes /= 1024
+
+
+def format_throughput(bytes_per_second):
+    for unit in ('B/s', 'KB/s', 'MB/s', 'GB/s'):
+        if bytes_per_second < 1024 or unit == 'GB/s':
+            return f"{bytes_per_second:,.1f} {unit}"
+        bytes_per_second /= 1024